@@ -17,21 +17,34 @@
 import sys
 import os
 
-from charmhelpers.core.hookenv import action_fail
+from charmhelpers.core.hookenv import (
+    action_fail,
+    action_get,
+    action_set,
+)
+
+from charmhelpers.contrib.hahelpers.cluster import is_elected_leader
 
 from hooks.keystone_utils import (
+    CLUSTER_RES,
+    benchmark_credentials,
+    benchmark_endpoints,
+    get_api_version,
     pause_unit_helper,
     resume_unit_helper,
     register_configs,
 )
 
+from hooks import keystone_benchmark
+from hooks import keystone_catalog
+
 
 def pause(args):
     """Pause all the Keystone services.
 
     @raises Exception if any services fail to stop
     """
-    pause_unit_helper(register_configs())
+    action_set(pause_unit_helper(register_configs()))
 
 
 def resume(args):
@@ -39,12 +52,75 @@ def resume(args):
 
     @raises Exception if any services fail to start
     """
-    resume_unit_helper(register_configs())
+    action_set(resume_unit_helper(register_configs()))
+
+
+def benchmark(args):
+    """Measure token issue and catalog read latency of keystone.
+
+    @raises Exception if no credentials or endpoints are available
+    """
+    credentials = benchmark_credentials()
+    if not credentials:
+        raise Exception("Admin password is not available on this unit")
+    endpoints = benchmark_endpoints(action_get('target'))
+    if not endpoints:
+        raise Exception("No endpoints to benchmark for target {}"
+                        "".format(action_get('target')))
+    api_version = get_api_version()
+    for index, endpoint in enumerate(endpoints):
+        result = keystone_benchmark.benchmark(
+            endpoint, credentials, api_version, action_get('count'))
+        results = {
+            'endpoint': endpoint,
+            'requests': result['requests'],
+            'errors': result['errors'],
+            'requests-per-second': '{:.1f}'.format(result['rps']),
+        }
+        for op in ('token', 'catalog'):
+            for pct, value in result[op].items():
+                if value is not None:
+                    results['{}-{}-ms'.format(op, pct)] = '{:.1f}'.format(
+                        value)
+        # action-set takes flat dotted keys, one per result value.
+        action_set(dict(('endpoint-{}.{}'.format(index, key), value)
+                        for key, value in results.items()))
+
+
+def export_catalog(args):
+    """Dump the keystone catalog to a json or yaml snapshot."""
+    fmt = action_get('format')
+    text = keystone_catalog.dump_snapshot(keystone_catalog.export_catalog(),
+                                          fmt)
+    path = action_get('path')
+    if path:
+        with open(path, 'w') as f:
+            f.write(text)
+        action_set({'path': path})
+    else:
+        action_set({'snapshot': text})
+
+
+def import_catalog(args):
+    """Create the resources in a catalog snapshot that keystone is missing.
+
+    @raises Exception if not run on the leader
+    """
+    if not is_elected_leader(CLUSTER_RES):
+        raise Exception("import-catalog must be run on the leader unit")
+    with open(action_get('path')) as f:
+        snapshot = keystone_catalog.load_snapshot(f.read())
+    operations = keystone_catalog.import_catalog(
+        snapshot, dry_run=action_get('dry-run'))
+    action_set({'operations': len(operations),
+                'plan': '\n'.join(operations) or 'up to date'})
 
 
 # A dictionary of all the defined actions to callables (which take
 # parsed arguments).
-ACTIONS = {"pause": pause, "resume": resume}
+ACTIONS = {"pause": pause, "resume": resume, "benchmark": benchmark,
+           "export-catalog": export_catalog,
+           "import-catalog": import_catalog}
 
 
 def main(args):
@@ -14,16 +14,23 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import os
+import subprocess
 import sys
 
 sys.path.append('hooks/')
 
 from charmhelpers.contrib.openstack.utils import (
     do_action_openstack_upgrade,
+    openstack_upgrade_available,
+)
+
+from charmhelpers.core.hookenv import (
+    action_set,
+    config,
 )
 
 from keystone_utils import (
+    MaintenanceWindow,
     do_openstack_upgrade,
     register_configs,
 )
@@ -38,12 +45,34 @@ def openstack_upgrade():
     If the charm was installed from source we cannot upgrade it.
     For backwards compatibility a config flag (action-managed-upgrade) must
     be set for this code to run, otherwise a full service level upgrade will
-    fire on config-changed."""
+    fire on config-changed.
 
-    if (do_action_openstack_upgrade('keystone',
+    The unit is drained from the local haproxy for the duration of the
+    upgrade and the time it was out of that haproxy's rotation is reported
+    in the action results. The unit is left in service if no upgrade will
+    run.
+    """
+    if not (openstack_upgrade_available('keystone') and
+            config('action-managed-upgrade')):
+        # Only reports why the upgrade was skipped.
+        do_action_openstack_upgrade('keystone',
                                     do_openstack_upgrade,
-                                    register_configs())):
-        os.execl('./hooks/config-changed-postupgrade', '')
+                                    register_configs())
+        return
+
+    window = MaintenanceWindow()
+    window.drain()
+    try:
+        if (do_action_openstack_upgrade('keystone',
+                                        do_openstack_upgrade,
+                                        register_configs())):
+            # Run as a child rather than exec'ing it so that the window
+            # is still restored and reported once it has finished.
+            subprocess.check_call(['./hooks/config-changed-postupgrade'])
+    finally:
+        window.restore()
+        action_set(window.results)
+
 
 if __name__ == '__main__':
     openstack_upgrade()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+#
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Stub juju hook tools backed by a JSON state file.
+
+write_tools() puts a wrapper script for every tool in JUJU_TOOLS and
+HOST_TOOLS into a directory which the harness places first on PATH. Each
+wrapper runs this module with the tool name as its first argument, so hooks
+pay for a real process per tool invocation just as they do under juju.
+
+State layout::
+
+    {"unit": "keystone/0", "address": "10.5.0.10", "leader": true,
+     "config": {...}, "leader-settings": {...},
+     "relations": {"identity-service:3": {
+         "name": "identity-service",
+         "local": {...},
+         "units": {"nova/0": {...}}}}}
+"""
+
+import fcntl
+import json
+import os
+import stat
+import sys
+
+STATE_ENV = 'FAKE_JUJU_STATE'
+
+JUJU_TOOLS = (
+    'application-version-set',
+    'close-port',
+    'config-get',
+    'is-leader',
+    'juju-log',
+    'leader-get',
+    'leader-set',
+    'network-get',
+    'open-port',
+    'opened-ports',
+    'relation-get',
+    'relation-ids',
+    'relation-list',
+    'relation-set',
+    'status-get',
+    'status-set',
+    'unit-get',
+)
+
+# Host commands the hooks run directly, with the exit code and output the
+# stub gives.
+HOST_TOOLS = {
+    'a2dismod': (0, ''),
+    'a2dissite': (0, ''),
+    'a2enmod': (0, ''),
+    'a2ensite': (0, ''),
+    'nc': (0, ''),
+    'pgrep': (1, ''),
+    'pwgen': (0, 'benchmarkpassword\n'),
+    'update-ca-certificates': (0, ''),
+}
+
+WRAPPER = """#!/bin/sh
+exec {python} {module} {tool} "$@"
+"""
+
+
+def write_tools(bindir):
+    """Write a wrapper script for every stub tool into bindir."""
+    module = os.path.abspath(__file__).replace('.pyc', '.py')
+    for tool in JUJU_TOOLS + tuple(HOST_TOOLS):
+        path = os.path.join(bindir, tool)
+        with open(path, 'w') as f:
+            f.write(WRAPPER.format(python=sys.executable, module=module,
+                                   tool=tool))
+        os.chmod(path, stat.S_IRWXU)
+
+
+def load_state(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(path, state):
+    with open(path, 'w') as f:
+        json.dump(state, f)
+
+
+def _options(args, flags=('-r', '--file', '--format')):
+    """Split args into a dict of the given flags and the positional rest.
+
+    Both '--flag value' and '--flag=value' are accepted.
+    """
+    opts = {}
+    rest = []
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        name, _, value = arg.partition('=')
+        if name in flags and value:
+            opts[name] = value
+        elif arg in flags and args:
+            opts[arg] = args.pop(0)
+        else:
+            rest.append(arg)
+    return opts, rest
+
+
+def _relation(state, opts):
+    """Return the relation named by -r or the hook context, or None."""
+    rid = opts.get('-r') or os.environ.get('JUJU_RELATION_ID')
+    return state['relations'].get(rid)
+
+
+def _settings_args(args):
+    settings = {}
+    for arg in args:
+        key, _, value = arg.partition('=')
+        settings[key] = value
+    return settings
+
+
+def _apply(settings, changes):
+    for key, value in changes.items():
+        if value in (None, ''):
+            settings.pop(key, None)
+        else:
+            settings[key] = str(value)
+
+
+def run(tool, args, state):
+    """Run tool against state.
+
+    :returns: (exit code, output, changed) where changed tells whether the
+              state needs saving.
+    """
+    opts, args = _options(args)
+    if tool in HOST_TOOLS:
+        code, output = HOST_TOOLS[tool]
+        return code, output, False
+
+    if tool == 'config-get':
+        keys = [a for a in args if a != '--all']
+        value = state['config'].get(keys[0]) if keys else state['config']
+        return 0, json.dumps(value), False
+    if tool == 'is-leader':
+        return 0, json.dumps(state['leader']), False
+    if tool == 'unit-get':
+        address = state['address']
+        return 0, json.dumps(address) if opts else address, False
+    if tool == 'network-get':
+        if '--primary-address' in args:
+            return 0, state['address'], False
+        return 0, json.dumps({
+            'bind-addresses': [{'addresses': [
+                {'address': state['address'], 'cidr': state['cidr']}]}],
+            'ingress-addresses': [state['address']]}), False
+
+    if tool == 'leader-get':
+        settings = state['leader-settings']
+        key = args[0] if args else '-'
+        value = settings if key == '-' else settings.get(key)
+        return 0, json.dumps(value), False
+    if tool == 'leader-set':
+        if not state['leader']:
+            return 1, 'cannot write leadership settings: not the leader', \
+                False
+        _apply(state['leader-settings'], _settings_args(args))
+        return 0, '', True
+
+    if tool == 'relation-ids':
+        name = args[0] if args else os.environ.get('JUJU_RELATION')
+        rids = [rid for rid, rel in state['relations'].items()
+                if rel['name'] == name]
+        rids.sort(key=lambda rid: int(rid.split(':')[1]))
+        return 0, json.dumps(rids), False
+    if tool in ('relation-list', 'relation-get', 'relation-set') and \
+            '--help' not in args and _relation(state, opts) is None:
+        return 2, 'no relation id specified', False
+    if tool == 'relation-list':
+        return 0, json.dumps(sorted(_relation(state, opts)['units'])), False
+    if tool == 'relation-get':
+        relation = _relation(state, opts)
+        key = args[0] if args else '-'
+        unit = args[1] if len(args) > 1 else \
+            os.environ.get('JUJU_REMOTE_UNIT')
+        if unit == state['unit']:
+            settings = relation['local']
+        else:
+            settings = relation['units'].get(unit, {})
+        value = settings if key == '-' else settings.get(key)
+        return 0, json.dumps(value), False
+    if tool == 'relation-set':
+        if '--help' in args:
+            return 0, 'usage: relation-set [options] key=value ...\n' \
+                      '    --file  file containing key-value pairs\n', False
+        changes = _settings_args(args)
+        if '--file' in opts:
+            import yaml
+            with open(opts['--file']) as f:
+                changes.update(yaml.safe_load(f) or {})
+        _apply(_relation(state, opts)['local'], changes)
+        return 0, '', True
+
+    if tool == 'status-set':
+        state['status'] = {'status': args[0],
+                           'message': ' '.join(args[1:])}
+        return 0, '', True
+    if tool == 'status-get':
+        status = state.get('status', {'status': 'unknown', 'message': ''})
+        if '--include-data' in args:
+            return 0, json.dumps(status), False
+        return 0, json.dumps(status['status']), False
+
+    # juju-log, open-port and friends only need to exist.
+    return 0, '', False
+
+
+def main(argv):
+    tool, args = argv[0], argv[1:]
+    if tool in HOST_TOOLS:
+        code, output, _ = run(tool, args, None)
+    else:
+        path = os.environ[STATE_ENV]
+        with open(path + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            state = load_state(path)
+            code, output, changed = run(tool, args, state)
+            if changed:
+                save_state(path, state)
+    if output:
+        stream = sys.stdout if code == 0 else sys.stderr
+        stream.write(output)
+        stream.flush()
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
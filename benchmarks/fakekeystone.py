@@ -0,0 +1,229 @@
+#
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""In-process fake of the keystone v2.0 and v3 admin APIs.
+
+Only the resources the charm manages are implemented: services, endpoints,
+regions, domains, projects (tenants), users, roles and role grants. Every
+request is counted by method and path, with resource ids replaced by {id},
+and may be delayed to model a loaded keystone.
+"""
+
+import collections
+import json
+import re
+import threading
+import time
+import uuid
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qsl, urlparse
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qsl, urlparse
+
+KINDS = ('services', 'endpoints', 'regions', 'domains', 'projects', 'users',
+         'roles')
+# Collection names as they appear in request paths.
+COLLECTIONS = dict((kind, kind) for kind in KINDS)
+COLLECTIONS['tenants'] = 'projects'
+# v2.0 body keys which differ from the singular/plural collection name.
+V2_KEYS = {
+    'services': ('OS-KSADM:service', 'OS-KSADM:services'),
+    'tenants': ('tenant', 'tenants'),
+}
+SCOPES = ('projects', 'tenants', 'domains')
+_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+class NotFound(Exception):
+    pass
+
+
+def _keys(version, collection):
+    if version == 'v2.0' and collection in V2_KEYS:
+        return V2_KEYS[collection]
+    return collection[:-1], collection
+
+
+class FakeKeystone(object):
+    """Fake keystone API server.
+
+    :param latency: seconds each request is delayed by
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = collections.Counter()
+        self.store = dict((kind, collections.OrderedDict())
+                          for kind in KINDS)
+        self.grants = set()
+        self.url = None
+        self._lock = threading.Lock()
+        self._server = None
+
+    def start(self):
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.keystone = self
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = 'http://127.0.0.1:{}'.format(self._server.server_port)
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def endpoint(self, api_version):
+        return '{}/{}/'.format(self.url,
+                               'v2.0' if api_version == 2 else 'v3')
+
+    def handle(self, method, path, query, body):
+        """Serve one request.
+
+        :returns: (status, response body or None)
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        parts = [p for p in path.split('/') if p and p != 'OS-KSADM']
+        self.calls['{} /{}'.format(method, '/'.join(
+            '{id}' if _ID.match(p) else p for p in parts))] += 1
+        if not parts:
+            return 300, {'versions': {'values': []}}
+        version, parts = parts[0], parts[1:]
+        with self._lock:
+            try:
+                return self._dispatch(version, method, parts, query, body)
+            except NotFound:
+                return 404, {'error': {'code': 404, 'title': 'Not Found',
+                                       'message': path}}
+
+    def _dispatch(self, version, method, parts, query, body):
+        if not parts:
+            return 200, {'version': {'id': version, 'status': 'stable'}}
+        if parts == ['role_assignments']:
+            return 200, {'role_assignments': self._assignments(query)}
+        if len(parts) >= 5 and parts[0] in SCOPES and parts[2] == 'users' \
+                and parts[4] == 'roles':
+            return self._grant(version, method, parts)
+        if parts[0] not in COLLECTIONS:
+            raise NotFound()
+        collection = parts[0]
+        items = self.store[COLLECTIONS[collection]]
+        single, plural = _keys(version, collection)
+        if len(parts) == 1:
+            if method == 'POST':
+                item = dict(body[single])
+                item.pop('password', None)
+                item.setdefault('enabled', True)
+                item['id'] = uuid.uuid4().hex
+                items[item['id']] = item
+                return 201, {single: item}
+            return 200, {plural: [i for i in items.values()
+                                  if self._matches(i, query)]}
+        item = items.get(parts[1])
+        if item is None:
+            raise NotFound()
+        if method == 'DELETE':
+            del items[parts[1]]
+            return 204, None
+        if method in ('PATCH', 'PUT') and body:
+            changes = dict(body.get(single) or body.get('user') or {})
+            changes.pop('password', None)
+            item.update(changes)
+        return 200, {single: item}
+
+    def _matches(self, item, query):
+        return all(str(item[key]) == value for key, value in query.items()
+                   if key in item)
+
+    def _grant(self, version, method, parts):
+        scope, target, user = parts[0], parts[1], parts[3]
+        scope = 'domain' if scope == 'domains' else 'project'
+        if target not in self.store[COLLECTIONS[parts[0]]] or \
+                user not in self.store['users']:
+            raise NotFound()
+        if len(parts) == 5:
+            roles = [self.store['roles'][role]
+                     for s, t, u, role in sorted(self.grants)
+                     if (s, t, u) == (scope, target, user)]
+            return 200, {'roles': roles}
+        role = parts[5]
+        if role not in self.store['roles']:
+            raise NotFound()
+        grant = (scope, target, user, role)
+        if method == 'DELETE':
+            self.grants.discard(grant)
+            return 204, None
+        if method == 'PUT':
+            self.grants.add(grant)
+            if version == 'v2.0':
+                return 200, {'role': self.store['roles'][role]}
+            return 204, None
+        return (204 if grant in self.grants else 404), None
+
+    def _assignments(self, query):
+        assignments = []
+        for scope, target, user, role in sorted(self.grants):
+            assignment = {'scope': {scope: {'id': target}},
+                          'user': {'id': user},
+                          'role': {'id': role}}
+            filters = {'user.id': user, 'role.id': role,
+                       'scope.{}.id'.format(scope): target}
+            if all(filters.get(key) == value
+                   for key, value in query.items()
+                   if key.startswith(('user.', 'role.', 'scope.'))):
+                assignments.append(assignment)
+        return assignments
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Send each response in one write; header lines written separately
+    # stall on delayed ACKs.
+    wbufsize = -1
+
+    def _serve(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length).decode('utf-8')) \
+            if length else None
+        status, payload = self.server.keystone.handle(
+            self.command, url.path, dict(parse_qsl(url.query)), body)
+        data = json.dumps(payload).encode('utf-8') \
+            if payload is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        if status == 201 and isinstance(payload, dict):
+            self.send_header('Location', self.path)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = _serve
+
+    def log_message(self, format, *args):
+        pass
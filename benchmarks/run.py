@@ -0,0 +1,382 @@
+#!/usr/bin/env python
+#
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Offline hook benchmarks for the keystone charm.
+
+Each scenario runs keystone_hooks.main() in a fresh process against stub
+juju tools (fakejuju) and a fake keystone API (fakekeystone), with package,
+service and file system side effects replaced by counters. Wall time,
+subprocesses started, keystone API calls and peak RSS are reported and
+compared against a baseline.
+"""
+
+import argparse
+import collections
+import importlib
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARK_DIR)
+
+import fakejuju  # noqa: E402
+from fakekeystone import FakeKeystone  # noqa: E402
+from scenarios import CHARM_DIR, SCENARIOS, UNIT  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, 'baseline.json')
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_LATENCY = 0.002
+RELEASE = 'queens'
+SERIES = 'bionic'
+
+# Metrics compared against the baseline; higher is worse for all of them.
+METRICS = ('wall-seconds', 'subprocesses', 'api-calls', 'peak-rss-kb')
+# Charm directory entries the hooks may write to, which get a private copy.
+PRIVATE_ENTRIES = ('scripts',)
+EXCLUDED_ENTRIES = ('.git', '.tox', 'benchmarks')
+
+
+class Stubs(object):
+    """Replaces functions with host side effects for a benchmark run.
+
+    Modules which imported a function by name before it was stubbed keep
+    the original, so sweep() rebinds those after the hooks are imported.
+    """
+
+    def __init__(self):
+        self._replacements = {}
+        self._originals = []
+
+    def add(self, target, replacement):
+        module_name, attr = target.rsplit('.', 1)
+        module = importlib.import_module(module_name)
+        original = getattr(module, attr)
+        setattr(module, attr, replacement)
+        self._originals.append(original)
+        self._replacements[id(original)] = replacement
+
+    def sweep(self):
+        for module in list(sys.modules.values()):
+            if module is None:
+                continue
+            for name, value in list(vars(module).items()):
+                replacement = self._replacements.get(id(value))
+                if replacement is not None and value is not replacement:
+                    setattr(module, name, replacement)
+
+
+def _counting_popen(counter):
+    class CountingPopen(subprocess.Popen):
+
+        def __init__(self, args, *posargs, **kwargs):
+            command = args.split()[0] if isinstance(args, str) else args[0]
+            counter[os.path.basename(command)] += 1
+            super(CountingPopen, self).__init__(args, *posargs, **kwargs)
+
+    return CountingPopen
+
+
+def _recorder(counter, name, result=None):
+    def record(*args, **kwargs):
+        counter[name] += 1
+        return result
+    return record
+
+
+def install_stubs(stubs, host, keystone):
+    """Stub out everything that would change the host or needs packages."""
+    try:
+        import apt  # noqa: F401
+    except ImportError:
+        # python-apt is only used by the hardening audits, which the
+        # scenarios leave disabled, and by package operations stubbed below.
+        apt = sys.modules['apt'] = types.ModuleType('apt')
+        apt.apt_pkg = types.ModuleType('apt_pkg')
+    from charmhelpers.contrib.openstack import utils as os_utils
+    version = os_utils.get_os_version_codename(RELEASE)
+
+    stubs.add('charmhelpers.core.host.lsb_release',
+              lambda: {'DISTRIB_ID': 'Ubuntu', 'DISTRIB_CODENAME': SERIES})
+    stubs.add('charmhelpers.contrib.openstack.utils.get_os_codename_package',
+              lambda *args, **kwargs: RELEASE)
+    stubs.add('charmhelpers.contrib.openstack.utils.'
+              'get_os_codename_install_source',
+              lambda *args, **kwargs: RELEASE)
+    stubs.add('charmhelpers.contrib.openstack.utils.get_os_version_package',
+              lambda *args, **kwargs: version)
+    stubs.add('charmhelpers.contrib.openstack.utils.'
+              'openstack_upgrade_available',
+              lambda *args, **kwargs: False)
+    stubs.add('charmhelpers.fetch.installed_version',
+              lambda package: '2:{}.0-0ubuntu1'.format(version))
+    stubs.add('charmhelpers.fetch.filter_installed_packages',
+              lambda packages: [])
+    for name in ('apt_install', 'apt_update', 'apt_upgrade', 'apt_purge'):
+        stubs.add('charmhelpers.fetch.{}'.format(name),
+                  _recorder(host, name.replace('_', '-')))
+    for name in ('service', 'service_pause', 'service_resume'):
+        stubs.add('charmhelpers.core.host.{}'.format(name),
+                  _recorder(host, 'service-actions', True))
+    stubs.add('charmhelpers.core.host.service_running',
+              lambda *args, **kwargs: True)
+    stubs.add('charmhelpers.core.host.write_file',
+              _recorder(host, 'file-writes'))
+    stubs.add('charmhelpers.core.host.mkdir', _recorder(host, 'mkdir'))
+    stubs.add('charmhelpers.contrib.hahelpers.apache.install_ca_cert',
+              _recorder(host, 'file-writes'))
+
+    from charmhelpers.contrib.openstack.templating import OSConfigRenderer
+
+    def render_only(self, config_file):
+        self.render(config_file)
+        host['config-renders'] += 1
+
+    OSConfigRenderer.write = render_only
+
+    import keystone_utils
+    stubs.add('keystone_utils.get_admin_token',
+              lambda: keystone_utils.config('admin-token'))
+    stubs.add('keystone_utils.get_local_endpoint',
+              lambda api_suffix=None: '{}/{}/'.format(
+                  keystone.url,
+                  api_suffix or keystone_utils.get_api_suffix()))
+
+
+def _charm_dir(workdir):
+    """Return a copy of the charm directory made of symlinks, apart from
+    the entries hooks write to."""
+    charm_dir = os.path.join(workdir, 'charm')
+    os.mkdir(charm_dir)
+    for entry in os.listdir(CHARM_DIR):
+        if entry in EXCLUDED_ENTRIES:
+            continue
+        path = os.path.join(charm_dir, entry)
+        if entry in PRIVATE_ENTRIES:
+            os.mkdir(path)
+        else:
+            os.symlink(os.path.join(CHARM_DIR, entry), path)
+    return charm_dir
+
+
+def run_worker(name, latency):
+    """Run scenario name in this process.
+
+    :returns: dict of results
+    """
+    try:
+        import keystoneclient  # noqa: F401
+    except ImportError:
+        return {'skipped': 'python-keystoneclient is not installed'}
+
+    scenario = SCENARIOS[name]()
+    workdir = tempfile.mkdtemp(prefix='keystone-benchmark-')
+    keystone = FakeKeystone(latency=latency).start()
+    try:
+        bindir = os.path.join(workdir, 'bin')
+        os.mkdir(bindir)
+        fakejuju.write_tools(bindir)
+        state_path = os.path.join(workdir, 'state.json')
+        fakejuju.save_state(state_path, scenario['state'])
+        charm_dir = _charm_dir(workdir)
+        os.environ.update({
+            'PATH': '{}:{}'.format(bindir, os.environ.get('PATH', '')),
+            fakejuju.STATE_ENV: state_path,
+            'JUJU_UNIT_NAME': UNIT,
+            'JUJU_CHARM_DIR': charm_dir,
+            'CHARM_DIR': charm_dir,
+            'JUJU_HOOK_NAME': scenario['hook'],
+            'UNIT_STATE_DB': os.path.join(workdir, 'unit-state.db'),
+        })
+        os.environ.update(scenario['env'])
+        os.chdir(charm_dir)
+        sys.path.insert(0, os.path.join(charm_dir, 'hooks'))
+
+        subprocesses = collections.Counter()
+        host = collections.Counter()
+        subprocess.Popen = _counting_popen(subprocesses)
+        stubs = Stubs()
+        start = time.time()
+        install_stubs(stubs, host, keystone)
+        keystone_hooks = importlib.import_module('keystone_hooks')
+        stubs.sweep()
+        imported = time.time()
+        sys.argv = [os.path.join(charm_dir, 'hooks', scenario['hook'])]
+        keystone_hooks.main()
+        end = time.time()
+    finally:
+        keystone.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'hook': scenario['hook'],
+        'wall-seconds': round(end - start, 3),
+        'import-seconds': round(imported - start, 3),
+        'hook-seconds': round(end - imported, 3),
+        'subprocesses': sum(subprocesses.values()),
+        'subprocesses-by-command': dict(subprocesses),
+        'api-calls': sum(keystone.calls.values()),
+        'api-calls-by-route': dict(keystone.calls),
+        'peak-rss-kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'host': dict(host),
+    }
+
+
+def run_scenario(name, repeat, latency, verbose=False):
+    """Run scenario name repeat times, each in a new process.
+
+    Wall times are the median of the runs, everything else is taken from
+    the last run.
+
+    :returns: dict of results
+    """
+    runs = []
+    for _ in range(repeat):
+        fd, output = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        cmd = [sys.executable, os.path.abspath(__file__), '--worker', name,
+               '--latency', str(latency), '--output', output]
+        try:
+            with tempfile.TemporaryFile() as log:
+                code = subprocess.call(cmd, stdout=log,
+                                       stderr=subprocess.STDOUT)
+                log.seek(0)
+                text = log.read().decode('utf-8', 'replace')
+            if verbose or code:
+                sys.stderr.write(text)
+            if code:
+                return {'error': 'worker exited with {}'.format(code)}
+            with open(output) as f:
+                runs.append(json.load(f))
+        finally:
+            os.unlink(output)
+        if 'skipped' in runs[-1]:
+            return runs[-1]
+    result = runs[-1]
+    for key in ('wall-seconds', 'import-seconds', 'hook-seconds'):
+        values = sorted(run[key] for run in runs)
+        result[key] = values[len(values) // 2]
+    return result
+
+
+def compare(results, baseline, threshold):
+    """Return messages for metrics exceeding the baseline by more than
+    threshold."""
+    regressions = []
+    for name, result in results.items():
+        for metric in METRICS:
+            base = baseline.get(name, {}).get(metric)
+            value = result.get(metric)
+            if base and value is not None and \
+                    value > base * (1 + threshold):
+                regressions.append(
+                    '{}: {} {} exceeds baseline {} by more than {:.0%}'
+                    .format(name, metric, value, base, threshold))
+    return regressions
+
+
+def _report(results):
+    header = '{:<40} {:>8} {:>6} {:>6} {:>9}'.format(
+        'scenario', 'wall(s)', 'procs', 'api', 'rss(kB)')
+    print(header)
+    print('-' * len(header))
+    for name, result in results.items():
+        if 'wall-seconds' not in result:
+            print('{:<40} {}'.format(
+                name, result.get('skipped') or result.get('error')))
+            continue
+        print('{:<40} {:>8.3f} {:>6} {:>6} {:>9}'.format(
+            name, result['wall-seconds'], result['subprocesses'],
+            result['api-calls'], result['peak-rss-kb']))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--scenario', action='append',
+                        choices=list(SCENARIOS),
+                        help='scenario to run, may be repeated '
+                             '(default: all)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per scenario (default: %(default)s)')
+    parser.add_argument('--latency', type=float, default=DEFAULT_LATENCY,
+                        help='seconds added to each keystone API request '
+                             '(default: %(default)s)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                        help='baseline results (default: %(default)s)')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='allowed fractional increase over the baseline '
+                             '(default: %(default)s)')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='write the results as the new baseline')
+    parser.add_argument('--json', help='write full results to this file')
+    parser.add_argument('--verbose', action='store_true',
+                        help='show hook output')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        result = run_worker(args.worker, args.latency)
+        with open(args.output, 'w') as f:
+            json.dump(result, f)
+        return 0
+
+    results = collections.OrderedDict(
+        (name, run_scenario(name, args.repeat, args.latency, args.verbose))
+        for name in args.scenario or SCENARIOS)
+    _report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True,
+                      separators=(',', ': '))
+    if any('error' in result for result in results.values()):
+        return 2
+
+    measured = dict((name, result) for name, result in results.items()
+                    if 'wall-seconds' in result)
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        for name, result in measured.items():
+            baseline[name] = dict((metric, result[metric])
+                                  for metric in METRICS)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True,
+                      separators=(',', ': '))
+            f.write('\n')
+        print('Baseline written to {}'.format(args.baseline))
+        return 0
+    if not os.path.exists(args.baseline):
+        print('No baseline at {}, run with --update-baseline to record '
+              'one'.format(args.baseline))
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare(measured, json.load(f), args.threshold)
+    for message in regressions:
+        print('REGRESSION: {}'.format(message))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -22,6 +22,7 @@ import subprocess
 import pwd
 import grp
 import os
+import filecmp
 import glob
 import shutil
 import re
@@ -40,6 +41,7 @@ from charmhelpers.core.hookenv import (
 
 from charmhelpers.core.host import service
 from charmhelpers.core import host
+from charmhelpers.core import unitdata
 
 # This module adds compatibility with the nrpe-external-master and plain nrpe
 # subordinate charms. To use it in your charm:
@@ -148,7 +150,7 @@ define service {{
             raise CheckException("shortname must match {}".format(
                 Check.shortname_re))
         self.shortname = shortname
-        self.command = "check_{}".format(shortname)
+        self.command = _check_command(shortname)
         # Note: a set of invalid characters is defined by the
         # Nagios server config
         # The default is: illegal_object_name_chars=`~!$%^&*"|'<>?,()=
@@ -156,7 +158,7 @@ define service {{
         self.check_cmd = self._locate_cmd(check_cmd)
 
     def _get_check_filename(self):
-        return os.path.join(NRPE.nrpe_confdir, '{}.cfg'.format(self.command))
+        return _check_filename(self.shortname)
 
     def _get_service_filename(self, hostname):
         return os.path.join(NRPE.nagios_exportdir,
@@ -178,31 +180,27 @@ define service {{
         return ''
 
     def _remove_service_files(self):
-        if not os.path.exists(NRPE.nagios_exportdir):
-            return
-        for f in os.listdir(NRPE.nagios_exportdir):
-            if f.endswith('_{}.cfg'.format(self.command)):
-                os.remove(os.path.join(NRPE.nagios_exportdir, f))
+        _remove_service_files(self.shortname)
 
     def remove(self, hostname):
-        nrpe_check_file = self._get_check_filename()
-        if os.path.exists(nrpe_check_file):
-            os.remove(nrpe_check_file)
-        self._remove_service_files()
+        _remove_check_files(self.shortname)
 
     def write(self, nagios_context, hostname, nagios_servicegroups):
-        nrpe_check_file = self._get_check_filename()
-        with open(nrpe_check_file, 'w') as nrpe_check_config:
-            nrpe_check_config.write("# check {}\n".format(self.shortname))
-            if nagios_servicegroups:
-                nrpe_check_config.write(
-                    "# The following header was added automatically by juju\n")
-                nrpe_check_config.write(
-                    "# Modifying it will affect nagios monitoring and alerting\n")
-                nrpe_check_config.write(
-                    "# servicegroups: {}\n".format(nagios_servicegroups))
-            nrpe_check_config.write("command[{}]={}\n".format(
-                self.command, self.check_cmd))
+        """Write the nrpe check and nagios service config for this check.
+
+        Files which already have the desired content are left alone.
+
+        :returns: True if the nrpe check config changed
+        """
+        lines = ["# check {}\n".format(self.shortname)]
+        if nagios_servicegroups:
+            lines.extend([
+                "# The following header was added automatically by juju\n",
+                "# Modifying it will affect nagios monitoring and alerting\n",
+                "# servicegroups: {}\n".format(nagios_servicegroups)])
+        lines.append("command[{}]={}\n".format(self.command, self.check_cmd))
+        changed = _write_if_changed(self._get_check_filename(),
+                                    ''.join(lines))
 
         if not os.path.exists(NRPE.nagios_exportdir):
             log('Not writing service config as {} is not accessible'.format(
@@ -210,11 +208,10 @@ define service {{
         else:
             self.write_service_config(nagios_context, hostname,
                                       nagios_servicegroups)
+        return changed
 
     def write_service_config(self, nagios_context, hostname,
                              nagios_servicegroups):
-        self._remove_service_files()
-
         templ_vars = {
             'nagios_hostname': hostname,
             'nagios_servicegroup': nagios_servicegroups,
@@ -224,17 +221,63 @@ define service {{
         }
         nrpe_service_text = Check.service_template.format(**templ_vars)
         nrpe_service_file = self._get_service_filename(hostname)
-        with open(nrpe_service_file, 'w') as nrpe_service_config:
-            nrpe_service_config.write(str(nrpe_service_text))
+        # Drop files exported for a previous hostname only
+        for f in os.listdir(NRPE.nagios_exportdir):
+            path = os.path.join(NRPE.nagios_exportdir, f)
+            if (f.endswith('_{}.cfg'.format(self.command)) and
+                    path != nrpe_service_file):
+                os.remove(path)
+        return _write_if_changed(nrpe_service_file, str(nrpe_service_text))
 
     def run(self):
         subprocess.call(self.check_cmd)
 
 
+def _check_command(shortname):
+    return "check_{}".format(shortname)
+
+
+def _check_filename(shortname):
+    return os.path.join(NRPE.nrpe_confdir,
+                        '{}.cfg'.format(_check_command(shortname)))
+
+
+def _remove_service_files(shortname):
+    if not os.path.exists(NRPE.nagios_exportdir):
+        return
+    for f in os.listdir(NRPE.nagios_exportdir):
+        if f.endswith('_{}.cfg'.format(_check_command(shortname))):
+            os.remove(os.path.join(NRPE.nagios_exportdir, f))
+
+
+def _remove_check_files(shortname):
+    """Remove the nrpe check and exported service config for a check."""
+    nrpe_check_file = _check_filename(shortname)
+    if os.path.exists(nrpe_check_file):
+        os.remove(nrpe_check_file)
+    _remove_service_files(shortname)
+
+
+def _write_if_changed(path, content):
+    """Write content to path unless it already holds exactly that.
+
+    :returns: True if the file was written
+    """
+    if os.path.exists(path):
+        with open(path) as f:
+            if f.read() == content:
+                return False
+    with open(path, 'w') as f:
+        f.write(content)
+    return True
+
+
 class NRPE(object):
     nagios_logdir = '/var/log/nagios'
     nagios_exportdir = '/var/lib/nagios/export'
     nrpe_confdir = '/etc/nagios/nrpe.d'
+    checks_key = 'nrpe-checks'
+    reload_key = 'nrpe-reload-pending'
     homedir = '/var/lib/nagios'  # home dir provided by nagios-nrpe-server
 
     def __init__(self, hostname=None, primary=True):
@@ -296,19 +339,30 @@ class NRPE(object):
 
         nrpe_monitors = {}
         monitors = {"monitors": {"remote": {"nrpe": nrpe_monitors}}}
+        changed = False
         for nrpecheck in self.checks:
-            nrpecheck.write(self.nagios_context, self.hostname,
-                            self.nagios_servicegroups)
+            if nrpecheck.write(self.nagios_context, self.hostname,
+                               self.nagios_servicegroups):
+                changed = True
             nrpe_monitors[nrpecheck.shortname] = {
                 "command": nrpecheck.command,
             }
 
-        # update-status hooks are configured to firing every 5 minutes by
-        # default. When nagios-nrpe-server is restarted, the nagios server
-        # reports checks failing causing unneccessary alerts. Let's not restart
-        # on update-status hooks.
-        if not hook_name() == 'update-status':
-            service('restart', 'nagios-nrpe-server')
+        # Remove checks this charm wrote previously but no longer wants
+        kv = unitdata.kv()
+        previous = set(kv.get(NRPE.checks_key) or [])
+        for shortname in previous - set(nrpe_monitors):
+            log("Removing stale nrpe check {}".format(shortname))
+            _remove_check_files(shortname)
+            changed = True
+        kv.set(NRPE.checks_key, sorted(nrpe_monitors))
+        # nrpe re-reads its config on reload so only do that, and only if a
+        # check actually changed. The reload may be deferred to a later hook,
+        # see reload_pending().
+        if changed:
+            kv.set(NRPE.reload_key, True)
+        kv.flush()
+        reload_pending()
 
         monitor_ids = relation_ids("local-monitors") + \
             relation_ids("nrpe-external-master")
@@ -316,6 +370,29 @@ class NRPE(object):
             relation_set(relation_id=rid, monitors=yaml.dump(monitors))
 
 
+def reload_pending():
+    """Reload nagios-nrpe-server if NRPE.write() changed its checks since
+    the last reload.
+
+    update-status hooks are configured to firing every 5 minutes by default.
+    When nagios-nrpe-server is restarted, the nagios server reports checks
+    failing causing unneccessary alerts, so the reload is deferred to the
+    next hook which is not update-status. Charms should call this from every
+    hook so that the deferred reload is not lost.
+
+    :returns: True if nagios-nrpe-server was reloaded
+    """
+    if hook_name() == 'update-status':
+        return False
+    kv = unitdata.kv()
+    if not kv.get(NRPE.reload_key):
+        return False
+    service('reload', 'nagios-nrpe-server')
+    kv.unset(NRPE.reload_key)
+    kv.flush()
+    return True
+
+
 def get_nagios_hostcontext(relation_name='nrpe-external-master'):
     """
     Query relation with nrpe subordinate, return the nagios_host_context
@@ -424,8 +501,11 @@ def copy_nrpe_checks():
         os.makedirs(NAGIOS_PLUGINS)
     for fname in glob.glob(os.path.join(nrpe_files_dir, "check_*")):
         if os.path.isfile(fname):
-            shutil.copy2(fname,
-                         os.path.join(NAGIOS_PLUGINS, os.path.basename(fname)))
+            dest = os.path.join(NAGIOS_PLUGINS, os.path.basename(fname))
+            if os.path.isfile(dest) and filecmp.cmp(fname, dest,
+                                                    shallow=False):
+                continue
+            shutil.copy2(fname, dest)
 
 
 def add_haproxy_checks(nrpe, unit_name):
@@ -34,6 +34,8 @@ from charmhelpers.core.hookenv import (
     INFO,
 )
 
+CA_CERT_PATH = '/usr/local/share/ca-certificates/keystone_juju_ca_cert.crt'
+
 
 def get_cert(cn=None):
     # TODO: deal with multiple https endpoints via charm config
@@ -84,8 +86,7 @@ def retrieve_ca_cert(cert_file):
 
 def install_ca_cert(ca_cert):
     if ca_cert:
-        cert_file = ('/usr/local/share/ca-certificates/'
-                     'keystone_juju_ca_cert.crt')
+        cert_file = CA_CERT_PATH
         old_cert = retrieve_ca_cert(cert_file)
         if old_cert and old_cert == ca_cert:
             log("CA cert is the same as installed version", level=INFO)
@@ -58,6 +58,11 @@ from charmhelpers.core.strutils import (
 
 DC_RESOURCE_NAME = 'DC'
 
+# Leadership and clustering state is stable for the duration of a hook, so
+# results are computed once and shared by all callers in the same process.
+# See clear_leadership_cache() for explicit invalidation.
+_leadership_cache = {}
+
 
 class HAIncompleteConfig(Exception):
     pass
@@ -87,7 +92,17 @@ def is_elected_leader(resource):
         3. If the charm is not part of a corosync cluster, the leader is
         determined as being "the alive unit with the lowest unit numer". In
         other words, the oldest surviving unit.
+
+    The result is cached per resource for the remainder of the hook; use
+    clear_leadership_cache() if leadership may have changed.
     """
+    key = ('is_elected_leader', resource)
+    if key not in _leadership_cache:
+        _leadership_cache[key] = _is_elected_leader(resource)
+    return _leadership_cache[key]
+
+
+def _is_elected_leader(resource):
     try:
         return juju_is_leader()
     except NotImplementedError:
@@ -108,6 +123,17 @@ def is_elected_leader(resource):
 
 
 def is_clustered():
+    """Returns True if any unit on the ha relation reports clustered.
+
+    The result is cached for the remainder of the hook; use
+    clear_leadership_cache() to force re-evaluation.
+    """
+    if 'is_clustered' not in _leadership_cache:
+        _leadership_cache['is_clustered'] = _is_clustered()
+    return _leadership_cache['is_clustered']
+
+
+def _is_clustered():
     for r_id in (relation_ids('ha') or []):
         for unit in (relation_list(r_id) or []):
             clustered = relation_get('clustered',
@@ -118,13 +144,32 @@ def is_clustered():
     return False
 
 
+def clear_leadership_cache():
+    """Invalidate cached leadership and clustering results.
+
+    Should be called when leadership is known to have changed during the
+    current hook, e.g. from the leader-elected hook.
+    """
+    _leadership_cache.clear()
+
+
+def _crm_output(cmd):
+    """Run a crm command, logging how long it took."""
+    start = time.time()
+    try:
+        return subprocess.check_output(cmd, stderr=subprocess.STDOUT)
+    finally:
+        log('{} took {:.2f}s'.format(' '.join(cmd), time.time() - start),
+            level=DEBUG)
+
+
 def is_crm_dc():
     """
     Determine leadership by querying the pacemaker Designated Controller
     """
     cmd = ['crm', 'status']
     try:
-        status = subprocess.check_output(cmd, stderr=subprocess.STDOUT)
+        status = _crm_output(cmd)
         if not isinstance(status, six.text_type):
             status = six.text_type(status, "utf-8")
     except subprocess.CalledProcessError as ex:
@@ -157,7 +202,7 @@ def is_crm_leader(resource, retry=False):
         return is_crm_dc()
     cmd = ['crm', 'resource', 'show', resource]
     try:
-        status = subprocess.check_output(cmd, stderr=subprocess.STDOUT)
+        status = _crm_output(cmd)
         if not isinstance(status, six.text_type):
             status = six.text_type(status, "utf-8")
     except subprocess.CalledProcessError:
@@ -16,14 +16,12 @@ from charmhelpers.core.hookenv import (
     log,
     DEBUG,
 )
+from charmhelpers.contrib.hardening.audits import run_audits
 from charmhelpers.contrib.hardening.apache.checks import config
 
 
 def run_apache_checks():
     log("Starting Apache hardening checks.", level=DEBUG)
-    checks = config.get_audits()
-    for check in checks:
-        log("Running '%s' check" % (check.__class__.__name__), level=DEBUG)
-        check.ensure_compliance()
+    run_audits(config.get_audits(), 'Apache')
 
     log("Apache hardening checks complete.", level=DEBUG)
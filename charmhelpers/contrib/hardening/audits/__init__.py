@@ -12,6 +12,153 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import threading
+import time
+
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+from charmhelpers.core.hookenv import (
+    log,
+    DEBUG,
+    INFO,
+)
+
+AUDIT_THREADS = 4
+
+# Stat results shared by the audits of a run_audits() batch, None outside
+# of one.
+_stat_cache = None
+# Guards _stat_cache, which audits update from run_audits() worker threads.
+_stat_lock = threading.Lock()
+
+
+def cached_stat(path):
+    """Stat path, at most once per run_audits() batch.
+
+    :returns: an st_stat object for the path or None if it doesn't exist.
+    """
+    cache = _stat_cache
+    if cache is not None:
+        with _stat_lock:
+            if path in cache:
+                return cache[path]
+    try:
+        st = os.stat(path)
+    except OSError:
+        st = None
+    if cache is not None:
+        with _stat_lock:
+            cache[path] = st
+    return st
+
+
+def forget_stat(path):
+    """Drop the cached stat of path and anything below it."""
+    cache = _stat_cache
+    if cache is None:
+        return
+    prefix = path.rstrip('/') + '/'
+    with _stat_lock:
+        for cached in list(cache):
+            if cached == path or cached.startswith(prefix):
+                del cache[cached]
+
+
+def _clear_stats():
+    with _stat_lock:
+        _stat_cache.clear()
+
+
+def _timed(audit):
+    start = time.time()
+    audit.ensure_compliance()
+    return audit, time.time() - start
+
+
+def _timed_group(group):
+    return [_timed(audit) for audit in group]
+
+
+def _path_groups(audits):
+    """Group audits which share a path, or where one audits a path below
+    another's, so that each group can be run in order by a single thread.
+
+    :returns: list of lists of audits, each in the order given
+    """
+    parent = list(range(len(audits)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    entries = sorted((path.rstrip('/') + '/', i)
+                     for i, audit in enumerate(audits)
+                     for path in getattr(audit, 'paths', []))
+    # Paths below a path sort directly after it, so the stack holds the
+    # current path's ancestors.
+    stack = []
+    for path, i in entries:
+        while stack and not path.startswith(stack[-1][0]):
+            stack.pop()
+        if stack:
+            parent[find(i)] = find(stack[-1][1])
+        stack.append((path, i))
+
+    groups = OrderedDict()
+    for i, audit in enumerate(audits):
+        groups.setdefault(find(i), []).append(audit)
+    return list(groups.values())
+
+
+def run_audits(audits, name):
+    """Run audits as one batch.
+
+    Audits which are not parallel_safe run first, in order, and may change
+    any file so cached stats are dropped after each of them. The remaining
+    audits run concurrently on a thread pool, except that audits of the same
+    path or of paths below one another run in order in the same thread.
+    Paths are otherwise stat'd once for the whole batch. Each audit's run
+    time and the number of non-compliant paths are logged.
+
+    :param audits: list of BaseAudit objects
+    :param name: name of the batch for logging e.g. 'OS'
+    :returns: number of non-compliant paths found
+    """
+    global _stat_cache
+    _stat_cache = {}
+    start = time.time()
+    try:
+        results = []
+        for audit in audits:
+            if not audit.parallel_safe:
+                results.append(_timed(audit))
+                _clear_stats()
+        parallel = [audit for audit in audits if audit.parallel_safe]
+        if parallel:
+            pool = ThreadPool(AUDIT_THREADS)
+            try:
+                for group in pool.map(_timed_group, _path_groups(parallel)):
+                    results.extend(group)
+            finally:
+                pool.close()
+                pool.join()
+    finally:
+        _stat_cache = None
+
+    non_compliant = 0
+    for audit, elapsed in results:
+        count = len(getattr(audit, 'non_compliant', []))
+        non_compliant += count
+        log("Audit '%s' took %.3fs, %d non-compliant path(s)" %
+            (audit.__class__.__name__, elapsed, count), level=DEBUG)
+    log("%s hardening ran %d audits in %.2fs, %d non-compliant path(s)" %
+        (name, len(results), time.time() - start, non_compliant), level=INFO)
+    return non_compliant
+
 
 class BaseAudit(object):  # NO-QA
     """Base class for hardening checks.
@@ -20,6 +167,9 @@ class BaseAudit(object):  # NO-QA
     is in compliance for the specified check. If it is not in compliance, the
     check method will return a value which will be supplied to the.
     """
+    # Whether run_audits() may run this audit concurrently with others.
+    parallel_safe = False
+
     def __init__(self, *args, **kwargs):
         self.unless = kwargs.get('unless', None)
         super(BaseAudit, self).__init__()
@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import glob
+import os
 import re
 import subprocess
 
@@ -22,9 +24,33 @@ from charmhelpers.core.hookenv import (
     INFO,
     ERROR,
 )
+from charmhelpers.core.host import request_restart
 
 from charmhelpers.contrib.hardening.audits import BaseAudit
 
+APACHE_DIR = '/etc/apache2'
+
+
+def enabled_modules(apache_dir=APACHE_DIR):
+    """Read the shared modules enabled in apache from mods-enabled.
+
+    :returns: dict of module name, as listed by apache2ctl -M without the
+              _module suffix, to the name a2dismod takes
+    """
+    modules = {}
+    for path in glob.glob(os.path.join(apache_dir, 'mods-enabled', '*.load')):
+        name = os.path.basename(path)[:-len('.load')]
+        try:
+            with open(path) as f:
+                for line in f:
+                    matcher = re.match(r'\s*LoadModule\s+(\S+?)(_module)?\s',
+                                       line)
+                    if matcher:
+                        modules[matcher.group(1)] = name
+        except IOError:
+            continue
+    return modules
+
 
 class DisabledModuleAudit(BaseAudit):
     """Audits Apache2 modules.
@@ -46,13 +72,13 @@ class DisabledModuleAudit(BaseAudit):
             return
 
         try:
-            loaded_modules = self._get_loaded_modules()
+            loaded_modules = enabled_modules()
             non_compliant_modules = []
             for module in self.modules:
                 if module in loaded_modules:
                     log("Module '%s' is enabled but should not be." %
                         (module), level=INFO)
-                    non_compliant_modules.append(module)
+                    non_compliant_modules.append(loaded_modules[module])
 
             if len(non_compliant_modules) == 0:
                 return
@@ -65,21 +91,6 @@ class DisabledModuleAudit(BaseAudit):
                 'This may have been already reported. '
                 'Output is: %s' % e.output, level=ERROR)
 
-    @staticmethod
-    def _get_loaded_modules():
-        """Returns the modules which are enabled in Apache."""
-        output = subprocess.check_output(['apache2ctl', '-M'])
-        modules = []
-        for line in output.splitlines():
-            # Each line of the enabled module output looks like:
-            #  module_name (static|shared)
-            # Plus a header line at the top of the output which is stripped
-            # out by the regex.
-            matcher = re.search(r'^ (\S*)_module (\S*)', line)
-            if matcher:
-                modules.append(matcher.group(1))
-        return modules
-
     @staticmethod
     def _disable_module(module):
         """Disables the specified module in Apache."""
@@ -94,5 +105,5 @@ class DisabledModuleAudit(BaseAudit):
 
     @staticmethod
     def _restart_apache():
-        """Restarts the apache process"""
-        subprocess.check_output(['service', 'apache2', 'restart'])
+        """Restarts the apache process once the hook completes"""
+        request_restart('apache2')
@@ -37,8 +37,15 @@ from charmhelpers.core.hookenv import (
     ERROR,
 )
 from charmhelpers.core import unitdata
-from charmhelpers.core.host import file_hash
-from charmhelpers.contrib.hardening.audits import BaseAudit
+from charmhelpers.core.host import (
+    file_hash,
+    request_restart,
+)
+from charmhelpers.contrib.hardening.audits import (
+    BaseAudit,
+    cached_stat,
+    forget_stat,
+)
 from charmhelpers.contrib.hardening.templating import (
     get_template_path,
     render_and_write,
@@ -46,12 +53,37 @@ from charmhelpers.contrib.hardening.templating import (
 from charmhelpers.contrib.hardening import utils
 
 
+_users = {}
+_groups = {}
+# Templates ship with the charm so can't change within a hook.
+_template_checksums = {}
+
+
+def _getpwnam(name):
+    if name not in _users:
+        _users[name] = pwd.getpwnam(name)
+    return _users[name]
+
+
+def _getgrnam(name):
+    if name not in _groups:
+        _groups[name] = grp.getgrnam(name)
+    return _groups[name]
+
+
+def _getgrgid(gid):
+    if gid not in _groups:
+        _groups[gid] = grp.getgrgid(gid)
+    return _groups[gid]
+
+
 class BaseFileAudit(BaseAudit):
     """Base class for file audits.
 
     Provides api stubs for compliance check flow that must be used by any class
     that implemented this one.
     """
+    parallel_safe = True
 
     def __init__(self, paths, always_comply=False, *args, **kwargs):
         """
@@ -71,12 +103,14 @@ class BaseFileAudit(BaseAudit):
     def ensure_compliance(self):
         """Ensure that the all registered files comply to registered criteria.
         """
+        self.non_compliant = []
         for p in self.paths:
-            if os.path.exists(p):
+            if cached_stat(p) is not None:
                 if self.is_compliant(p):
                     continue
 
                 log('File %s is not in compliance.' % p, level=INFO)
+                self.non_compliant.append(p)
             else:
                 if not self.always_comply:
                     log("Non-existent path '%s' - skipping compliance check"
@@ -85,7 +119,10 @@ class BaseFileAudit(BaseAudit):
 
             if self._take_action():
                 log("Applying compliance criteria to '%s'" % (p), level=INFO)
-                self.comply(p)
+                try:
+                    self.comply(p)
+                finally:
+                    forget_stat(p)
 
     def is_compliant(self, path):
         """Audits the path to see if it is compliance.
@@ -109,7 +146,7 @@ class BaseFileAudit(BaseAudit):
         :returns: an st_stat object for the path or None if the path doesn't
                   exist.
         """
-        return os.stat(path)
+        return cached_stat(path)
 
 
 class FilePermissionAudit(BaseFileAudit):
@@ -133,7 +170,7 @@ class FilePermissionAudit(BaseFileAudit):
     @user.setter
     def user(self, name):
         try:
-            user = pwd.getpwnam(name)
+            user = _getpwnam(name)
         except KeyError:
             log('Unknown user %s' % name, level=ERROR)
             user = None
@@ -148,9 +185,9 @@ class FilePermissionAudit(BaseFileAudit):
         try:
             group = None
             if name:
-                group = grp.getgrnam(name)
+                group = _getgrnam(name)
             else:
-                group = grp.getgrgid(self.user.pw_gid)
+                group = _getgrgid(self.user.pw_gid)
         except KeyError:
             log('Unknown group %s' % name, level=ERROR)
         self._group = group
@@ -333,6 +370,9 @@ class TemplatedFile(BaseFileAudit):
     permissions, then generates a hashsum with which to check the content
     changed.
     """
+    # Uses unitdata, which can only be accessed from the thread that opened it.
+    parallel_safe = False
+
     def __init__(self, path, context, template_dir, mode, user='root',
                  group='root', service_actions=None, **kwargs):
         self.context = context
@@ -363,7 +403,10 @@ class TemplatedFile(BaseFileAudit):
         return False
 
     def run_service_actions(self):
-        """Run any actions on services requested."""
+        """Run any actions on services requested.
+
+        Restarts are queued to run once when the hook completes.
+        """
         if not self.service_actions:
             return
 
@@ -373,6 +416,9 @@ class TemplatedFile(BaseFileAudit):
             log("Running service '%s' actions '%s'" % (name, actions),
                 level=DEBUG)
             for action in actions:
+                if action == 'restart':
+                    request_restart(name)
+                    continue
                 cmd = ['service', name, action]
                 try:
                     check_call(cmd)
@@ -417,7 +463,9 @@ class TemplatedFile(BaseFileAudit):
         """
         template_path = get_template_path(self.template_dir, path)
         key = 'hardening:template:%s' % template_path
-        template_checksum = file_hash(template_path)
+        if template_path not in _template_checksums:
+            _template_checksums[template_path] = file_hash(template_path)
+        template_checksum = _template_checksums[template_path]
         kv = unitdata.kv()
         stored_tmplt_checksum = kv.get(key)
         if not stored_tmplt_checksum:
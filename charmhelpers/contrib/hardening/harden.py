@@ -12,21 +12,133 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
+import json
+import os
 import six
+import time
 
 from collections import OrderedDict
 
+from charmhelpers.core import unitdata
 from charmhelpers.core.hookenv import (
     config,
     log,
     DEBUG,
+    INFO,
     WARNING,
 )
+from charmhelpers.contrib.hardening.utils import get_settings
 from charmhelpers.contrib.hardening.host.checks import run_os_checks
+from charmhelpers.contrib.hardening.host.checks.sysctl import SYSCTL_DEFAULTS
 from charmhelpers.contrib.hardening.ssh.checks import run_ssh_checks
 from charmhelpers.contrib.hardening.mysql.checks import run_mysql_checks
 from charmhelpers.contrib.hardening.apache.checks import run_apache_checks
 
+AUDIT_CACHE_KEY = 'hardening-audits'
+# Audits are re-run regardless of their fingerprint once this old, to pick up
+# changes not reflected in the audited paths (e.g. new suid binaries).
+AUDIT_REFRESH_INTERVAL = 24 * 60 * 60
+
+# Paths whose state is the input to each module's audits. Directories
+# include their immediate entries.
+AUDITED_PATHS = {
+    'os': ['/etc/login.defs', '/etc/passwd', '/etc/shadow', '/etc/securetty',
+           '/etc/security/limits.d', '/etc/profile.d', '/etc/pam.d',
+           '/etc/sysctl.conf', '/etc/sysctl.d',
+           '/etc/initramfs-tools/modules', '/var/lib/dpkg/status'],
+    'ssh': ['/etc/ssh'],
+    'mysql': ['/etc/mysql', '/etc/mysql/conf.d'],
+    'apache': ['/etc/apache2', '/etc/apache2/conf-enabled',
+               '/etc/apache2/mods-enabled'],
+}
+
+# Kernel parameters whose live values are an input to each module's audits,
+# so that runtime changes (sysctl -w) are caught before the refresh interval.
+AUDITED_SYSCTLS = {
+    'os': [line.partition('=')[0] for line in SYSCTL_DEFAULTS.split()],
+}
+SYSCTL_ROOT = '/proc/sys'
+
+# Modules already audited by this process. config-changed also runs the
+# decorated config-changed-postupgrade so the second pass is skipped.
+__AUDITED__ = set()
+
+
+def _path_state(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime, st.st_size, st.st_mode, st.st_uid, st.st_gid]
+
+
+def _sysctl_state(key):
+    try:
+        with open(os.path.join(SYSCTL_ROOT, key.replace('.', '/'))) as f:
+            return f.read().strip()
+    except IOError:
+        return None
+
+
+def audit_fingerprint(module):
+    """Fingerprint the effective settings, audited paths and live kernel
+    parameters of a module.
+
+    :param module: hardening module name e.g. 'os'
+    :returns: hex digest string
+    """
+    paths = {}
+    for path in AUDITED_PATHS.get(module, []):
+        paths[path] = _path_state(path)
+        if os.path.isdir(path):
+            for entry in os.listdir(path):
+                entry = os.path.join(path, entry)
+                paths[entry] = _path_state(entry)
+    sysctls = dict((key, _sysctl_state(key))
+                   for key in AUDITED_SYSCTLS.get(module, []))
+    state = json.dumps({'settings': get_settings(module), 'paths': paths,
+                        'sysctls': sysctls},
+                       sort_keys=True, default=str)
+    return hashlib.sha256(state.encode('utf-8')).hexdigest()
+
+
+def run_module(module, hardener):
+    """Run a hardening module unless its inputs are unchanged since the last
+    audit and the last audit is recent enough.
+
+    :param module: hardening module name e.g. 'os'
+    :param hardener: function running the module's checks
+    :returns: True if the module's checks were run
+    """
+    if module in __AUDITED__:
+        log("Hardening module '%s' already run by this hook - skipping" %
+            (module), level=DEBUG)
+        return False
+
+    kv = unitdata.kv()
+    audits = kv.get(AUDIT_CACHE_KEY) or {}
+    previous = audits.get(module) or {}
+    now = time.time()
+    if (previous.get('fingerprint') == audit_fingerprint(module) and
+            now - previous.get('audited-at', 0) < AUDIT_REFRESH_INTERVAL):
+        log("Hardening module '%s' inputs unchanged since last audit - "
+            "skipping" % (module), level=DEBUG)
+        __AUDITED__.add(module)
+        return False
+
+    log("Executing hardening module '%s'" % (hardener.__name__), level=DEBUG)
+    hardener()
+    log("Hardening module '%s' completed in %.2fs" %
+        (module, time.time() - now), level=INFO)
+    # Fingerprint after the audit so that its own fixes don't invalidate it.
+    audits[module] = {'fingerprint': audit_fingerprint(module),
+                      'audited-at': now}
+    kv.set(AUDIT_CACHE_KEY, audits)
+    kv.flush()
+    __AUDITED__.add(module)
+    return True
+
 
 def harden(overrides=None):
     """Hardening decorator.
@@ -41,7 +153,9 @@ def harden(overrides=None):
     such that hardening modules are called multiple times. This is because
     subsequent calls will perform auditing checks that will report any changes
     to resources hardened by the first run (and possibly perform compliance
-    actions as a result of any detected infractions).
+    actions as a result of any detected infractions). A module is run at most
+    once per hook and is skipped while its settings and audited paths are
+    unchanged, up to AUDIT_REFRESH_INTERVAL after its last run.
 
     :param overrides: Optional list of stack modules used to override those
                       provided with 'harden' config.
@@ -63,16 +177,14 @@ def harden(overrides=None):
                 for module, func in six.iteritems(RUN_CATALOG):
                     if module in enabled:
                         enabled.remove(module)
-                        modules_to_run.append(func)
+                        modules_to_run.append((module, func))
 
                 if enabled:
                     log("Unknown hardening modules '%s' - ignoring" %
                         (', '.join(enabled)), level=WARNING)
 
-                for hardener in modules_to_run:
-                    log("Executing hardening module '%s'" %
-                        (hardener.__name__), level=DEBUG)
-                    hardener()
+                for module, hardener in modules_to_run:
+                    run_module(module, hardener)
             else:
                 log("No hardening applied to '%s'" % (f.__name__), level=DEBUG)
 
@@ -16,6 +16,7 @@ from charmhelpers.core.hookenv import (
     log,
     DEBUG,
 )
+from charmhelpers.contrib.hardening.audits import run_audits
 from charmhelpers.contrib.hardening.host.checks import (
     apt,
     limits,
@@ -41,8 +42,6 @@ def run_os_checks():
     checks.extend(suid_sgid.get_audits())
     checks.extend(sysctl.get_audits())
 
-    for check in checks:
-        log("Running '%s' check" % (check.__class__.__name__), level=DEBUG)
-        check.ensure_compliance()
+    run_audits(checks, 'OS')
 
     log("OS hardening checks complete.", level=DEBUG)
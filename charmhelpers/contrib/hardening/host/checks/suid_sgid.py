@@ -12,10 +12,25 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import subprocess
+import json
+import os
+import stat
+import time
+
+from multiprocessing.pool import ThreadPool
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
 
 from charmhelpers.core.hookenv import (
+    charm_dir,
     log,
+    DEBUG,
     INFO,
 )
 from charmhelpers.contrib.hardening.audits.file import NoSUIDSGIDAudit
@@ -71,6 +86,25 @@ WHITELIST = ['/bin/mount', '/bin/ping', '/bin/su', '/bin/umount',
              '/usr/lib/libvte9/gnome-pty-helper',
              '/usr/lib/libvte-2.90-9/gnome-pty-helper']
 
+# Filesystems never descended into by find_paths_with_suid_sgid. Kernel
+# filesystems cannot hold sgid files created by users, and walking network
+# filesystems can hang the hook on an unreachable server and put load on
+# storage shared with other hosts, which audit their own files.
+PRUNE_FSTYPES = ['binfmt_misc', 'bpf', 'cgroup', 'cgroup2', 'configfs',
+                 'debugfs', 'devpts', 'fusectl', 'mqueue', 'nsfs', 'proc',
+                 'pstore', 'rpc_pipefs', 'securityfs', 'sysfs', 'tracefs',
+                 '9p', 'afs', 'ceph', 'cifs', 'fuse.ceph', 'fuse.glusterfs',
+                 'fuse.s3fs', 'fuse.sshfs', 'glusterfs', 'lustre', 'nfs',
+                 'nfs4', 'smb3', 'smbfs', 'sshfs']
+
+SUID_SGID_INDEX = '.hardening-suid-sgid-index.json'
+# Bumped whenever the layout of the index changes so older ones are ignored.
+SUID_SGID_INDEX_VERSION = 2
+# Directories are only re-listed when their inode or mtime changes, which
+# misses a chmod of an existing file, so rescan everything this often.
+FULL_RESCAN_INTERVAL = 24 * 60 * 60
+SCAN_THREADS = 4
+
 
 def get_audits():
     """Get OS hardening suid/sgid audits.
@@ -115,15 +149,170 @@ def get_audits():
     return checks
 
 
+def pruned_mounts(mounts='/proc/mounts'):
+    """Return the mount points of pseudo and network filesystems."""
+    pruned = set()
+    try:
+        with open(mounts) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                fstype = fields[2]
+                if fstype in PRUNE_FSTYPES:
+                    pruned.add(fields[1].replace('\\040', ' '))
+    except IOError:
+        pruned.add('/proc')
+    return pruned
+
+
+# The scan reports what the original find expression did:
+#   find <root> -perm -4000 -o -perm -2000 -type f ! -path '/proc/*' -print
+# -print only applies to the -perm -2000 branch, which is not evaluated for
+# suid paths, so only regular files which are sgid but not suid are reported.
+def _is_match(mode):
+    return (stat.S_ISREG(mode) and
+            mode & (stat.S_ISUID | stat.S_ISGID) == stat.S_ISGID)
+
+
+def _is_suid_sgid(path):
+    try:
+        return _is_match(os.lstat(path).st_mode)
+    except OSError:
+        return False
+
+
+def _list_dir(path):
+    """Return (subdirectories, matching files) of path, by name."""
+    subdirs = []
+    found = []
+    try:
+        if scandir:
+            for entry in scandir(path):
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                elif (entry.is_file(follow_symlinks=False) and
+                        _is_match(entry.stat(follow_symlinks=False).st_mode)):
+                    found.append(entry.name)
+        else:
+            for name in os.listdir(path):
+                try:
+                    mode = os.lstat(os.path.join(path, name)).st_mode
+                except OSError:
+                    continue
+                if stat.S_ISDIR(mode):
+                    subdirs.append(name)
+                elif _is_match(mode):
+                    found.append(name)
+    except OSError:
+        pass
+    return subdirs, found
+
+
+def _children(dirs):
+    """Map each indexed directory to the names of its indexed children."""
+    children = {}
+    for path in dirs:
+        children.setdefault(os.path.dirname(path), []).append(
+            os.path.basename(path))
+    return children
+
+
+def _scan_tree(top, previous, children, pruned, full):
+    """Walk top, re-listing only directories changed since previous.
+
+    An unchanged directory's subdirectories are its children in previous.
+
+    :returns: (index, found) where index maps each directory to
+              [inode, mtime] followed by its matching files, if any
+    """
+    index = {}
+    found = set()
+    stack = [top]
+    while stack:
+        path = stack.pop()
+        if path in pruned:
+            continue
+        try:
+            st = os.lstat(path)
+        except OSError:
+            continue
+        entry = previous.get(path)
+        if (not full and entry and entry[0] == st.st_ino and
+                entry[1] == st.st_mtime):
+            subdirs = children.get(path, [])
+            files = [name for name in entry[2:]
+                     if _is_suid_sgid(os.path.join(path, name))]
+        else:
+            subdirs, files = _list_dir(path)
+        index[path] = [st.st_ino, st.st_mtime] + files
+        found.update(os.path.join(path, name) for name in files)
+        stack.extend(os.path.join(path, name) for name in subdirs)
+    return index, found
+
+
+def _index_path():
+    return os.path.join(charm_dir() or '', SUID_SGID_INDEX)
+
+
+def _load_index(root_path):
+    try:
+        with open(_index_path()) as f:
+            index = json.load(f)
+    except (IOError, ValueError):
+        return {}
+    if (index.get('version') != SUID_SGID_INDEX_VERSION or
+            index.get('root') != root_path):
+        return {}
+    return index
+
+
+def _save_index(index):
+    try:
+        with open(_index_path(), 'w') as f:
+            json.dump(index, f, separators=(',', ':'))
+    except IOError as e:
+        log("Unable to save suid/sgid index: %s" % (e), level=INFO)
+
+
 def find_paths_with_suid_sgid(root_path):
     """Finds all paths/files which have an suid/sgid bit enabled.
 
-    Starting with the root_path, this will recursively find all paths which
-    have an suid or sgid bit set.
+    Starting with the root_path, this will recursively find all regular
+    files which have the sgid but not the suid bit set. Kernel pseudo and
+    network filesystems are not descended into and each top level directory
+    is walked in its own thread.
+    Directory state is kept between runs so that only directories whose
+    inode or mtime changed are re-listed, with a full rescan every
+    FULL_RESCAN_INTERVAL.
     """
-    cmd = ['find', root_path, '-perm', '-4000', '-o', '-perm', '-2000',
-           '-type', 'f', '!', '-path', '/proc/*', '-print']
+    start = time.time()
+    root_path = os.path.abspath(root_path)
+    previous = _load_index(root_path)
+    full = start - previous.get('scanned-at', 0) >= FULL_RESCAN_INTERVAL
+    dirs = previous.get('dirs', {})
+    children = _children(dirs)
+    pruned = pruned_mounts() - set([root_path])
+
+    subdirs, files = _list_dir(root_path)
+    found = set(os.path.join(root_path, name) for name in files)
+    index = {}
+    pool = ThreadPool(SCAN_THREADS)
+    try:
+        results = pool.map(
+            lambda top: _scan_tree(top, dirs, children, pruned, full),
+            [os.path.join(root_path, name) for name in subdirs])
+    finally:
+        pool.close()
+        pool.join()
+    for tree_index, tree_found in results:
+        index.update(tree_index)
+        found.update(tree_found)
 
-    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    out, _ = p.communicate()
-    return set(out.split('\n'))
+    _save_index({'version': SUID_SGID_INDEX_VERSION,
+                 'root': root_path, 'dirs': index,
+                 'scanned-at': start if full else previous['scanned-at']})
+    log("Found %d sgid paths under '%s' in %.2fs (%s scan)" %
+        (len(found), root_path, time.time() - start,
+         'full' if full else 'incremental'), level=DEBUG)
+    return found
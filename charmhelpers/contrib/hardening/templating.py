@@ -34,6 +34,11 @@ except ImportError:
     from jinja2 import FileSystemLoader, Environment
 
 
+# Template environments by directory, so that templates shared by several
+# audits are loaded and compiled once.
+_environments = {}
+
+
 # NOTE: function separated from main rendering code to facilitate easier
 #       mocking in unit tests.
 def write(path, data):
@@ -59,7 +64,10 @@ def render_and_write(template_dir, path, context):
     :param path: the path to write the templated contents to
     :param context: the parameters to pass to the rendering engine
     """
-    env = Environment(loader=FileSystemLoader(template_dir))
+    if template_dir not in _environments:
+        _environments[template_dir] = Environment(
+            loader=FileSystemLoader(template_dir))
+    env = _environments[template_dir]
     template_file = os.path.basename(path)
     template = env.get_template(template_file)
     log('Rendering from template: %s' % template.name, level=DEBUG)
@@ -56,6 +56,36 @@ except ImportError:
     import netaddr
 
 
+# Per-hook memo of network lookups that shell out to network-get or scan
+# interfaces. Network configuration does not change during a hook so each
+# distinct lookup is performed once; see clear_network_cache().
+_network_lookups = {}
+
+
+def memoize_lookup(func, *args):
+    """Return func(*args), performing the lookup at most once per hook.
+
+    NotImplementedError and NoNetworkBinding are memoized too, so that
+    unsupported or missing bindings are only queried once.
+    """
+    key = (func,) + tuple(
+        tuple(a) if isinstance(a, list) else a for a in args)
+    if key not in _network_lookups:
+        try:
+            _network_lookups[key] = (func(*args), None)
+        except (NotImplementedError, NoNetworkBinding) as e:
+            _network_lookups[key] = (None, e)
+    result, exc = _network_lookups[key]
+    if exc is not None:
+        raise exc
+    return result
+
+
+def clear_network_cache():
+    """Invalidate memoized network lookups, e.g. after a binding change."""
+    _network_lookups.clear()
+
+
 def _validate_cidr(network):
     try:
         netaddr.IPNetwork(network)
@@ -177,6 +207,59 @@ def is_address_in_network(network, address):
         return False
 
 
+class AddressIndex(object):
+    """Addresses parsed once and indexed by the networks they fall in.
+
+    Lookups against a network parse the CIDR once and remember the
+    matching addresses, so checking the same set of addresses against
+    several networks (or the same network repeatedly) does not re-parse
+    anything.
+
+    :param addresses: list of IPv4/IPv6 addresses. Entries that are not
+        addresses (e.g. hostnames) are kept but never match a network.
+    """
+
+    def __init__(self, addresses):
+        self.addresses = list(addresses)
+        self._parsed = []
+        for address in self.addresses:
+            try:
+                self._parsed.append((address, netaddr.IPAddress(address)))
+            except (netaddr.core.AddrFormatError, ValueError):
+                self._parsed.append((address, None))
+        self._by_network = {}
+
+    def __iter__(self):
+        return iter(self.addresses)
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def is_ipv6(self, address):
+        """Determine whether an indexed address is IPv6."""
+        for candidate, parsed in self._parsed:
+            if candidate == address:
+                return parsed is not None and parsed.version == 6
+        return is_ipv6(address)
+
+    def in_network(self, network):
+        """Returns the indexed addresses within network, in index order.
+
+        :param network (str): CIDR presentation format.
+        :raises ValueError: if network is not in CIDR presentation format.
+        """
+        if network not in self._by_network:
+            try:
+                parsed_network = netaddr.IPNetwork(network)
+            except (netaddr.core.AddrFormatError, ValueError):
+                raise ValueError("Network (%s) is not in CIDR presentation "
+                                 "format" % network)
+            self._by_network[network] = [
+                address for address, parsed in self._parsed
+                if parsed is not None and parsed in parsed_network]
+        return list(self._by_network[network])
+
+
 def _get_for_address(address, key):
     """Retrieve an attribute of or the physical interface that
     the IP address provided could be bound to.
@@ -580,23 +663,23 @@ def get_relation_ip(interface, cidr_network=None):
     # For possible use as a fallback bellow with get_address_in_network
     try:
         # Get the interface specific IP
-        address = network_get_primary_address(interface)
+        address = memoize_lookup(network_get_primary_address, interface)
     except NotImplementedError:
         # If network-get is not available
-        address = get_host_ip(unit_get('private-address'))
+        address = memoize_lookup(get_host_ip, unit_get('private-address'))
     except NoNetworkBinding:
         log("No network binding for {}".format(interface), WARNING)
-        address = get_host_ip(unit_get('private-address'))
+        address = memoize_lookup(get_host_ip, unit_get('private-address'))
 
     if config('prefer-ipv6'):
         # Currently IPv6 has priority, eventually we want IPv6 to just be
         # another network space.
         assert_charm_supports_ipv6()
-        return get_ipv6_addr()[0]
+        return memoize_lookup(get_ipv6_addr)[0]
     elif cidr_network:
         # If a specific CIDR network is passed get the address from that
         # network.
-        return get_address_in_network(cidr_network, address)
+        return memoize_lookup(get_address_in_network, cidr_network, address)
 
     # Return the interface address
     return address
@@ -14,11 +14,13 @@
 
 # Common python helper functions used for OpenStack charm certificats.
 
+import hashlib
 import os
 import json
 
 from charmhelpers.contrib.network.ip import (
     get_hostname,
+    memoize_lookup,
     resolve_network_cidr,
 )
 from charmhelpers.core.hookenv import (
@@ -45,6 +47,7 @@ from charmhelpers.core.host import (
 )
 
 from charmhelpers.contrib.hahelpers.apache import (
+    CA_CERT_PATH,
     install_ca_cert
 )
 
@@ -77,7 +80,7 @@ class CertRequest(object):
         # If a vip is being used without os-hostname config or
         # network spaces then we need to ensure the local units
         # cert has the approriate vip in the SAN list
-        vip = get_vip_in_network(resolve_network_cidr(ip))
+        vip = get_vip_in_network(memoize_lookup(resolve_network_cidr, ip))
         if vip:
             addresses.append(vip)
         self.hostname_entry = {
@@ -120,10 +123,10 @@ def get_certificate_request(json_encode=True):
         net_config = config(ADDRESS_MAP[net_type]['override'])
         try:
             net_addr = resolve_address(endpoint_type=net_type)
-            ip = network_get_primary_address(
-                ADDRESS_MAP[net_type]['binding'])
+            ip = memoize_lookup(network_get_primary_address,
+                                ADDRESS_MAP[net_type]['binding'])
             addresses = [net_addr, ip]
-            vip = get_vip_in_network(resolve_network_cidr(ip))
+            vip = get_vip_in_network(memoize_lookup(resolve_network_cidr, ip))
             if vip:
                 addresses.append(vip)
             if net_config:
@@ -154,7 +157,10 @@ def create_ip_cert_links(ssl_dir, custom_hostname_link=None):
     hostname_key = os.path.join(
         ssl_dir,
         'key_{}'.format(hostname))
-    # Add links to hostname cert, used if os-hostname vars not set
+    # Add links to hostname cert, used if os-hostname vars not set. Vips
+    # are matched to networks through the per-hook vip index used by
+    # resolve_address, so several endpoint types sharing a network are
+    # only resolved against it once.
     for net_type in [INTERNAL, ADMIN, PUBLIC]:
         try:
             addr = resolve_address(endpoint_type=net_type)
@@ -178,14 +184,39 @@ def create_ip_cert_links(ssl_dir, custom_hostname_link=None):
             os.symlink(hostname_key, custom_key)
 
 
+def _file_digest(path):
+    """Return the sha256 digest of path, or None if it does not exist."""
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _write_if_changed(path, content, perms=0o640):
+    """Write content to path unless the file already holds it.
+
+    :returns: True if the file was written.
+    """
+    data = content.encode('utf-8') if not isinstance(content, bytes) \
+        else content
+    if _file_digest(path) == hashlib.sha256(data).hexdigest():
+        return False
+    write_file(path=path, content=content, perms=perms)
+    return True
+
+
 def install_certs(ssl_dir, certs, chain=None):
     """Install the certs passed into the ssl dir and append the chain if
        provided.
 
+    Files which already hold the supplied content are left untouched.
+
     :param ssl_dir: str Directory to create symlinks in
     :param certs: {} {'cn': {'cert': 'CERT', 'key': 'KEY'}}
     :param chain: str Chain to be appended to certs
+    :returns: [] List of files written
     """
+    written = []
     for cn, bundle in certs.items():
         cert_filename = 'cert_{}'.format(cn)
         key_filename = 'key_{}'.format(cn)
@@ -194,12 +225,12 @@ def install_certs(ssl_dir, certs, chain=None):
             # Append chain file so that clients that trust the root CA will
             # trust certs signed by an intermediate in the chain
             cert_data = cert_data + chain
-        write_file(
-            path=os.path.join(ssl_dir, cert_filename),
-            content=cert_data, perms=0o640)
-        write_file(
-            path=os.path.join(ssl_dir, key_filename),
-            content=bundle['key'], perms=0o640)
+        for filename, content in ((cert_filename, cert_data),
+                                  (key_filename, bundle['key'])):
+            path = os.path.join(ssl_dir, filename)
+            if _write_if_changed(path, content, perms=0o640):
+                written.append(path)
+    return written
 
 
 def process_certificates(service_name, relation_id, unit,
@@ -210,6 +241,7 @@ def process_certificates(service_name, relation_id, unit,
     :param relation_id: str Relation id providing the certs
     :param unit: str Unit providing the certs
     :param custom_hostname_link: str Name of custom link to create
+    :returns: bool True if any certificate or the CA changed on disk
     """
     data = relation_get(rid=relation_id, unit=unit)
     ssl_dir = os.path.join('/etc/apache2/ssl/', service_name)
@@ -218,10 +250,15 @@ def process_certificates(service_name, relation_id, unit,
     certs = data.get('{}.processed_requests'.format(name))
     chain = data.get('chain')
     ca = data.get('ca')
+    changed = False
     if certs:
         certs = json.loads(certs)
+        ca_digest = _file_digest(CA_CERT_PATH)
         install_ca_cert(ca.encode())
-        install_certs(ssl_dir, certs, chain)
+        changed = ca_digest != _file_digest(CA_CERT_PATH)
+        if install_certs(ssl_dir, certs, chain):
+            changed = True
         create_ip_cert_links(
             ssl_dir,
             custom_hostname_link=custom_hostname_link)
+    return changed
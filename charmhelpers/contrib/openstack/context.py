@@ -74,6 +74,8 @@ from charmhelpers.contrib.hahelpers.apache import (
     get_ca_cert,
     install_ca_cert,
 )
+# CA_CERT_PATH is kept importable from this module.
+from charmhelpers.contrib.hahelpers.apache import CA_CERT_PATH  # noqa: F401
 from charmhelpers.contrib.openstack.neutron import (
     neutron_plugin_attribute,
     parse_data_port_mappings,
@@ -113,7 +115,6 @@ except ImportError:
         apt_install('python3-psutil', fatal=True)
     import psutil
 
-CA_CERT_PATH = '/usr/local/share/ca-certificates/keystone_juju_ca_cert.crt'
 ADDRESS_TYPES = ['admin', 'internal', 'public']
 HAPROXY_RUN_DIR = '/var/run/haproxy/'
 
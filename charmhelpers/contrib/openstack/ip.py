@@ -14,15 +14,18 @@
 
 from charmhelpers.core.hookenv import (
     config,
+    log,
     unit_get,
     service_name,
     network_get_primary_address,
+    DEBUG,
 )
 from charmhelpers.contrib.network.ip import (
+    AddressIndex,
     get_address_in_network,
-    is_address_in_network,
     is_ipv6,
     get_ipv6_addr,
+    memoize_lookup,
     resolve_network_cidr,
 )
 from charmhelpers.contrib.hahelpers.cluster import is_clustered
@@ -59,6 +62,31 @@ ADDRESS_MAP = {
     },
 }
 
+# AddressIndex instances keyed by the vip string they were built from.
+_vip_indexes = {}
+
+
+def vip_index(vips=None):
+    """Returns an AddressIndex of the configured vip(s).
+
+    The index is built once per hook for each distinct vip string so that
+    matching vips against networks only parses each vip and network once.
+
+    :param vips: space separated vip string, defaults to config('vip')
+    """
+    if vips is None:
+        vips = config('vip')
+    vips = vips or ''
+    if vips not in _vip_indexes:
+        _vip_indexes[vips] = AddressIndex(vips.split())
+    return _vip_indexes[vips]
+
+
+def _trace(endpoint_type, address, reason):
+    """Log why an address was chosen for endpoint_type."""
+    log('Resolved {} address to {} ({})'.format(endpoint_type, address,
+                                                reason), level=DEBUG)
+
 
 def canonical_url(configs, endpoint_type=PUBLIC):
     """Returns the correct HTTP URL to this host given the state of HTTPS
@@ -122,6 +150,9 @@ def resolve_address(endpoint_type=PUBLIC, override=True):
     If not clustered, return unit address ensuring address is on configured net
     split if one is configured, or a Juju 2.0 extra-binding has been used.
 
+    Binding addresses, interface scans and CIDR lookups are memoized for
+    the duration of the hook so repeated calls are answered from memory.
+
     :param endpoint_type: Network endpoing type
     :param override: Accept hostname overrides or not
     """
@@ -129,11 +160,10 @@ def resolve_address(endpoint_type=PUBLIC, override=True):
     if override:
         resolved_address = _get_address_override(endpoint_type)
         if resolved_address:
+            _trace(endpoint_type, resolved_address, 'override')
             return resolved_address
 
-    vips = config('vip')
-    if vips:
-        vips = vips.split()
+    vips = vip_index().addresses
 
     net_type = ADDRESS_MAP[endpoint_type]['config']
     net_addr = config(net_type)
@@ -143,54 +173,61 @@ def resolve_address(endpoint_type=PUBLIC, override=True):
 
     if clustered and vips:
         if net_addr:
-            for vip in vips:
-                if is_address_in_network(net_addr, vip):
-                    resolved_address = vip
-                    break
+            matching = vip_index().in_network(net_addr)
+            if matching:
+                resolved_address = matching[0]
+                reason = 'vip in {}'.format(net_addr)
         else:
             # NOTE: endeavour to check vips against network space
             #       bindings
             try:
-                bound_cidr = resolve_network_cidr(
-                    network_get_primary_address(binding)
+                bound_cidr = memoize_lookup(
+                    resolve_network_cidr,
+                    memoize_lookup(network_get_primary_address, binding)
                 )
-                for vip in vips:
-                    if is_address_in_network(bound_cidr, vip):
-                        resolved_address = vip
-                        break
+                matching = vip_index().in_network(bound_cidr)
+                if matching:
+                    resolved_address = matching[0]
+                    reason = 'vip in {} binding {}'.format(binding,
+                                                           bound_cidr)
             except NotImplementedError:
                 # If no net-splits configured and no support for extra
                 # bindings/network spaces so we expect a single vip
                 resolved_address = vips[0]
+                reason = 'primary vip'
     else:
         if config('prefer-ipv6'):
-            fallback_addr = get_ipv6_addr(exc_list=vips)[0]
+            fallback_addr = memoize_lookup(get_ipv6_addr, None, False, True,
+                                           vips or None)[0]
         else:
             fallback_addr = unit_get(net_fallback)
 
         if net_addr:
-            resolved_address = get_address_in_network(net_addr, fallback_addr)
+            resolved_address = memoize_lookup(get_address_in_network,
+                                              net_addr, fallback_addr)
+            reason = 'unit address in {}'.format(net_addr)
         else:
             # NOTE: only try to use extra bindings if legacy network
             #       configuration is not in use
             try:
-                resolved_address = network_get_primary_address(binding)
+                resolved_address = memoize_lookup(
+                    network_get_primary_address, binding)
+                reason = '{} binding'.format(binding)
             except NotImplementedError:
                 resolved_address = fallback_addr
+                reason = 'fallback {}'.format(net_fallback)
 
     if resolved_address is None:
         raise ValueError("Unable to resolve a suitable IP address based on "
                          "charm state and configuration. (net_type=%s, "
                          "clustered=%s)" % (net_type, clustered))
 
+    _trace(endpoint_type, resolved_address, reason)
     return resolved_address
 
 
 def get_vip_in_network(network):
-    matching_vip = None
-    vips = config('vip')
-    if vips:
-        for vip in vips.split():
-            if is_address_in_network(network, vip):
-                matching_vip = vip
-    return matching_vip
+    matching = vip_index().in_network(network)
+    if matching:
+        return matching[-1]
+    return None
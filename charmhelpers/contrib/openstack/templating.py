@@ -19,6 +19,7 @@ import six
 from charmhelpers.fetch import apt_install, apt_update
 from charmhelpers.core.hookenv import (
     log,
+    DEBUG,
     ERROR,
     INFO,
     TRACE
@@ -94,7 +95,8 @@ class OSConfigTemplate(object):
     Responsible for constructing a template context based on those generators.
     """
 
-    def __init__(self, config_file, contexts, config_template=None):
+    def __init__(self, config_file, contexts, config_template=None,
+                 post_render=None):
         self.config_file = config_file
 
         if hasattr(contexts, '__call__'):
@@ -105,6 +107,7 @@ class OSConfigTemplate(object):
         self._complete_contexts = []
 
         self.config_template = config_template
+        self.post_render = post_render
 
     def context(self):
         ctxt = {}
@@ -230,7 +233,8 @@ class OSConfigRenderer(object):
             else:
                 apt_install('python3-jinja2')
 
-    def register(self, config_file, contexts, config_template=None):
+    def register(self, config_file, contexts, config_template=None,
+                 post_render=None):
         """
         Register a config file with a list of context generators to be called
         during rendering.
@@ -239,11 +243,14 @@ class OSConfigRenderer(object):
         :param config_file (str): a path where a config file will be rendered
         :param contexts (list): a list of context dictionaries with kv pairs
         :param config_template (str): an optional template string to use
+        :param post_render (callable): an optional function taking and
+                                       returning the rendered string
         """
         self.templates[config_file] = OSConfigTemplate(
             config_file=config_file,
             contexts=contexts,
-            config_template=config_template
+            config_template=config_template,
+            post_render=post_render
         )
         log('Registered config file: {}'.format(config_file),
             level=INFO)
@@ -308,7 +315,10 @@ class OSConfigRenderer(object):
 
             log('Rendering from template: {}'.format(config_file),
                 level=INFO)
-        return template.render(ctxt)
+        _out = template.render(ctxt)
+        if ostmpl.post_render:
+            _out = ostmpl.post_render(_out)
+        return _out
 
     def write(self, config_file):
         """
@@ -322,6 +332,16 @@ class OSConfigRenderer(object):
         if six.PY3:
             _out = _out.encode('UTF-8')
 
+        # Leave an unchanged file alone so its mtime, which some services
+        # watch to reload, is only bumped on a real change.
+        try:
+            with open(config_file, 'rb') as current:
+                if current.read() == _out:
+                    log('Template %s unchanged.' % config_file, level=DEBUG)
+                    return
+        except IOError:
+            pass
+
         with open(config_file, 'wb') as out:
             out.write(_out)
 
@@ -63,25 +63,25 @@ from charmhelpers.contrib.storage.linux.lvm import (
 from charmhelpers.contrib.network.ip import (
     get_ipv6_addr,
     is_ipv6,
-    port_has_listener,
 )
 
 from charmhelpers.core.host import (
     lsb_release,
     mounts,
     umount,
-    service_running,
+    listening_ports,
+    services_running,
     service_pause,
     service_resume,
     restart_on_change_helper,
 )
 from charmhelpers.fetch import (
-    apt_cache,
     import_key as fetch_import_key,
     add_source as fetch_add_source,
     SourceConfigError,
     GPGKeyError,
-    get_upstream_version
+    get_upstream_version,
+    installed_version,
 )
 
 from charmhelpers.fetch.snap import (
@@ -403,29 +403,16 @@ def get_os_codename_package(package, fatal=True):
                 # Second item in list is Version
                 return line.split()[1]
 
-    import apt_pkg as apt
-
-    cache = apt_cache()
-
-    try:
-        pkg = cache[package]
-    except Exception:
-        if not fatal:
-            return None
-        # the package is unknown to the current apt cache.
-        e = 'Could not determine version of package with no installation '\
-            'candidate: %s' % package
-        error_out(e)
-
-    if not pkg.current_ver:
+    installed = installed_version(package)
+    if not installed:
         if not fatal:
             return None
-        # package is known, but no version is currently installed.
+        # package is unknown or no version is currently installed.
         e = 'Could not determine version of uninstalled package: %s' % package
         error_out(e)
 
-    vers = apt.upstream_version(pkg.current_ver.ver_str)
-    if 'swift' in pkg.name:
+    vers = get_upstream_version(package)
+    if 'swift' in package:
         # Fully x.y.z match for swift versions
         match = re.match('^(\d+)\.(\d+)\.(\d+)', vers)
     else:
@@ -446,7 +433,7 @@ def get_os_codename_package(package, fatal=True):
     else:
         # < Liberty co-ordinated project versions
         try:
-            if 'swift' in pkg.name:
+            if 'swift' in package:
                 return get_swift_codename(vers)
             else:
                 return OPENSTACK_CODENAMES[vers]
@@ -1045,8 +1032,9 @@ def _check_running_services(services):
     @returns [(service, boolean), ...], : results for checks
              [boolean]                  : just the result of the service checks
     """
-    services_running = [service_running(s) for s in services]
-    return list(zip(services, services_running)), services_running
+    states = services_running(list(services))
+    running = [states[s] for s in services]
+    return list(zip(services, running)), running
 
 
 def _check_listening_on_services_ports(services, test=False):
@@ -1063,7 +1051,8 @@ def _check_listening_on_services_ports(services, test=False):
     """
     test = not(not(test))  # ensure test is True or False
     all_ports = list(itertools.chain(*services.values()))
-    ports_states = [port_has_listener('0.0.0.0', p) for p in all_ports]
+    listening = listening_ports()
+    ports_states = [int(p) in listening for p in all_ports]
     map_ports = OrderedDict()
     matched_ports = [p for p, opened in zip(all_ports, ports_states)
                      if opened == test]  # essentially opened xor test
@@ -1083,7 +1072,8 @@ def _check_listening_on_ports_list(ports):
     @param ports: LIST or port numbers.
     @returns [(port_num, boolean), ...], [boolean]
     """
-    ports_open = [port_has_listener('0.0.0.0', p) for p in ports]
+    listening = listening_ports()
+    ports_open = [int(p) in listening for p in ports]
     return zip(ports, ports_open), ports_open
 
 
@@ -1290,8 +1280,45 @@ def is_unit_paused_set():
         return False
 
 
+def _control_services(func, services, tiers=None):
+    """Apply func (e.g. service_pause) to services, tier by tier.
+
+    Services within a tier are independent of each other and are handled
+    concurrently; a tier is only started once the previous one finished.
+    Services not named in any tier are handled one at a time afterwards.
+
+    @param func: f(service_name) -> bool success
+    @param services: list of service names
+    @param tiers: OPTIONAL list of lists of service names, in order
+    @returns list of service names for which func failed
+    """
+    from multiprocessing.pool import ThreadPool
+
+    remaining = list(services)
+    ordered = []
+    for tier in tiers or []:
+        group = [s for s in tier if s in remaining]
+        if group:
+            ordered.append(group)
+            remaining = [s for s in remaining if s not in group]
+    ordered.extend([s] for s in remaining)
+
+    failed = []
+    for group in ordered:
+        if len(group) == 1:
+            results = [func(group[0])]
+        else:
+            pool = ThreadPool(len(group))
+            try:
+                results = pool.map(func, group)
+            finally:
+                pool.terminate()
+        failed.extend(s for s, ok in zip(group, results) if not ok)
+    return failed
+
+
 def pause_unit(assess_status_func, services=None, ports=None,
-               charm_func=None):
+               charm_func=None, tiers=None):
     """Pause a unit by stopping the services and setting 'unit-paused'
     in the local kv() store.
 
@@ -1317,16 +1344,18 @@ def pause_unit(assess_status_func, services=None, ports=None,
     @param services: OPTIONAL see above
     @param ports: OPTIONAL list of port
     @param charm_func: function to run for custom charm pausing.
+    @param tiers: OPTIONAL list of lists of services in start order; tiers
+                  are stopped in reverse order, each tier concurrently.
     @returns None
     @raises Exception(message) on an error for action_fail().
     """
     services = _extract_services_list_helper(services)
     messages = []
     if services:
-        for service in services.keys():
-            stopped = service_pause(service)
-            if not stopped:
-                messages.append("{} didn't stop cleanly.".format(service))
+        for service in _control_services(
+                service_pause, list(services.keys()),
+                list(reversed(tiers)) if tiers else None):
+            messages.append("{} didn't stop cleanly.".format(service))
     if charm_func:
         try:
             message = charm_func()
@@ -1344,7 +1373,7 @@ def pause_unit(assess_status_func, services=None, ports=None,
 
 
 def resume_unit(assess_status_func, services=None, ports=None,
-                charm_func=None):
+                charm_func=None, tiers=None):
     """Resume a unit by starting the services and clearning 'unit-paused'
     in the local kv() store.
 
@@ -1369,16 +1398,17 @@ def resume_unit(assess_status_func, services=None, ports=None,
     @param services: OPTIONAL see above
     @param ports: OPTIONAL list of port
     @param charm_func: function to run for custom charm resuming.
+    @param tiers: OPTIONAL list of lists of services in start order, each
+                  tier is started concurrently.
     @returns None
     @raises Exception(message) on an error for action_fail().
     """
     services = _extract_services_list_helper(services)
     messages = []
     if services:
-        for service in services.keys():
-            started = service_resume(service)
-            if not started:
-                messages.append("{} didn't start cleanly.".format(service))
+        for service in _control_services(service_resume,
+                                         list(services.keys()), tiers):
+            messages.append("{} didn't start cleanly.".format(service))
     if charm_func:
         try:
             message = charm_func()
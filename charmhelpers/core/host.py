@@ -34,7 +34,7 @@ import six
 
 from contextlib import contextmanager
 from collections import OrderedDict
-from .hookenv import log, DEBUG, local_unit
+from .hookenv import atexit, log, DEBUG, local_unit
 from .fstab import Fstab
 from charmhelpers.osplatform import get_platform
 
@@ -261,9 +261,129 @@ def service(action, service_name, **kwargs):
         for key, value in six.iteritems(kwargs):
             parameter = '%s=%s' % (key, value)
             cmd.append(parameter)
+    if action not in _READ_ONLY_SERVICE_ACTIONS:
+        clear_status_probe_cache()
+    if action == 'restart':
+        cancel_restart(service_name)
     return subprocess.call(cmd) == 0
 
 
+# Restarts queued by request_restart(), by service name, with the function
+# to restart them.
+_requested_restarts = OrderedDict()
+
+
+def request_restart(service_name, restart_function=None):
+    """Restart a service once, when the hook completes.
+
+    Any number of requests for a service result in one restart, and none if
+    the service is restarted by other means later in the hook.
+
+    :param service_name: the service to restart
+    :param restart_function: optional function taking the service name to
+                             restart it with, default service('restart', ...)
+    """
+    if not _requested_restarts:
+        atexit(run_requested_restarts)
+    if service_name not in _requested_restarts:
+        log("Queued restart of %s" % service_name, level=DEBUG)
+        _requested_restarts[service_name] = restart_function
+
+
+def cancel_restart(service_name):
+    """Drop a queued restart of a service which has just been restarted."""
+    _requested_restarts.pop(service_name, None)
+
+
+def run_requested_restarts():
+    """Run the restarts queued by request_restart()."""
+    while _requested_restarts:
+        service_name, restart_function = _requested_restarts.popitem(
+            last=False)
+        if restart_function:
+            restart_function(service_name)
+        else:
+            service('restart', service_name)
+
+
+_READ_ONLY_SERVICE_ACTIONS = ('status', 'is-active', 'is-enabled')
+
+# Results of services_running() and listening_ports() for this hook. Any
+# service action which may change state invalidates them.
+_status_probe_cache = {}
+
+SERVICE_PROBE_TIMEOUT = 30
+SERVICE_PROBE_WORKERS = 8
+
+
+def clear_status_probe_cache():
+    """Forget cached service and listening port state."""
+    _status_probe_cache.clear()
+
+
+def services_running(service_names, timeout=SERVICE_PROBE_TIMEOUT):
+    """Determine whether each of the given services is running.
+
+    Services are checked concurrently and the whole check is bounded by
+    timeout; a service whose check has not completed in time is reported
+    as not running. Results are cached until a service is started, stopped
+    or restarted through service().
+
+    :param service_names: list of service names
+    :param timeout: seconds to wait for all checks to complete
+    :returns: OrderedDict of {service_name: bool}
+    """
+    from multiprocessing import TimeoutError
+    from multiprocessing.pool import ThreadPool
+    import time
+
+    cache = _status_probe_cache.setdefault('services', {})
+    pending = [s for s in OrderedDict.fromkeys(service_names)
+               if s not in cache]
+    if pending:
+        pool = ThreadPool(min(len(pending), SERVICE_PROBE_WORKERS))
+        try:
+            deadline = time.time() + timeout
+            checks = [(s, pool.apply_async(service_running, (s,)))
+                      for s in pending]
+            for service_name, check in checks:
+                try:
+                    running = check.get(max(0, deadline - time.time()))
+                except TimeoutError:
+                    log("Timed out checking whether {} is running"
+                        "".format(service_name), level=DEBUG)
+                    running = False
+                cache[service_name] = running
+        finally:
+            pool.terminate()
+    return OrderedDict((s, cache[s]) for s in service_names)
+
+
+def listening_ports():
+    """Return the set of local TCP ports with a listening socket.
+
+    Reads /proc/net/tcp and /proc/net/tcp6 once and caches the result
+    until a service changes state through service().
+
+    :returns: set of int port numbers
+    """
+    if 'ports' not in _status_probe_cache:
+        ports = set()
+        for path in ('/proc/net/tcp', '/proc/net/tcp6'):
+            try:
+                with open(path) as f:
+                    lines = f.readlines()[1:]
+            except IOError:
+                continue
+            for line in lines:
+                fields = line.split()
+                # st 0A is TCP_LISTEN
+                if len(fields) > 3 and fields[3] == '0A':
+                    ports.add(int(fields[1].rsplit(':', 1)[1], 16))
+        _status_probe_cache['ports'] = ports
+    return set(_status_probe_cache['ports'])
+
+
 _UPSTART_CONF = "/etc/init/{}.conf"
 _INIT_D_CONF = "/etc/init.d/{}"
 
@@ -738,6 +858,7 @@ def restart_on_change_helper(lambda_f, restart_map, stopstart=False,
         actions = ('stop', 'start') if stopstart else ('restart',)
         for service_name in services_list:
             if service_name in restart_functions:
+                cancel_restart(service_name)
                 restart_functions[service_name](service_name)
             else:
                 for action in actions:
@@ -156,8 +156,13 @@ import pprint
 import sqlite3
 import sys
 
+import six
+
 __author__ = 'Kapil Thangavelu <kapil.foss@gmail.com>'
 
+# Default number of hook revisions retained by HookData.
+DEFAULT_KEEP_REVISIONS = 500
+
 
 class Storage(object):
     """Simple key value database for local unit state within charms.
@@ -215,8 +220,9 @@ class Storage(object):
             names in the returned dict
         :return dict: A (possibly empty) dict of key-value mappings
         """
-        self.cursor.execute("select key, data from kv where key like ?",
-                            ['%s%%' % key_prefix])
+        clause, params = _prefix_clause(key_prefix)
+        self.cursor.execute("select key, data from kv where %s" % clause,
+                            params)
         result = self.cursor.fetchall()
 
         if not result:
@@ -264,8 +270,8 @@ class Storage(object):
                     'insert into kv_revisions values %s' % ','.join(['(?, ?, ?)'] * len(keys)),
                     list(itertools.chain.from_iterable((key, self.revision, json.dumps('DELETED')) for key in keys)))
         else:
-            self.cursor.execute('delete from kv where key like ?',
-                                ['%s%%' % prefix])
+            clause, params = _prefix_clause(prefix)
+            self.cursor.execute('delete from kv where %s' % clause, params)
             if self.revision and self.cursor.rowcount:
                 self.cursor.execute(
                     'insert into kv_revisions values (?, ?, ?)',
@@ -372,6 +378,25 @@ class Storage(object):
         else:
             self.flush()
 
+    def compact(self, keep_revisions=None, max_age=None):
+        """
+        Drop historical revisions according to a retention policy.
+
+        Current values in the kv table are never removed; only entries in
+        kv_revisions and the hooks they belong to are pruned. The revision
+        of an active hook scope is always retained. Freed pages are reused
+        by sqlite so the database stops growing once the policy is in
+        place.
+
+        :param int keep_revisions: Number of most recent hook revisions to
+            keep
+        :param int max_age: Maximum age, in seconds, of hook revisions to
+            keep
+        :return int: Number of hook revisions removed
+        """
+        return _compact(self.cursor, keep_revisions, max_age,
+                        exclude=self.revision)
+
     def flush(self, save=True):
         if save:
             self.conn.commit()
@@ -400,6 +425,17 @@ class Storage(object):
                hook text,
                date text
                )''')
+        # The kv primary key already serves prefix range scans over keys.
+        # Drop the covering index earlier versions created, which copied
+        # every value. Index revisions so that compaction does not need to
+        # scan the whole revision table.
+        self.cursor.execute('''
+            drop index if exists kv_key_data''')
+        self.cursor.execute('''
+            create index if not exists kv_revisions_revision
+            on kv_revisions (revision)''')
+        self.cursor.execute('''
+            create index if not exists hooks_date on hooks (date)''')
         self.conn.commit()
 
     def gethistory(self, key, deserialize=False):
@@ -422,6 +458,83 @@ class Storage(object):
         pprint.pprint(self.cursor.fetchall(), stream=fh)
 
 
+def _prefix_clause(prefix):
+    """Return a (clause, params) pair selecting keys starting with prefix.
+
+    A half-open range comparison is used rather than LIKE so that sqlite can
+    satisfy the query from the key index, and so that '_' and '%' in the
+    prefix are matched literally.
+    """
+    if not prefix:
+        return '1', []
+    upper = prefix[:-1] + six.unichr(ord(prefix[-1]) + 1)
+    return 'key >= ? and key < ?', [prefix, upper]
+
+
+def _compact(cursor, keep_revisions=None, max_age=None, exclude=None):
+    """Delete the hook revisions outside the retention policy using cursor.
+
+    :return int: Number of hook revisions removed
+    """
+    clauses = []
+    params = []
+    if keep_revisions is not None:
+        cursor.execute('select max(version) from hooks')
+        latest = cursor.fetchone()[0]
+        if latest is not None:
+            clauses.append('version <= ?')
+            params.append(latest - max(int(keep_revisions), 0))
+    if max_age is not None:
+        cutoff = (datetime.datetime.utcnow() -
+                  datetime.timedelta(seconds=max_age))
+        clauses.append('date < ?')
+        params.append(cutoff.isoformat())
+    if not clauses:
+        return 0
+
+    where = '(%s)' % ' or '.join(clauses)
+    if exclude:
+        where += ' and version != ?'
+        params.append(exclude)
+
+    cursor.execute(
+        'delete from kv_revisions where revision in '
+        '(select version from hooks where %s)' % where, params)
+    cursor.execute('delete from hooks where %s' % where, params)
+    return cursor.rowcount
+
+
+def compact_history(keep_revisions=DEFAULT_KEEP_REVISIONS, max_age=None,
+                    path=None):
+    """
+    Compact the revision history of the unit state db.
+
+    Compaction runs on its own connection and in its own transaction, so it
+    never commits or rolls back changes pending on :func:`kv`. If it fails,
+    or the db is locked, it is skipped with a warning until the next call.
+
+    :param str path: db to compact, defaults to that of :func:`kv`
+    :return int: Number of hook revisions removed
+    """
+    from charmhelpers.core import hookenv
+
+    conn = None
+    try:
+        conn = sqlite3.connect(path or kv().db_path, timeout=0)
+        removed = _compact(conn.cursor(), keep_revisions, max_age)
+        conn.commit()
+        return removed
+    except sqlite3.Error as e:
+        hookenv.log('Skipping unit state compaction: {}'.format(e),
+                    level=hookenv.WARNING)
+        if conn is not None:
+            conn.rollback()
+        return 0
+    finally:
+        if conn is not None:
+            conn.close()
+
+
 def _parse_history(d):
     return (d[0], d[1], json.loads(d[2]), d[3],
             datetime.datetime.strptime(d[-1], "%Y-%m-%dT%H:%M:%S.%f"))
@@ -458,11 +571,16 @@ class HookData(object):
            with changes():
                hook.execute()
 
+    Historical revisions are compacted once each hook scope has been
+    committed, according to `keep_revisions` and `max_age` (seconds); pass
+    None for either to disable that bound.
     """
-    def __init__(self):
+    def __init__(self, keep_revisions=DEFAULT_KEEP_REVISIONS, max_age=None):
         self.kv = kv()
         self.conf = None
         self.rels = None
+        self.keep_revisions = keep_revisions
+        self.max_age = max_age
 
     @contextlib.contextmanager
     def __call__(self):
@@ -473,6 +591,8 @@ class HookData(object):
             self._record_charm_version(hookenv.charm_dir())
             delta_config, delta_relation = self._record_hook(hookenv)
             yield self.kv, delta_config, delta_relation
+        compact_history(keep_revisions=self.keep_revisions,
+                        max_age=self.max_age, path=self.kv.db_path)
 
     def _record_charm_version(self, charm_dir):
         # Record revisions.. charm revisions are meaningless
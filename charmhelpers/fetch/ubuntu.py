@@ -174,19 +174,61 @@ CMD_RETRY_DELAY = 10  # Wait 10 seconds between command retries.
 CMD_RETRY_COUNT = 3  # Retry a failing fatal command X times.
 
 
+DPKG_STATUS = '/var/lib/dpkg/status'
+
+# Installed package versions parsed from DPKG_STATUS, along with the
+# (mtime, size) of the file they were parsed from.
+_dpkg_index = {}
+
+
+def installed_packages():
+    """Return a dict of installed package names to versions.
+
+    Reads the dpkg status database directly, which is much cheaper than
+    building an apt cache. The result is reused until the status file
+    changes.
+    """
+    try:
+        st = os.stat(DPKG_STATUS)
+    except OSError:
+        return {}
+    key = (st.st_mtime, st.st_size)
+    if _dpkg_index.get('key') != key:
+        packages = {}
+        with open(DPKG_STATUS) as f:
+            for stanza in f.read().split('\n\n'):
+                fields = {}
+                for line in stanza.splitlines():
+                    if line and not line[0].isspace() and ':' in line:
+                        name, value = line.split(':', 1)
+                        fields[name] = value.strip()
+                if (fields.get('Package') and fields.get('Version') and
+                        fields.get('Status', '').endswith(' installed')):
+                    packages.setdefault(fields['Package'], fields['Version'])
+        _dpkg_index['key'] = key
+        _dpkg_index['packages'] = packages
+    return _dpkg_index['packages']
+
+
+def installed_version(package):
+    """Return the installed version of package, or None."""
+    return installed_packages().get(package)
+
+
+def upstream_version(version):
+    """Return the upstream part of a debian version string, dropping the
+    epoch and the debian revision."""
+    if ':' in version:
+        version = version.split(':', 1)[1]
+    if '-' in version:
+        version = version.rsplit('-', 1)[0]
+    return version
+
+
 def filter_installed_packages(packages):
     """Return a list of packages that require installation."""
-    cache = apt_cache()
-    _pkgs = []
-    for package in packages:
-        try:
-            p = cache[package]
-            p.current_ver or _pkgs.append(package)
-        except KeyError:
-            log('Package {} has no installation candidate.'.format(package),
-                level='WARNING')
-            _pkgs.append(package)
-    return _pkgs
+    installed = installed_packages()
+    return [package for package in packages if package not in installed]
 
 
 def apt_cache(in_memory=True, progress=None):
@@ -201,6 +243,9 @@ def apt_cache(in_memory=True, progress=None):
 
 def apt_install(packages, options=None, fatal=False):
     """Install one or more packages."""
+    if not packages:
+        log("No packages to install", level=DEBUG)
+        return
     if options is None:
         options = ['--option=Dpkg::Options::=--force-confold']
 
@@ -577,16 +622,7 @@ def get_upstream_version(package):
 
     @returns None (if not installed) or the upstream version
     """
-    import apt_pkg
-    cache = apt_cache()
-    try:
-        pkg = cache[package]
-    except Exception:
-        # the package is unknown to the current apt cache.
+    version = installed_version(package)
+    if not version:
         return None
-
-    if not pkg.current_ver:
-        # package is known, but no version is currently installed.
-        return None
-
-    return apt_pkg.upstream_version(pkg.current_ver.ver_str)
+    return upstream_version(version)
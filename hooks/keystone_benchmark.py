@@ -0,0 +1,196 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Keystone token issue and catalog read latency probe.
+
+Used by the benchmark action and, copied into the nagios plugins directory,
+as the check_keystone_latency NRPE plugin. Only the standard library may be
+used here as the plugin runs outside of the charm environment.
+"""
+
+import argparse
+import json
+import math
+import sys
+import time
+
+try:
+    from urllib.request import Request, urlopen
+except ImportError:
+    from urllib2 import Request, urlopen
+
+NAGIOS_OK = 0
+NAGIOS_WARNING = 1
+NAGIOS_CRITICAL = 2
+NAGIOS_UNKNOWN = 3
+
+REQUEST_TIMEOUT = 10
+
+
+def percentile(samples, pct):
+    """Return the nearest-rank percentile of samples, or None if empty."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = int(math.ceil(pct / 100.0 * len(ordered))) - 1
+    return ordered[max(0, min(rank, len(ordered) - 1))]
+
+
+def _request(url, body=None, token=None):
+    headers = {'Content-Type': 'application/json',
+               'Accept': 'application/json'}
+    if token:
+        headers['X-Auth-Token'] = token
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    response = urlopen(Request(url, data=data, headers=headers),
+                       timeout=REQUEST_TIMEOUT)
+    return response, json.loads(response.read().decode('utf-8'))
+
+
+def issue_token(endpoint, credentials, api_version):
+    """Request a project scoped token.
+
+    :returns: str token
+    """
+    endpoint = endpoint.rstrip('/')
+    if api_version == 2:
+        body = {'auth': {
+            'tenantName': credentials['project'],
+            'passwordCredentials': {
+                'username': credentials['username'],
+                'password': credentials['password']}}}
+        _, data = _request('{}/tokens'.format(endpoint), body)
+        return data['access']['token']['id']
+    body = {'auth': {
+        'identity': {
+            'methods': ['password'],
+            'password': {'user': {
+                'name': credentials['username'],
+                'domain': {'name': credentials['user_domain']},
+                'password': credentials['password']}}},
+        'scope': {'project': {
+            'name': credentials['project'],
+            'domain': {'name': credentials['project_domain']}}}}}
+    response, _ = _request('{}/auth/tokens'.format(endpoint), body)
+    return response.info().get('X-Subject-Token')
+
+
+def read_catalog(endpoint, token, api_version):
+    """Read the service catalog (v3) or the tenant list (v2)."""
+    endpoint = endpoint.rstrip('/')
+    if api_version == 2:
+        _request('{}/tenants'.format(endpoint), token=token)
+    else:
+        _request('{}/auth/catalog'.format(endpoint), token=token)
+
+
+def _summary(samples):
+    return {'p50': percentile(samples, 50),
+            'p95': percentile(samples, 95),
+            'p99': percentile(samples, 99)}
+
+
+def benchmark(endpoint, credentials, api_version, count):
+    """Issue count tokens and catalog reads against endpoint.
+
+    Latencies are reported in milliseconds.
+
+    :returns: dict of results
+    """
+    token_times = []
+    catalog_times = []
+    errors = []
+    start = time.time()
+    for _ in range(count):
+        try:
+            t0 = time.time()
+            token = issue_token(endpoint, credentials, api_version)
+            t1 = time.time()
+            read_catalog(endpoint, token, api_version)
+            t2 = time.time()
+        except Exception as e:
+            errors.append(str(e))
+            continue
+        token_times.append((t1 - t0) * 1000)
+        catalog_times.append((t2 - t1) * 1000)
+    duration = time.time() - start
+    completed = len(token_times) + len(catalog_times)
+    return {
+        'endpoint': endpoint,
+        'requests': completed,
+        'errors': len(errors),
+        'last-error': errors[-1] if errors else None,
+        'duration': duration,
+        'rps': completed / duration if duration else 0,
+        'token': _summary(token_times),
+        'catalog': _summary(catalog_times),
+    }
+
+
+def evaluate(results, warning, critical):
+    """Return a nagios (status, message) for a list of benchmark results.
+
+    The p95 token issue latency of each endpoint is compared against the
+    thresholds, in milliseconds.
+    """
+    status = NAGIOS_OK
+    messages = []
+    perfdata = []
+    for result in results:
+        p95 = result['token']['p95']
+        if result['errors'] or p95 is None:
+            status = NAGIOS_CRITICAL
+            messages.append('{}: {} failed requests ({})'.format(
+                result['endpoint'], result['errors'], result['last-error']))
+            continue
+        if p95 >= critical:
+            status = NAGIOS_CRITICAL
+        elif p95 >= warning:
+            status = max(status, NAGIOS_WARNING)
+        messages.append('{}: token p95 {:.0f}ms, {:.1f} req/s'.format(
+            result['endpoint'], p95, result['rps']))
+        perfdata.append('{}_token_p95={:.0f}ms;{};{}'.format(
+            len(perfdata), p95, warning, critical))
+    label = {NAGIOS_OK: 'OK', NAGIOS_WARNING: 'WARNING',
+             NAGIOS_CRITICAL: 'CRITICAL'}[status]
+    message = '{}: {}'.format(label, '; '.join(messages))
+    if perfdata:
+        message = '{} | {}'.format(message, ' '.join(perfdata))
+    return status, message
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--config', required=True,
+                        help='JSON file with endpoints, credentials and '
+                             'thresholds written by the keystone charm')
+    args = parser.parse_args(argv)
+    try:
+        with open(args.config) as f:
+            conf = json.load(f)
+        results = [benchmark(endpoint, conf['credentials'],
+                             conf['api_version'], conf['samples'])
+                   for endpoint in conf['endpoints']]
+    except Exception as e:
+        print('UNKNOWN: {}'.format(e))
+        return NAGIOS_UNKNOWN
+    status, message = evaluate(results, conf['warning'], conf['critical'])
+    print(message)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,420 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Export and import of the keystone catalog as a single snapshot.
+
+A snapshot holds domains, projects, roles, services, endpoints and the
+users managed by this charm, addressed by name rather than id and sorted so
+that two snapshots can be compared with diff. Passwords are never exported;
+users created on import get their password from peer storage, as they would
+when created by the identity-service relation.
+"""
+
+import json
+
+import yaml
+
+from charmhelpers.core.hookenv import (
+    config,
+    leader_get,
+    log,
+    DEBUG,
+    INFO,
+)
+
+from keystone_utils import (
+    DEFAULT_DOMAIN,
+    get_admin_passwd,
+    get_manager,
+    get_service_password,
+    set_admin_passwd,
+    set_service_password,
+)
+
+SNAPSHOT_VERSION = 1
+V2_INTERFACES = ('public', 'admin', 'internal')
+
+
+def managed_users():
+    """Return the names of users whose credentials this charm manages."""
+    users = set(key[:-len('_passwd')] for key in (leader_get() or {})
+                if key.endswith('_passwd'))
+    users.add(config('admin-user'))
+    return users
+
+
+def _sorted(items, *fields):
+    return sorted(items, key=lambda i: tuple(i.get(f) or '' for f in fields))
+
+
+def _user_roles(grants):
+    return _sorted(grants, 'role', 'domain', 'project_domain', 'project')
+
+
+def read_catalog(manager, users=None):
+    """Read the catalog from keystone with one list call per resource.
+
+    @param manager: a keystone manager from get_manager()
+    @param users: names of the users to include, default managed_users()
+    @returns (snapshot, ids) where ids maps snapshot keys to keystone ids
+    """
+    api = manager.api
+    v3 = manager.api_version > 2
+    users = managed_users() if users is None else users
+    ids = {'domain': {}, 'project': {}, 'role': {}, 'service': {},
+           'endpoint': {}, 'user': {}}
+
+    domain_names = {}
+    domains = []
+    if v3:
+        for d in api.domains.list():
+            domain_names[d.id] = d.name
+            ids['domain'][d.name] = d.id
+            domains.append({'name': d.name,
+                            'description': getattr(d, 'description', None),
+                            'enabled': getattr(d, 'enabled', True)})
+
+    project_names = {}
+    projects = []
+    for p in (api.projects.list() if v3 else api.tenants.list()):
+        domain = domain_names.get(getattr(p, 'domain_id', None))
+        project_names[p.id] = (domain, p.name)
+        ids['project'][(domain, p.name)] = p.id
+        projects.append({'name': p.name, 'domain': domain,
+                         'description': getattr(p, 'description', None),
+                         'enabled': getattr(p, 'enabled', True)})
+
+    role_names = {}
+    for r in api.roles.list():
+        role_names[r.id] = r.name
+        ids['role'][r.name] = r.id
+
+    service_keys = {}
+    services = []
+    for s in api.services.list():
+        service_keys[s.id] = (s.name, s.type)
+        ids['service'][(s.name, s.type)] = s.id
+        services.append({'name': s.name, 'type': s.type,
+                         'description': getattr(s, 'description', None)})
+
+    endpoints = []
+    for ep in api.endpoints.list():
+        name, stype = service_keys.get(ep.service_id, (None, None))
+        if v3:
+            urls = {ep.interface: ep.url}
+        else:
+            urls = dict((i, getattr(ep, '{}url'.format(i), None))
+                        for i in V2_INTERFACES)
+        for interface, url in urls.items():
+            key = (name, stype, ep.region, interface)
+            ids['endpoint'][key] = (ep.id, url)
+            endpoints.append({'service': name, 'type': stype,
+                              'region': ep.region, 'interface': interface,
+                              'url': url})
+
+    user_entries = {}
+    for u in api.users.list():
+        if u.name not in users:
+            continue
+        domain = domain_names.get(getattr(u, 'domain_id', None))
+        ids['user'][(domain, u.name)] = u.id
+        user_entries[u.id] = {'name': u.name, 'domain': domain, 'roles': []}
+
+    if v3:
+        for a in api.role_assignments.list():
+            user = getattr(a, 'user', {}).get('id')
+            if user not in user_entries:
+                continue
+            # Inherited assignments apply to the projects below their scope,
+            # as in manager.role_assignments_for_user(), so granting them
+            # on import would widen them to the scope itself.
+            if 'OS-INHERIT:inherited_to' in a.scope:
+                continue
+            grant = {'role': role_names.get(a.role['id'])}
+            if 'project' in a.scope:
+                domain, name = project_names.get(a.scope['project']['id'],
+                                                 (None, None))
+                grant.update({'project': name, 'project_domain': domain})
+            elif 'domain' in a.scope:
+                grant['domain'] = domain_names.get(a.scope['domain']['id'])
+            else:
+                continue
+            user_entries[user]['roles'].append(grant)
+    else:
+        # The v2 API has no role assignment listing so ask per project.
+        for user in user_entries:
+            for project_id, (_, name) in project_names.items():
+                for r in manager.roles_for_user(user, tenant_id=project_id):
+                    user_entries[user]['roles'].append(
+                        {'role': r.name, 'project': name,
+                         'project_domain': None})
+
+    for entry in user_entries.values():
+        entry['roles'] = _user_roles(entry['roles'])
+
+    snapshot = {
+        'version': SNAPSHOT_VERSION,
+        'api-version': manager.api_version,
+        'domains': _sorted(domains, 'name'),
+        'projects': _sorted(projects, 'domain', 'name'),
+        'roles': _sorted([{'name': n} for n in role_names.values()],
+                         'name'),
+        'services': _sorted(services, 'type', 'name'),
+        'endpoints': _sorted(endpoints, 'type', 'region', 'interface'),
+        'users': _sorted(user_entries.values(), 'domain', 'name'),
+    }
+    return snapshot, ids
+
+
+def export_catalog():
+    """Return a snapshot of the catalog on this keystone."""
+    snapshot, _ = read_catalog(get_manager())
+    return snapshot
+
+
+def dump_snapshot(snapshot, fmt='yaml'):
+    """Serialise a snapshot to a stable, diffable json or yaml string."""
+    if fmt == 'json':
+        return json.dumps(snapshot, sort_keys=True, indent=2,
+                          separators=(',', ': '))
+    return yaml.safe_dump(snapshot, default_flow_style=False)
+
+
+def load_snapshot(text):
+    """Parse a json or yaml snapshot.
+
+    @raises ValueError if the snapshot is not a supported version
+    """
+    snapshot = yaml.safe_load(text)
+    version = snapshot.get('version') if isinstance(snapshot, dict) else None
+    if version != SNAPSHOT_VERSION:
+        raise ValueError("Unsupported catalog snapshot version: {}"
+                         "".format(version))
+    return snapshot
+
+
+def _with_default_domain(snapshot):
+    """Return a copy of a v2 snapshot with its resources in DEFAULT_DOMAIN.
+
+    The v2 API has no domains, so its snapshots leave them unset; a v3
+    keystone keeps those resources in the default domain.
+    """
+    snapshot = dict(snapshot)
+    snapshot['projects'] = [dict(p, domain=p.get('domain') or DEFAULT_DOMAIN)
+                            for p in snapshot.get('projects', [])]
+    users = []
+    for user in snapshot.get('users', []):
+        roles = [g if g.get('domain') else
+                 dict(g, project_domain=g.get('project_domain') or
+                      DEFAULT_DOMAIN)
+                 for g in user.get('roles', [])]
+        users.append(dict(user, domain=user.get('domain') or DEFAULT_DOMAIN,
+                          roles=roles))
+    snapshot['users'] = users
+    return snapshot
+
+
+def plan_import(snapshot, current, ids):
+    """Work out the operations needed to bring keystone up to snapshot.
+
+    Nothing that exists is deleted; only missing resources are created and
+    endpoints with a different url are updated. A v2 snapshot imported into
+    a v3 keystone is placed in the default domain.
+
+    @param snapshot: the desired snapshot
+    @param current: the snapshot read from keystone by read_catalog()
+    @param ids: the ids returned by read_catalog()
+    @returns list of (operation, item) tuples in the order to apply them
+    """
+    if current['api-version'] > 2:
+        snapshot = _with_default_domain(snapshot)
+    plan = []
+    have = set(d['name'] for d in current['domains'])
+    plan.extend(('create-domain', d) for d in snapshot.get('domains', [])
+                if d['name'] not in have)
+    have = set((p['domain'], p['name']) for p in current['projects'])
+    plan.extend(('create-project', p) for p in snapshot.get('projects', [])
+                if (p.get('domain'), p['name']) not in have)
+    have = set(r['name'] for r in current['roles'])
+    plan.extend(('create-role', r) for r in snapshot.get('roles', [])
+                if r['name'] not in have)
+    have = set((s['name'], s['type']) for s in current['services'])
+    plan.extend(('create-service', s) for s in snapshot.get('services', [])
+                if (s['name'], s['type']) not in have)
+
+    for ep in snapshot.get('endpoints', []):
+        key = (ep['service'], ep['type'], ep['region'], ep['interface'])
+        if key not in ids['endpoint']:
+            plan.append(('create-endpoint', ep))
+        elif ids['endpoint'][key][1] != ep['url']:
+            plan.append(('update-endpoint', ep))
+
+    current_roles = dict(((u['domain'], u['name']), u['roles'])
+                         for u in current['users'])
+    grants = []
+    for user in snapshot.get('users', []):
+        key = (user.get('domain'), user['name'])
+        if key not in current_roles:
+            plan.append(('create-user', user))
+        have = current_roles.get(key, [])
+        grants.extend(('grant-role', dict(g, user=user['name'],
+                                          user_domain=user.get('domain')))
+                      for g in user.get('roles', []) if g not in have)
+    plan.extend(grants)
+    return plan
+
+
+def describe(operation, item):
+    """Return a one line description of a planned operation."""
+    if operation == 'grant-role':
+        scope = item.get('domain') or '{}/{}'.format(
+            item.get('project_domain'), item.get('project'))
+        return '{} {} to {}/{} on {}'.format(
+            operation, item['role'], item['user_domain'], item['user'],
+            scope)
+    if operation.endswith('-endpoint'):
+        return '{} {} {} {} {}'.format(operation, item['service'],
+                                       item['region'], item['interface'],
+                                       item['url'])
+    if item.get('domain'):
+        return '{} {}/{}'.format(operation, item['domain'], item['name'])
+    return '{} {}'.format(operation, item['name'])
+
+
+def _create_user(manager, ids, user):
+    name, domain = user['name'], user.get('domain')
+    if name == config('admin-user'):
+        passwd = get_admin_passwd(user=name)
+        store = set_admin_passwd
+    else:
+        passwd = get_service_password(name)
+        store = set_service_password
+    if manager.api_version > 2:
+        created = manager.api.users.create(
+            name, domain=ids['domain'].get(domain), password=passwd,
+            email='juju@localhost')
+    else:
+        created = manager.api.users.create(name=name, password=passwd,
+                                           email='juju@localhost')
+    store(passwd, user=name)
+    return created.id
+
+
+def _grant_role(manager, ids, grant):
+    user = ids['user'][(grant['user_domain'], grant['user'])]
+    role = ids['role'][grant['role']]
+    if manager.api_version == 2:
+        project = ids['project'][(None, grant['project'])]
+        manager.api.roles.add_user_role(user, role, project)
+    elif grant.get('domain'):
+        manager.api.roles.grant(role, user=user,
+                                domain=ids['domain'][grant['domain']])
+    else:
+        project = ids['project'][(grant['project_domain'], grant['project'])]
+        manager.api.roles.grant(role, user=user, project=project)
+
+
+def _apply_v2_endpoints(manager, ids, endpoints):
+    """The v2 API stores all interfaces of a region in one endpoint."""
+    regions = {}
+    for ep in endpoints:
+        key = (ep['service'], ep['type'], ep['region'])
+        regions.setdefault(key, {})[ep['interface']] = ep['url']
+    for (name, stype, region), urls in regions.items():
+        existing = [ids['endpoint'].get((name, stype, region, i))
+                    for i in V2_INTERFACES]
+        for interface, current in zip(V2_INTERFACES, existing):
+            if current:
+                urls.setdefault(interface, current[1])
+        ep_ids = set(e[0] for e in existing if e)
+        for ep_id in ep_ids:
+            manager.api.endpoints.delete(ep_id)
+        manager.create_endpoints(region=region,
+                                 service_id=ids['service'][(name, stype)],
+                                 publicurl=urls.get('public'),
+                                 adminurl=urls.get('admin'),
+                                 internalurl=urls.get('internal'))
+
+
+def apply_import(manager, plan, ids):
+    """Apply a plan from plan_import() to keystone.
+
+    @returns int number of operations applied
+    """
+    api = manager.api
+    v3 = manager.api_version > 2
+    v2_endpoints = []
+    for operation, item in plan:
+        log("Catalog import: {}".format(describe(operation, item)),
+            level=DEBUG)
+        if operation == 'create-domain':
+            ids['domain'][item['name']] = api.domains.create(
+                item['name'], description=item.get('description'),
+                enabled=item.get('enabled', True)).id
+        elif operation == 'create-project':
+            key = (item.get('domain'), item['name'])
+            if v3:
+                created = api.projects.create(
+                    item['name'], ids['domain'][item['domain']],
+                    description=item.get('description'),
+                    enabled=item.get('enabled', True))
+            else:
+                created = api.tenants.create(
+                    tenant_name=item['name'],
+                    description=item.get('description'),
+                    enabled=item.get('enabled', True))
+            ids['project'][key] = created.id
+        elif operation == 'create-role':
+            ids['role'][item['name']] = api.roles.create(
+                name=item['name']).id
+        elif operation == 'create-service':
+            ids['service'][(item['name'], item['type'])] = (
+                api.services.create(item['name'], item['type'],
+                                    description=item.get('description')).id)
+        elif operation.endswith('-endpoint') and not v3:
+            v2_endpoints.append(item)
+        elif operation == 'create-endpoint':
+            api.endpoints.create(
+                ids['service'][(item['service'], item['type'])],
+                item['url'], interface=item['interface'],
+                region=item['region'])
+        elif operation == 'update-endpoint':
+            key = (item['service'], item['type'], item['region'],
+                   item['interface'])
+            api.endpoints.update(ids['endpoint'][key][0], url=item['url'])
+        elif operation == 'create-user':
+            ids['user'][(item.get('domain'), item['name'])] = _create_user(
+                manager, ids, item)
+        elif operation == 'grant-role':
+            _grant_role(manager, ids, item)
+    if v2_endpoints:
+        _apply_v2_endpoints(manager, ids, v2_endpoints)
+    log("Catalog import applied {} operations".format(len(plan)), level=INFO)
+    return len(plan)
+
+
+def import_catalog(snapshot, dry_run=False):
+    """Bring the catalog on this keystone up to snapshot.
+
+    @returns list of descriptions of the operations planned or applied
+    """
+    manager = get_manager()
+    current, ids = read_catalog(
+        manager, users=set(u['name'] for u in snapshot.get('users', [])))
+    plan = plan_import(snapshot, current, ids)
+    if not dry_run:
+        apply_import(manager, plan, ids)
+    return [describe(operation, item) for operation, item in plan]
@@ -14,6 +14,9 @@
 
 import os
 import json
+import subprocess
+
+from collections import OrderedDict
 
 from charmhelpers.contrib.openstack import context
 
@@ -32,6 +35,7 @@ from charmhelpers.core.hookenv import (
     related_units,
     relation_ids,
     relation_get,
+    WARNING,
 )
 
 
@@ -50,6 +54,12 @@ class ApacheSSLContext(context.ApacheSSLContext):
         self.external_ports = determine_ports()
         return super(ApacheSSLContext, self).__call__()
 
+    def enable_modules(self):
+        super(ApacheSSLContext, self).enable_modules()
+        if (config('enable-http2') and
+                os.path.exists('/etc/apache2/mods-available/http2.load')):
+            subprocess.check_call(['a2enmod', 'http2'])
+
 
 class NginxSSLContext(context.ApacheSSLContext):
     interfaces = ['https']
@@ -104,6 +114,31 @@ class NginxSSLContext(context.ApacheSSLContext):
         return
 
 
+class TLSFrontendContext(context.OSContextGenerator):
+    """TLS session resumption and connection reuse settings for the apache
+    and nginx HTTPS frontends."""
+    interfaces = []
+
+    def __call__(self):
+        from keystone_utils import tls_ticket_key_files
+        cache_size = config('ssl-session-cache-size')
+        ctxt = {
+            'tls_session_cache_size': cache_size,
+            'tls_session_cache_bytes': cache_size * 1024 * 1024,
+            'tls_session_timeout': config('ssl-session-timeout'),
+            'tls_session_tickets': config('ssl-session-tickets'),
+            'tls_ocsp_stapling': config('ssl-ocsp-stapling'),
+            'http2': config('enable-http2'),
+            'keepalive_timeout': config('http-keepalive-timeout'),
+            'keepalive_requests': config('http-keepalive-requests'),
+        }
+        if ctxt['tls_session_tickets']:
+            ctxt['tls_session_ticket_keys'] = [
+                path for path in tls_ticket_key_files()
+                if os.path.exists(path)]
+        return ctxt
+
+
 class HAProxyContext(context.HAProxyContext):
     interfaces = []
 
@@ -149,7 +184,7 @@ class KeystoneContext(context.OSContextGenerator):
         from keystone_utils import (
             api_port, set_admin_token, endpoint_url, resolve_address,
             PUBLIC, ADMIN, ADMIN_DOMAIN,
-            snap_install_requested, get_api_version,
+            snap_install_requested, get_api_version, ldap_pool_settings,
         )
         ctxt = {}
         ctxt['token'] = set_admin_token(config('admin-token'))
@@ -181,9 +216,19 @@ class KeystoneContext(context.OSContextGenerator):
             ctxt['ldap_suffix'] = config('ldap-suffix')
             ctxt['ldap_readonly'] = config('ldap-readonly')
             ldap_flags = config('ldap-config-flags')
+            flags = {}
             if ldap_flags:
                 flags = context.config_flags_parser(ldap_flags)
                 ctxt['ldap_config_flags'] = flags
+            try:
+                # Options given in ldap-config-flags take precedence.
+                ctxt['ldap_pool'] = OrderedDict(
+                    (key, value)
+                    for key, value in ldap_pool_settings().items()
+                    if key not in flags)
+            except ValueError as e:
+                log("Not configuring LDAP connection pool: {}".format(e),
+                    level=WARNING)
 
         # Base endpoint URL's which are used in keystone responses
         # to unauthenticated requests to redirect clients to the
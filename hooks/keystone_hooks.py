@@ -16,6 +16,7 @@
 
 import hashlib
 import json
+import os
 import sys
 
 from subprocess import check_call
@@ -45,6 +46,7 @@ from charmhelpers.core.host import (
     service_stop,
     service_start,
     service_restart,
+    path_hash,
 )
 
 from charmhelpers.fetch import (
@@ -88,7 +90,7 @@ from keystone_utils import (
     send_notifications,
     is_db_ready,
     is_db_initialised,
-    filter_null,
+    replay_identity_relation_settings,
     is_service_present,
     delete_service_entry,
     assess_status,
@@ -101,6 +103,21 @@ from keystone_utils import (
     ADMIN_PROJECT,
     create_or_show_domain,
     restart_keystone,
+    reload_keystone,
+    RenderPlan,
+    identity_inputs_fingerprint,
+    IDENTITY_INPUTS_KEY,
+    update_tls_ticket_keys,
+    reload_tls_frontend,
+    APACHE_CONF,
+    APACHE_24_CONF,
+    KEYSTONE_NGINX_SITE_CONF,
+    certificates_digest,
+    CERTIFICATES_APPLIED_KEY,
+    write_latency_check_config,
+    LATENCY_CHECK_CONF,
+    LATENCY_CHECK_PLUGIN,
+    ldap_pool_settings,
 )
 
 from charmhelpers.contrib.hahelpers.cluster import (
@@ -108,6 +125,7 @@ from charmhelpers.contrib.hahelpers.cluster import (
     get_hacluster_config,
     https,
     is_clustered,
+    clear_leadership_cache,
 )
 
 from charmhelpers.contrib.openstack.ha.utils import (
@@ -117,18 +135,18 @@ from charmhelpers.contrib.openstack.ha.utils import (
 
 from charmhelpers.payload.execd import execd_preinstall
 from charmhelpers.contrib.peerstorage import (
-    peer_retrieve_by_prefix,
     peer_echo,
 )
 from charmhelpers.contrib.openstack.ip import (
     ADMIN,
     resolve_address,
+    vip_index,
 )
 
 from charmhelpers.contrib.network.ip import (
+    clear_network_cache,
     get_iface_for_address,
     get_netmask_for_address,
-    is_ipv6,
     get_relation_ip,
 )
 from charmhelpers.contrib.openstack.context import ADDRESS_TYPES
@@ -180,6 +198,9 @@ def install():
 @restart_on_change(restart_map(), restart_functions=restart_function_map())
 @harden()
 def config_changed():
+    # juju runs config-changed when the unit's network bindings change, so
+    # drop any lookups made before the hook body ran, e.g. on import.
+    clear_network_cache()
     if config('prefer-ipv6'):
         status_set('maintenance', 'configuring ipv6')
         setup_ipv6()
@@ -201,6 +222,7 @@ def config_changed():
 @restart_on_change(restart_map(), restart_functions=restart_function_map())
 @harden()
 def config_changed_postupgrade():
+    plan = RenderPlan(CONFIGS)
     save_script_rc()
     release = os_release('keystone')
     if run_in_apache(release=release):
@@ -213,7 +235,8 @@ def config_changed_postupgrade():
 
         disable_unused_apache_sites()
         if WSGI_KEYSTONE_API_CONF in CONFIGS.templates:
-            CONFIGS.write(WSGI_KEYSTONE_API_CONF)
+            plan.add(WSGI_KEYSTONE_API_CONF)
+            plan.flush()
         if not is_unit_paused_set():
             restart_pid_check('apache2')
 
@@ -222,12 +245,14 @@ def config_changed_postupgrade():
         # packages may have changed so ensure they are installed.
         apt_install(filter_installed_packages(determine_packages()))
 
-    configure_https()
+    configure_https(plan=plan)
     open_port(config('service-port'))
 
     update_nrpe_config()
 
-    CONFIGS.write_all()
+    plan.add_all()
+    plan.finish()
+    configure_tls_session_tickets()
 
     if snap_install_requested() and not is_unit_paused_set():
         service_restart('snap.keystone.*')
@@ -260,7 +285,12 @@ def db_joined():
                      hostname=host)
 
 
-def update_all_identity_relation_units(check_db_ready=True):
+def update_all_identity_relation_units(check_db_ready=True, force=False):
+    """Re-trigger hooks for all identity relations/units.
+
+    The update is skipped if none of the inputs the identity relations
+    depend on have changed since the last full update, unless force is set.
+    """
     if is_unit_paused_set():
         return
     if check_db_ready and not is_db_ready():
@@ -273,27 +303,67 @@ def update_all_identity_relation_units(check_db_ready=True):
             "updates", level=INFO)
         return
 
+    db = unitdata.kv()
+    fingerprint = identity_inputs_fingerprint()
+    if not force and db.get(IDENTITY_INPUTS_KEY) == fingerprint:
+        log("Identity relation inputs unchanged - skipping update of all "
+            "identity relations", level=DEBUG)
+        return
+
     if is_elected_leader(CLUSTER_RES):
         ensure_initial_admin(config)
 
+    # Only remember the inputs once every relation has been updated, so
+    # that deferred updates are retried by the next call.
+    complete = True
     log('Firing identity_changed hook for all related services.')
     for rid in relation_ids('identity-service'):
         for unit in related_units(rid):
-            identity_changed(relation_id=rid, remote_unit=unit)
+            if not identity_changed(relation_id=rid, remote_unit=unit):
+                complete = False
     log('Firing admin_relation_changed hook for all related services.')
     for rid in relation_ids('identity-admin'):
-        admin_relation_changed(rid)
+        if not admin_relation_changed(rid):
+            complete = False
     log('Firing identity_credentials_changed hook for all related services.')
     for rid in relation_ids('identity-credentials'):
         for unit in related_units(rid):
-            identity_credentials_changed(relation_id=rid, remote_unit=unit)
+            if not identity_credentials_changed(relation_id=rid,
+                                                remote_unit=unit):
+                complete = False
+
+    if complete:
+        db.set(IDENTITY_INPUTS_KEY, fingerprint)
+        db.flush()
+    else:
+        log("Some identity relation updates were deferred - they will be "
+            "retried", level=DEBUG)
 
 
 def update_all_domain_backends():
-    """Re-trigger hooks for all domain-backend relations/units"""
+    """Re-trigger hooks for all domain-backend relations/units.
+
+    keystone is reloaded at most once, however many domains asked for it.
+    """
+    nonces = {}
     for rid in relation_ids('domain-backend'):
         for unit in related_units(rid):
-            domain_backend_changed(relation_id=rid, unit=unit)
+            domain_backend_changed(relation_id=rid, unit=unit, nonces=nonces)
+    apply_domain_restart_nonces(nonces)
+
+
+def apply_domain_restart_nonces(nonces):
+    """Reload keystone and record the domain restart nonces acted upon.
+
+    :param nonces: dict of domain nonce key to the nonce to record
+    """
+    if not nonces:
+        return
+    reload_keystone()
+    db = unitdata.kv()
+    for key, nonce in nonces.items():
+        db.set(key, nonce)
+    db.flush()
 
 
 def update_all_fid_backends():
@@ -332,7 +402,7 @@ def leader_init_db_if_ready(use_current_context=False):
     migrate_database()
     # Ensure any existing service entries are updated in the
     # new database backend. Also avoid duplicate db ready check.
-    update_all_identity_relation_units(check_db_ready=False)
+    update_all_identity_relation_units(check_db_ready=False, force=True)
     update_all_domain_backends()
 
 
@@ -353,21 +423,25 @@ def db_changed():
 @hooks.hook('identity-service-relation-changed')
 @restart_on_change(restart_map(), restart_functions=restart_function_map())
 def identity_changed(relation_id=None, remote_unit=None):
+    """Register the remote service's endpoints and credentials.
+
+    :returns: False if the update was deferred until later, else True
+    """
     notifications = {}
     if is_elected_leader(CLUSTER_RES):
         if not is_db_ready():
             log("identity-service-relation-changed hook fired before db "
                 "ready - deferring until db ready", level=WARNING)
-            return
+            return False
 
         if not is_db_initialised():
             log("Database not yet initialised - deferring identity-relation "
                 "updates", level=INFO)
-            return
+            return False
 
         if expect_ha() and not is_clustered():
             log("Expected to be HA but no hacluster relation yet", level=INFO)
-            return
+            return False
 
         add_service_to_keystone(relation_id, remote_unit)
         if is_service_present('neutron', 'network'):
@@ -388,17 +462,13 @@ def identity_changed(relation_id=None, remote_unit=None):
     else:
         # Each unit needs to set the db information otherwise if the unit
         # with the info dies the settings die with it Bug# 1355848
-        for rel_id in relation_ids('identity-service'):
-            peerdb_settings = peer_retrieve_by_prefix(rel_id)
-            # Ensure the null'd settings are unset in the relation.
-            peerdb_settings = filter_null(peerdb_settings)
-            if 'service_password' in peerdb_settings:
-                relation_set(relation_id=rel_id, **peerdb_settings)
+        replay_identity_relation_settings()
 
         log('Deferring identity_changed() to service leader.')
 
     if notifications:
         send_notifications(notifications)
+    return True
 
 
 @hooks.hook('identity-credentials-relation-joined',
@@ -410,25 +480,27 @@ def identity_credentials_changed(relation_id=None, remote_unit=None):
 
     :param relation_id: Relation id of the relation
     :param remote_unit: Related unit on the relation
+    :returns: False if the update was deferred until later, else True
     """
     if is_elected_leader(CLUSTER_RES):
         if expect_ha() and not is_clustered():
             log("Expected to be HA but no hacluster relation yet", level=INFO)
-            return
+            return False
         if not is_db_ready():
             log("identity-credentials-relation-changed hook fired before db "
                 "ready - deferring until db ready", level=WARNING)
-            return
+            return False
 
         if not is_db_initialised():
             log("Database not yet initialised - deferring "
                 "identity-credentials-relation updates", level=INFO)
-            return
+            return False
 
         # Create the tenant user
         add_credentials_to_keystone(relation_id, remote_unit)
     else:
         log('Deferring identity_credentials_changed() to service leader.')
+    return True
 
 
 @hooks.hook('cluster-relation-joined')
@@ -465,9 +537,13 @@ def cluster_changed():
 @restart_on_change(restart_map(), stopstart=True)
 def leader_elected():
     log('Unit has been elected leader.', level=DEBUG)
+    # Leadership may have been evaluated before election completed so drop
+    # any cached result.
+    clear_leadership_cache()
     # When the local unit has been elected the leader, update the cron jobs
     # to ensure that the cron jobs are active on this unit.
     CONFIGS.write(TOKEN_FLUSH_CRON_FILE)
+    configure_tls_session_tickets()
 
     update_all_identity_relation_units()
 
@@ -479,6 +555,7 @@ def leader_settings_changed():
     # leader-settings-changed hook, rewrite the token flush cron job to make
     # sure only the leader is running the cron job.
     CONFIGS.write(TOKEN_FLUSH_CRON_FILE)
+    configure_tls_session_tickets()
 
     update_all_identity_relation_units()
 
@@ -499,8 +576,9 @@ def ha_joined(relation_id=None):
                                       resource_params=resource_params)
     else:
         vip_group = []
-        for vip in cluster_config['vip'].split():
-            if is_ipv6(vip):
+        vips = vip_index(cluster_config['vip'])
+        for vip in vips:
+            if vips.is_ipv6(vip):
                 res_ks_vip = 'ocf:heartbeat:IPv6addr'
                 vip_params = 'ipv6addr'
             else:
@@ -554,21 +632,27 @@ def ha_joined(relation_id=None):
 @hooks.hook('ha-relation-changed')
 @restart_on_change(restart_map(), restart_functions=restart_function_map())
 def ha_changed():
-    CONFIGS.write_all()
+    plan = RenderPlan(CONFIGS)
+    plan.add_all()
+    plan.finish()
 
     clustered = relation_get('clustered')
     if clustered:
         log('Cluster configured, notifying other services and updating '
             'keystone endpoint configuration')
-        update_all_identity_relation_units()
+        update_all_identity_relation_units(force=True)
 
 
 @hooks.hook('identity-admin-relation-changed')
 def admin_relation_changed(relation_id=None):
+    """Publish the admin credentials.
+
+    :returns: False if the update was deferred until later, else True
+    """
     # TODO: fixup
     if expect_ha() and not is_clustered():
         log("Expected to be HA but no hacluster relation yet", level=INFO)
-        return
+        return False
     relation_data = {
         'service_hostname': resolve_address(ADMIN),
         'service_port': config('service-port'),
@@ -584,16 +668,34 @@ def admin_relation_changed(relation_id=None):
         relation_data['service_project_name'] = ADMIN_PROJECT
     relation_data['service_password'] = get_admin_passwd()
     relation_set(relation_id=relation_id, **relation_data)
+    return True
 
 
 @hooks.hook('domain-backend-relation-changed')
-def domain_backend_changed(relation_id=None, unit=None):
+def domain_backend_changed(relation_id=None, unit=None, nonces=None):
+    """Create the domain a backend is for and reload keystone if asked to.
+
+    :param nonces: dict to collect changed domain restart nonces into for
+                   the caller to act on; keystone is reloaded here if None
+    """
     if get_api_version() < 3:
         log('Domain specific backend identity configuration only supported '
             'with Keystone v3 API, skipping domain creation and '
             'restart.')
         return
 
+    # NOTE: domain specific config files are read on their own and do not
+    #       inherit [ldap] from keystone.conf, so offer the pool settings
+    #       to the subordinate writing them.
+    try:
+        relation_set(relation_id=relation_id,
+                     relation_settings={
+                         'ldap-pool': json.dumps(ldap_pool_settings(),
+                                                 sort_keys=True)})
+    except ValueError as e:
+        log("Not publishing LDAP pool settings: {}".format(e),
+            level=WARNING)
+
     domain_name = relation_get(attribute='domain-name',
                                unit=unit,
                                rid=relation_id)
@@ -611,21 +713,27 @@ def domain_backend_changed(relation_id=None, unit=None):
                                      unit=unit,
                                      rid=relation_id)
         domain_nonce_key = 'domain-restart-nonce-{}'.format(domain_name)
-        db = unitdata.kv()
-        if restart_nonce != db.get(domain_nonce_key):
-            restart_keystone()
-            db.set(domain_nonce_key, restart_nonce)
-            db.flush()
+        if restart_nonce != unitdata.kv().get(domain_nonce_key):
+            if nonces is None:
+                apply_domain_restart_nonces({domain_nonce_key: restart_nonce})
+            else:
+                nonces[domain_nonce_key] = restart_nonce
 
 
-def configure_https():
+def configure_https(plan=None):
     '''
     Enables SSL API Apache config if appropriate and kicks identity-service
     with any required api updates.
+
+    :param plan: RenderPlan of the calling hook, if any.
     '''
+    if plan is None:
+        plan = RenderPlan(CONFIGS)
     # need to write all to ensure changes to the entire request pipeline
-    # propagate (c-api, haprxy, apache)
-    CONFIGS.write_all()
+    # propagate (c-api, haprxy, apache), and the site must exist before it
+    # can be enabled so this is a render barrier.
+    plan.add_all()
+    plan.flush()
     # NOTE (thedac): When using snaps, nginx is installed, skip any apache2
     # config.
     if snap_install_requested():
@@ -638,17 +746,41 @@ def configure_https():
         check_call(cmd)
 
 
+def configure_tls_session_tickets():
+    '''
+    Installs the TLS session ticket keys shared by the leader and reloads
+    the HTTPS frontend if they changed.
+    '''
+    if not update_tls_ticket_keys():
+        return
+    for conf in tls_frontend_configs():
+        CONFIGS.write(conf)
+    reload_tls_frontend()
+
+
+def tls_frontend_configs():
+    '''Returns the registered HTTPS frontend config files.'''
+    return [conf for conf in (APACHE_CONF, APACHE_24_CONF,
+                              KEYSTONE_NGINX_SITE_CONF)
+            if conf in CONFIGS.templates]
+
+
 @hooks.hook('upgrade-charm')
 @restart_on_change(restart_map(), stopstart=True)
 @harden()
 def upgrade_charm():
+    # Bindings may differ between charm revisions.
+    clear_network_cache()
     status_set('maintenance', 'Installing apt packages')
     apt_install(filter_installed_packages(determine_packages()))
 
     if run_in_apache():
         disable_unused_apache_sites()
 
-    CONFIGS.write_all()
+    plan = RenderPlan(CONFIGS)
+    plan.add_all()
+    # Configs must be on disk before the database is initialised.
+    plan.flush()
 
     # See LP bug 1519035
     leader_init_db_if_ready()
@@ -658,20 +790,29 @@ def upgrade_charm():
     if is_elected_leader(CLUSTER_RES):
         log('Cluster leader - ensuring endpoint configuration is up to '
             'date', level=DEBUG)
-        update_all_identity_relation_units()
+        # Charm code may have changed what is published, so always refresh.
+        update_all_identity_relation_units(force=True)
+
+    plan.finish()
 
 
 @hooks.hook('update-status')
 @harden()
 def update_status():
     log('Updating status.')
+    # Periodic hook, so this is where an expired ticket key gets rotated.
+    configure_tls_session_tickets()
 
 
 @hooks.hook('nrpe-external-master-relation-joined',
             'nrpe-external-master-relation-changed')
 def update_nrpe_config():
+    if not relation_ids('nrpe-external-master'):
+        log('No nrpe-external-master relation, skipping nrpe config',
+            level=DEBUG)
+        return
     # python-dbus is used by check_upstart_job
-    apt_install('python-dbus')
+    apt_install(filter_installed_packages(['python-dbus']))
     hostname = nrpe.get_nagios_hostname()
     current_unit = nrpe.get_nagios_unit_name()
     nrpe_setup = nrpe.NRPE(hostname=hostname)
@@ -683,6 +824,13 @@ def update_nrpe_config():
         _services.append(service)
     nrpe.add_init_service_checks(nrpe_setup, _services, current_unit)
     nrpe.add_haproxy_checks(nrpe_setup, current_unit)
+    if write_latency_check_config():
+        nrpe_setup.add_check(
+            shortname='keystone_latency',
+            description='Keystone token issue latency {}'.format(
+                current_unit),
+            check_cmd='{} --config {}'.format(LATENCY_CHECK_PLUGIN,
+                                              LATENCY_CHECK_CONF))
     nrpe_setup.write()
 
 
@@ -773,20 +921,45 @@ def certs_changed(relation_id=None, unit=None):
     # update_all_identity_relation_units calls the keystone API
     # so configs need to be written and services restarted
     # before
+    plan = RenderPlan(CONFIGS)
+    digest = certificates_digest(relation_id, unit)
+    frontend_confs = [conf for conf in tls_frontend_configs()
+                      if os.path.exists(conf)]
+    frontend_hashes = [path_hash(conf) for conf in frontend_confs]
+
     @restart_on_change(restart_map(), stopstart=True)
     def write_certs_and_config():
-        process_certificates('keystone', relation_id, unit)
-        configure_https()
-    write_certs_and_config()
+        changed = process_certificates('keystone', relation_id, unit)
+        if (not changed and
+                unitdata.kv().get(CERTIFICATES_APPLIED_KEY) == digest):
+            return False
+        configure_https(plan=plan)
+        return True
+
+    if not write_certs_and_config():
+        log("Certificate bundle unchanged, nothing to do", level=DEBUG)
+        return
+    # Frontend config unchanged means only certificate content changed,
+    # which a reload picks up without dropping connections.
+    if frontend_hashes == [path_hash(conf) for conf in frontend_confs]:
+        reload_tls_frontend()
     update_all_identity_relation_units()
     update_all_domain_backends()
+    plan.finish()
+    unitdata.kv().set(CERTIFICATES_APPLIED_KEY, digest)
+    unitdata.kv().flush()
 
 
 def main():
     try:
-        hooks.execute(sys.argv)
+        # Record the hook's unit state changes as one revision so that the
+        # history can be compacted.
+        with unitdata.kv().hook_scope(os.path.basename(sys.argv[0])):
+            hooks.execute(sys.argv)
     except UnregisteredHookError as e:
         log('Unknown hook {} - skipping.'.format(e))
+    nrpe.reload_pending()
+    unitdata.compact_history()
     assess_status(CONFIGS)
 
 
@@ -0,0 +1,143 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Generation of the effective keystone policy.json.
+
+The per-release policy.json template is rendered as before and then reduced:
+references to named rules that are a single check are replaced by that
+check, named rules no longer referenced are dropped and, on releases with
+policy in code, rules equal to keystone's registered defaults are left out.
+On those releases the template is used as rendered if the registered
+defaults can't be read, as dropping a rule would then fall back to a default
+which may differ from it.
+"""
+
+import json
+import re
+import subprocess
+
+from charmhelpers.contrib.openstack.utils import (
+    CompareOpenStackReleases,
+    os_release,
+    snap_install_requested,
+)
+from charmhelpers.core import unitdata
+from charmhelpers.core.hookenv import (
+    log,
+    DEBUG,
+    INFO,
+)
+from charmhelpers.fetch import installed_version
+
+POLICY_DEFAULTS_KEY = 'policy-defaults'
+POLICY_GENERATOR = ['oslopolicy-sample-generator', '--namespace', 'keystone',
+                    '--format', 'json']
+_RULE_REF = re.compile(r'rule:([\w:.-]+)')
+
+
+def _is_named_rule(name):
+    """Named rules are referenced with rule:; API targets contain ':'."""
+    return ':' not in name and name != 'default'
+
+
+def collapse_rules(rules, keep=()):
+    """Inline references to named rules which are a single check.
+
+    Named rules which are no longer referenced afterwards are dropped,
+    except those in keep.
+
+    @param rules: dict of rule name to check string
+    @param keep: names which must stay, e.g. those registered in code
+    @returns new dict of rules
+    """
+    atoms = dict((name, check) for name, check in rules.items()
+                 if _is_named_rule(name) and check and
+                 len(check.split()) == 1)
+
+    def resolve(name, seen=()):
+        check = atoms.get(name)
+        if check is None or name in seen:
+            return 'rule:{}'.format(name)
+        ref = _RULE_REF.match(check)
+        if ref and ref.group(0) == check:
+            return resolve(ref.group(1), seen + (name,))
+        return check
+
+    collapsed = dict(
+        (name, _RULE_REF.sub(lambda m: resolve(m.group(1)), check))
+        for name, check in rules.items())
+    referenced = set()
+    for check in collapsed.values():
+        referenced.update(_RULE_REF.findall(check))
+    return dict((name, check) for name, check in collapsed.items()
+                if not _is_named_rule(name) or name in referenced or
+                name in keep)
+
+
+def policy_in_code():
+    """Return True if keystone registers its policy defaults in code, which
+    it does from pike onwards."""
+    return CompareOpenStackReleases(os_release('keystone')) >= 'pike'
+
+
+def policy_defaults():
+    """Return keystone's in-code policy defaults, or None if this release
+    has none or they can't be read.
+
+    The generator output is cached per installed keystone version.
+    """
+    if snap_install_requested() or not policy_in_code():
+        return None
+    version = installed_version('keystone')
+    kv = unitdata.kv()
+    cached = kv.get(POLICY_DEFAULTS_KEY)
+    if version and cached and cached.get('version') == version:
+        return cached['rules']
+    try:
+        rules = json.loads(subprocess.check_output(POLICY_GENERATOR))
+    except (OSError, subprocess.CalledProcessError, ValueError) as e:
+        log("Unable to read keystone policy defaults: {}".format(e),
+            level=INFO)
+        return None
+    kv.set(POLICY_DEFAULTS_KEY, {'version': version, 'rules': rules})
+    kv.flush()
+    return rules
+
+
+def generate_policy(rendered):
+    """Reduce a rendered policy.json template to the effective policy.
+
+    Used as the post_render function of POLICY_JSON.
+
+    @param rendered: the rendered template
+    @returns str json policy
+    """
+    rules = json.loads(rendered)
+    defaults = {}
+    if policy_in_code():
+        defaults = policy_defaults()
+        if not defaults:
+            log("Keystone policy defaults unavailable, using policy "
+                "template as rendered", level=INFO)
+            return rendered
+    reduced = collapse_rules(rules, keep=defaults)
+    if defaults:
+        reduced = dict((name, check) for name, check in reduced.items()
+                       if defaults.get(name) != check)
+    log("Generated policy with {} rule(s), {} in template".format(
+        len(reduced), len(rules)), level=DEBUG)
+    return json.dumps(reduced, sort_keys=True, indent=4,
+                      separators=(',', ': ')) + '\n'
@@ -14,8 +14,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import base64
+import grp
+import hashlib
+import json
 import os
 import shutil
+import socket
 import subprocess
 import time
 import urlparse
@@ -31,9 +36,11 @@ from charmhelpers.contrib.hahelpers.cluster import (
     determine_api_port,
     https,
     get_hacluster_config,
+    is_clustered,
 )
 
 from charmhelpers.contrib.openstack import context, templating
+from charmhelpers.contrib.openstack.ha.utils import expect_ha
 from charmhelpers.contrib.network.ip import (
     is_ipv6,
     get_ipv6_addr
@@ -65,6 +72,8 @@ from charmhelpers.contrib.openstack.utils import (
     is_unit_paused_set,
 )
 
+from charmhelpers.core import unitdata
+
 from charmhelpers.core.strutils import (
     bool_from_string,
 )
@@ -74,6 +83,7 @@ from charmhelpers.core.decorators import (
 )
 
 from charmhelpers.core.hookenv import (
+    atexit,
     config,
     leader_get,
     leader_set,
@@ -96,12 +106,17 @@ from charmhelpers.fetch import (
 )
 
 from charmhelpers.core.host import (
+    cancel_restart,
+    clear_status_probe_cache,
+    listening_ports,
+    service_reload,
     service_restart,
     service_stop,
     service_start,
     pwgen,
     lsb_release,
     CompareHostReleases,
+    write_file,
 )
 
 from charmhelpers.contrib.peerstorage import (
@@ -111,6 +126,7 @@ from charmhelpers.contrib.peerstorage import (
 )
 
 import keystone_context
+import keystone_policy
 
 
 TEMPLATES = 'templates/'
@@ -163,8 +179,12 @@ if snap_install_requested():
     POLICY_JSON = ('{}/keystone.conf.d/policy.json'
                    ''.format(SNAP_COMMON_KEYSTONE_DIR))
     BASE_SERVICES = ['snap.keystone.uwsgi', 'snap.keystone.nginx']
+    TLS_TICKET_KEY_DIR = '{}/lib/juju_ssl/keystone'.format(SNAP_COMMON_DIR)
+    TLS_FRONTEND_SERVICE = 'snap.keystone.nginx'
 else:
     APACHE_SSL_DIR = '/etc/apache2/ssl/keystone'
+    TLS_TICKET_KEY_DIR = APACHE_SSL_DIR
+    TLS_FRONTEND_SERVICE = 'apache2'
     KEYSTONE_USER = 'keystone'
     KEYSTONE_CONF = "/etc/keystone/keystone.conf"
     KEYSTONE_NGINX_CONF = None
@@ -236,20 +256,24 @@ BASE_RESOURCE_MAP = OrderedDict([
                      context.SyslogContext(),
                      keystone_context.HAProxyContext(),
                      keystone_context.NginxSSLContext(),
+                     keystone_context.TLSFrontendContext(),
                      context.BindHostContext(),
                      context.WorkerConfigContext()],
     }),
     (APACHE_CONF, {
-        'contexts': [keystone_context.ApacheSSLContext()],
+        'contexts': [keystone_context.ApacheSSLContext(),
+                     keystone_context.TLSFrontendContext()],
         'services': ['apache2'],
     }),
     (APACHE_24_CONF, {
-        'contexts': [keystone_context.ApacheSSLContext()],
+        'contexts': [keystone_context.ApacheSSLContext(),
+                     keystone_context.TLSFrontendContext()],
         'services': ['apache2'],
     }),
     (POLICY_JSON, {
         'contexts': [keystone_context.KeystoneContext()],
         'services': BASE_SERVICES,
+        'post_render': keystone_policy.generate_policy,
     }),
     (TOKEN_FLUSH_CRON_FILE, {
         'contexts': [keystone_context.TokenFlushContext(),
@@ -427,6 +451,63 @@ def filter_null(settings, null='__null__'):
     return filtered
 
 
+def group_peer_settings_by_relation(peer_settings, rel_ids, delimiter='_'):
+    """Split a peer relation settings dict into per-relation settings.
+
+    Settings stored with peer_store_and_set() are keyed as
+    '<relation id><delimiter><key>'. This groups the settings for each of
+    rel_ids with the relation id prefix stripped.
+
+    :param peer_settings: dict of all peer relation settings
+    :param rel_ids: list of relation ids to extract settings for
+    :param delimiter: delimiter between the relation id and the key
+    :returns: dict of {rel_id: {key: value, ...}, ...}
+    """
+    grouped = {rid: {} for rid in rel_ids}
+    prefixes = {'{}{}'.format(rid, delimiter): rid for rid in rel_ids}
+    for k, v in (peer_settings or {}).iteritems():
+        prefix, sep, key = k.partition(delimiter)
+        rid = prefixes.get(prefix + sep)
+        if rid is not None and key:
+            grouped[rid][key] = v
+    return grouped
+
+
+def replay_identity_relation_settings():
+    """Replay identity-service settings from peer storage onto each
+    identity-service relation.
+
+    Each unit needs to set the settings generated by the leader, otherwise
+    they are lost if the unit holding them dies (LP #1355848). The peer
+    settings are read once and only keys which differ from what this unit
+    last published on a relation are set.
+    """
+    rel_ids = relation_ids('identity-service')
+    if not rel_ids:
+        return
+
+    grouped = group_peer_settings_by_relation(peer_retrieve('-'), rel_ids)
+    db = unitdata.kv()
+    for rid in rel_ids:
+        # Ensure the null'd settings are unset in the relation.
+        settings = filter_null(grouped[rid])
+        if 'service_password' not in settings:
+            continue
+
+        published_key = 'identity-service-published-{}'.format(rid)
+        published = db.get(published_key) or {}
+        changed = {k: v for k, v in settings.iteritems()
+                   if k not in published or published[k] != v}
+        if not changed:
+            log("identity-service settings unchanged on {} - skipping"
+                "".format(rid), level=DEBUG)
+            continue
+
+        relation_set(relation_id=rid, **changed)
+        db.set(published_key, settings)
+    db.flush()
+
+
 def resource_map():
     """Dynamically generate a map of resources that will be managed for a
     single hook execution.
@@ -504,6 +585,7 @@ def restart_pid_check(service_name, ptable_string=None):
     service_stop(service_name)
     check_pids_gone(ptable_string)
     service_start(service_name)
+    cancel_restart(service_name)
 
 
 def restart_function_map():
@@ -546,10 +628,79 @@ def register_configs():
     configs = templating.OSConfigRenderer(templates_dir=TEMPLATES,
                                           openstack_release=release)
     for cfg, rscs in resource_map().iteritems():
-        configs.register(cfg, rscs['contexts'])
+        if rscs.get('post_render'):
+            configs.register(cfg, rscs['contexts'],
+                             post_render=rscs['post_render'])
+        else:
+            configs.register(cfg, rscs['contexts'])
     return configs
 
 
+class RenderPlan(object):
+    """Collects the config files that need rendering during a hook so that
+    each one is rendered once.
+
+    Hook steps request files with add() or add_all(). Requested files are
+    rendered when flush() is called, which should happen at the end of the
+    hook and at any barrier where the files must be on disk before carrying
+    on, e.g. before a restart that precedes calls to the keystone API. Files
+    already rendered by the plan are not rendered again unless invalidated.
+    """
+
+    def __init__(self, configs):
+        self.configs = configs
+        self.pending = []
+        self.rendered = set()
+        self.requests = 0
+        self.renders = 0
+        self._all = False
+
+    def add(self, *config_files):
+        """Request that config_files are rendered at the next flush."""
+        for config_file in config_files:
+            self.requests += 1
+            if (config_file not in self.rendered and
+                    config_file not in self.pending):
+                self.pending.append(config_file)
+
+    def add_all(self):
+        """Request that all registered config files are rendered."""
+        if not self.rendered:
+            self._all = True
+        self.add(*self.configs.templates.keys())
+
+    def invalidate(self, *config_files):
+        """Allow config_files (default: all) to be rendered again."""
+        if config_files:
+            self.rendered.difference_update(config_files)
+        else:
+            self.rendered.clear()
+
+    def flush(self):
+        """Render all pending config files."""
+        if self._all:
+            self.configs.write_all()
+        else:
+            for config_file in self.pending:
+                self.configs.write(config_file)
+        self.renders += len(self.pending)
+        self.rendered.update(self.pending)
+        self.pending = []
+        self._all = False
+
+    @property
+    def saved(self):
+        """Number of renders avoided by the plan."""
+        return self.requests - self.renders
+
+    def finish(self):
+        """Render any pending config files and log the plan summary."""
+        self.flush()
+        log("Rendered {} config file(s) for {} request(s), {} render(s) "
+            "saved".format(self.renders, self.requests, self.saved),
+            level=DEBUG)
+
+
 def restart_map():
     return OrderedDict([(cfg, v['services'])
                         for cfg, v in resource_map().iteritems()
@@ -981,19 +1132,34 @@ def create_role(name, user=None, tenant=None, domain=None):
 def grant_role(user, role, tenant=None, domain=None, user_domain=None,
                project_domain=None):
     """Grant user and tenant a specific role"""
+    grant_roles(user, [role], tenant=tenant, domain=domain,
+                user_domain=user_domain, project_domain=project_domain)
+
+
+def grant_roles(user, roles, tenant=None, domain=None, user_domain=None,
+                project_domain=None):
+    """Grant user the given roles on tenant and/or domain.
+
+    The user's current role assignments are fetched with a single lookup
+    and only the missing grants are made, so granting roles the user
+    already has costs a handful of API calls whatever their number.
+    """
+    if not roles:
+        return
     manager = get_manager()
     if domain:
-        log("Granting user '%s' role '%s' in domain '%s'" %
-            (user, role, domain))
+        log("Granting user '%s' roles %s in domain '%s'" %
+            (user, roles, domain))
     else:
-        log("Granting user '%s' role '%s' on tenant '%s' in domain '%s'" %
-            (user, role, tenant, project_domain))
+        log("Granting user '%s' roles %s on tenant '%s' in domain '%s'" %
+            (user, roles, tenant, project_domain))
 
     user_id = manager.resolve_user_id(user, user_domain=user_domain)
-    role_id = manager.resolve_role_id(role)
-    if None in [user_id, role_id]:
+    role_ids = {r.name.lower(): r.id for r in manager.api.roles.list()}
+    unknown = [role for role in roles if role.lower() not in role_ids]
+    if user_id is None or unknown:
         error_out("Could not resolve [%s, %s] user_domain='%s'" %
-                  (user_id, role_id, user_domain))
+                  (user_id, unknown, user_domain))
 
     tenant_id = None
     if tenant:
@@ -1008,26 +1174,20 @@ def grant_role(user, role, tenant=None, domain=None, user_domain=None,
         if not domain_id:
             error_out('Could not resolve domain_id for domain %s' % domain)
 
-    cur_roles = manager.roles_for_user(user_id, tenant_id=tenant_id,
-                                       domain_id=domain_id)
-    if not cur_roles or role_id not in [r.id for r in cur_roles]:
-        manager.add_user_role(user=user_id,
-                              role=role_id,
-                              tenant=tenant_id,
-                              domain=domain_id)
-        if domain_id is None:
-            log("Granted user '%s' role '%s' on tenant '%s' in domain '%s'" %
-                (user, role, tenant, project_domain), level=DEBUG)
-        else:
-            log("Granted user '%s' role '%s' in domain '%s'" %
-                (user, role, domain), level=DEBUG)
-    else:
-        if domain_id is None:
-            log("User '%s' already has role '%s' on tenant '%s' in domain '%s'"
-                % (user, role, tenant, project_domain), level=DEBUG)
-        else:
-            log("User '%s' already has role '%s' in domain '%s'"
-                % (user, role, domain), level=DEBUG)
+    # A v3 grant is made on the domain, the project or both; v2.0 only
+    # knows tenants.
+    scopes = [(tenant_id, None)] if tenant_id or not domain_id else []
+    if domain_id:
+        scopes.append((None, domain_id))
+    wanted = set((role_ids[role.lower()], t_id, d_id)
+                 for role in roles for t_id, d_id in scopes)
+    missing = wanted - manager.role_assignments_for_user(
+        user_id, tenant_id=tenant_id)
+    for role_id, t_id, d_id in sorted(missing):
+        manager.add_user_role(user=user_id, role=role_id, tenant=t_id,
+                              domain=d_id)
+    log("Granted user '%s' %d of %d role assignment(s), the rest were "
+        "already present" % (user, len(missing), len(wanted)), level=DEBUG)
 
 
 def store_data(backing_file, data):
@@ -1147,18 +1307,13 @@ def ensure_initial_admin(config):
                                                  domain=ADMIN_DOMAIN)
                 if passwd:
                     create_role('Member')
-                    # Grant 'Member' role to user ADMIN_DOMAIN/admin-user in
-                    # project ADMIN_DOMAIN/'admin'
-                    # ADMIN_DOMAIN
-                    grant_role(admin_username, 'Member', tenant='admin',
-                               user_domain=ADMIN_DOMAIN,
-                               project_domain=ADMIN_DOMAIN)
                     create_role(config('admin-role'))
-                    # Grant admin-role to user ADMIN_DOMAIN/admin-user in
-                    # project ADMIN_DOMAIN/admin
-                    grant_role(admin_username, config('admin-role'),
-                               tenant='admin', user_domain=ADMIN_DOMAIN,
-                               project_domain=ADMIN_DOMAIN)
+                    # Grant 'Member' and admin-role to user
+                    # ADMIN_DOMAIN/admin-user in project ADMIN_DOMAIN/admin
+                    grant_roles(admin_username,
+                                ['Member', config('admin-role')],
+                                tenant='admin', user_domain=ADMIN_DOMAIN,
+                                project_domain=ADMIN_DOMAIN)
                     # Grant domain level admin-role to ADMIN_DOMAIN/admin-user
                     grant_role(admin_username, config('admin-role'),
                                domain=ADMIN_DOMAIN, user_domain=ADMIN_DOMAIN)
@@ -1307,20 +1462,22 @@ def create_user_credentials(user, passwd_get_callback, passwd_set_callback,
 
     passwd_set_callback(passwd, user=user)
 
-    if grants:
-        for role in grants:
-            # grant role on project
-            grant_role(user, role, tenant=tenant, user_domain=domain,
-                       project_domain=domain)
-    else:
-        log("No role grants requested for user '%s'" % (user), level=DEBUG)
-
+    roles = list(grants or [])
     if new_roles:
         # Allow the remote service to request creation of any additional roles.
         # Currently used by Swift and Ceilometer.
         for role in new_roles:
             log("Creating requested role '%s'" % role, level=DEBUG)
-            create_role(role, user=user, tenant=tenant, domain=domain)
+            create_role(role)
+            if role not in roles:
+                roles.append(role)
+
+    if roles:
+        # grant roles on project
+        grant_roles(user, roles, tenant=tenant, user_domain=domain,
+                    project_domain=domain)
+    else:
+        log("No role grants requested for user '%s'" % (user), level=DEBUG)
 
     return passwd
 
@@ -1652,70 +1809,332 @@ def setup_ipv6():
         apt_install('haproxy/trusty-backports', fatal=True)
 
 
+NOTIFICATIONS_KEY = 'identity-notifications-published'
+
+
+class NotificationBroadcaster(object):
+    """Publishes settings on the identity-notifications relations.
+
+    The settings last published on each relation are kept in unitdata so
+    that only changed keys are sent and relation data is never read back.
+    Notifications queued during a hook are merged and published once by
+    flush(), which is scheduled to run when the hook completes.
+    """
+
+    def __init__(self):
+        self.pending = {}
+        self.force = False
+        self._scheduled = False
+
+    def queue(self, data, force=False):
+        """Merge data into the next publish.
+
+        :param data: Dict of key=value to publish; a value of None removes
+                     the key from the relations.
+        :param force: Publish a new trigger value so that the remote hooks
+                      fire even if nothing else changed.
+        """
+        self.pending.update(data)
+        self.force = self.force or force
+        if not self._scheduled:
+            atexit(self.flush)
+            self._scheduled = True
+
+    def flush(self):
+        """Publish the queued notifications to every relation they change."""
+        data, force = self.pending, self.force
+        self.pending, self.force, self._scheduled = {}, False, False
+        if not data:
+            return
+        if force:
+            data['trigger'] = str(uuid.uuid4())
+
+        rel_ids = relation_ids('identity-notifications')
+        if not rel_ids:
+            log("No relations on identity-notifications - skipping broadcast",
+                level=INFO)
+            return
+
+        db = unitdata.kv()
+        published = db.get(NOTIFICATIONS_KEY) or {}
+        # Relation ids are not reused so the state of departed relations
+        # can go.
+        published = {rid: published.get(rid, {}) for rid in rel_ids}
+        sent = 0
+        for rid in rel_ids:
+            settings = published[rid]
+            changes = {k: v for k, v in data.iteritems()
+                       if settings.get(k) != v}
+            if not changes:
+                continue
+            relation_set(relation_id=rid, relation_settings=changes)
+            for k, v in changes.iteritems():
+                if v is None:
+                    settings.pop(k, None)
+                else:
+                    settings[k] = v
+            sent += 1
+        if sent:
+            log("Sent identity-service notifications to {} relation(s) "
+                "(trigger={})".format(sent, force), level=DEBUG)
+        else:
+            log("Notifications unchanged by new values so skipping broadcast",
+                level=INFO)
+        db.set(NOTIFICATIONS_KEY, published)
+        db.flush()
+
+
+NOTIFICATIONS = NotificationBroadcaster()
+
+
 def send_notifications(data, force=False):
     """Send notifications to all units listening on the identity-notifications
     interface.
 
     Units are expected to ignore notifications that they don't expect.
 
-    NOTE: settings that are not required/inuse must always be set to None
-          so that they are removed from the relation.
+    Notifications are published when the hook completes, and only keys
+    whose value differs from the last publish on a relation are sent.
 
-    :param data: Dict of key=value to use as trigger for notification. If the
-                 last broadcast is unchanged by the addition of this data, the
-                 notification will not be sent.
+    :param data: Dict of key=value to use as trigger for notification. Keys
+                 left unchanged are not sent; a value of None removes a key
+                 from the relations.
     :param force: Determines whether a trigger value is set to ensure the
                   remote hook is fired.
     """
     if not data or not is_elected_leader(CLUSTER_RES):
         log("Not sending notifications (no data or not leader)", level=INFO)
         return
+    NOTIFICATIONS.queue(data, force=force)
 
-    rel_ids = relation_ids('identity-notifications')
-    if not rel_ids:
-        log("No relations on identity-notifications - skipping broadcast",
-            level=INFO)
-        return
 
-    keys = []
-    diff = False
+IDENTITY_INPUTS_KEY = 'identity-relation-inputs-fingerprint'
 
-    # Get all settings previously sent
-    for rid in rel_ids:
-        rs = relation_get(unit=local_unit(), rid=rid)
-        if rs:
-            keys += rs.keys()
 
-        # Don't bother checking if we have already identified a diff
-        if diff:
-            continue
+def identity_relation_inputs():
+    """Return the inputs that identity relation reconciliation depends on.
 
-        # Work out if this notification changes anything
-        for k, v in data.iteritems():
-            if rs.get(k, None) != v:
-                diff = True
-                break
+    Any change to these values may change the settings published on the
+    identity-service, identity-admin and identity-credentials relations.
+    """
+    rel_units = {}
+    for rel in ['identity-service', 'identity-admin', 'identity-credentials']:
+        for rid in relation_ids(rel):
+            rel_units[rid] = sorted(related_units(rid))
+
+    certs = {}
+    for rid in relation_ids('certificates'):
+        for unit in related_units(rid):
+            certs[unit] = relation_get(attribute='ca', rid=rid, unit=unit)
+
+    # Non-leaders replay the leader's identity-service settings from peer
+    # storage, so those are an input too (LP #1355848).
+    try:
+        peer_settings = peer_retrieve('-') or {}
+    except ValueError:
+        peer_settings = {}
+    peer_identity = {k: v for k, v in peer_settings.items()
+                     if k.startswith('identity-service:')}
 
-    if not diff:
-        log("Notifications unchanged by new values so skipping broadcast",
-            level=INFO)
-        return
+    return {
+        'addresses': {ep_type: resolve_address(ep_type)
+                      for ep_type in [PUBLIC, INTERNAL, ADMIN]},
+        'ports': [config('service-port'), config('admin-port')],
+        'protocol': get_protocol(),
+        'api_version': get_api_version(),
+        'certs': certs,
+        'db_initialised': is_db_initialised(),
+        'leader': is_elected_leader(CLUSTER_RES),
+        'expect_ha': expect_ha(),
+        'clustered': is_clustered(),
+        'leader_settings': leader_get(),
+        'config': config(),
+        'relations': rel_units,
+        'peer_identity_settings': peer_identity,
+    }
 
-    # Set all to None
-    _notifications = {k: None for k in set(keys)}
 
-    # Set new values
-    for k, v in data.iteritems():
-        _notifications[k] = v
+def identity_inputs_fingerprint():
+    """Return a digest of identity_relation_inputs()."""
+    inputs = json.dumps(identity_relation_inputs(), sort_keys=True,
+                        default=str)
+    return hashlib.sha256(inputs).hexdigest()
 
-    if force:
-        _notifications['trigger'] = str(uuid.uuid4())
 
-    # Broadcast
-    log("Sending identity-service notifications (trigger=%s)" % (force),
-        level=DEBUG)
-    for rid in rel_ids:
-        relation_set(relation_id=rid, relation_settings=_notifications)
+NAGIOS_PLUGINS = '/usr/local/lib/nagios/plugins'
+LATENCY_CHECK_CONF = '/etc/nagios/keystone_latency.json'
+LATENCY_CHECK_PLUGIN = os.path.join(NAGIOS_PLUGINS, 'check_keystone_latency')
+
+
+def benchmark_endpoints(target='both'):
+    """Return the keystone endpoints to benchmark.
+
+    :param target: 'local' for the API port on this unit, 'vip' for the
+                   clustered admin endpoint or 'both'
+    """
+    endpoints = []
+    if target in ('local', 'both'):
+        endpoints.append(get_local_endpoint())
+    if target in ('vip', 'both') and config('vip'):
+        endpoints.append(endpoint_url(resolve_address(ADMIN),
+                                      api_port('keystone-admin'),
+                                      get_api_suffix()))
+    return endpoints
+
+
+def benchmark_credentials():
+    """Return the admin credentials used to issue benchmark tokens, or None
+    if the admin password is not known to this unit yet."""
+    password = get_admin_passwd()
+    if not password:
+        return None
+    return {'username': config('admin-user'),
+            'password': password,
+            'project': ADMIN_PROJECT,
+            'user_domain': ADMIN_DOMAIN,
+            'project_domain': ADMIN_DOMAIN}
+
+
+def write_latency_check_config():
+    """Write the config read by the check_keystone_latency NRPE plugin.
+
+    The file holds admin credentials so it is only readable by root and
+    the nagios group.
+
+    :returns: True if the config was written.
+    """
+    try:
+        grp.getgrnam('nagios')
+    except KeyError:
+        log("Nagios not installed, not configuring keystone latency check",
+            level=DEBUG)
+        return False
+    credentials = benchmark_credentials()
+    if not credentials:
+        log("Admin password not available, not configuring keystone "
+            "latency check", level=DEBUG)
+        return False
+    conf = {
+        'endpoints': benchmark_endpoints(),
+        'credentials': credentials,
+        'api_version': get_api_version(),
+        'samples': config('nagios_latency_samples'),
+        'warning': config('nagios_latency_warning'),
+        'critical': config('nagios_latency_critical'),
+    }
+    write_file(LATENCY_CHECK_CONF, json.dumps(conf, sort_keys=True),
+               group='nagios', perms=0o640)
+    plugin = os.path.join(os.path.dirname(__file__), 'keystone_benchmark.py')
+    if not os.path.exists(NAGIOS_PLUGINS):
+        os.makedirs(NAGIOS_PLUGINS)
+    shutil.copy2(plugin, LATENCY_CHECK_PLUGIN)
+    return True
+
+
+CERTIFICATES_APPLIED_KEY = 'certificates-applied-digest'
+
+
+def certificates_digest(relation_id, unit):
+    """Return a digest of the certificate bundle sent to this unit.
+
+    :param relation_id: str certificates relation id
+    :param unit: str unit providing the certificates
+    """
+    data = relation_get(rid=relation_id, unit=unit) or {}
+    name = local_unit().replace('/', '_')
+    keys = ('{}.processed_requests'.format(name), 'chain', 'ca')
+    bundle = [data.get(key) for key in keys]
+    return hashlib.sha256(json.dumps(bundle)).hexdigest()
+
+
+# Leader settings holding the TLS session ticket keys shared by all units.
+# Apache and nginx both accept 48 byte ticket key files.
+TLS_TICKET_KEY = 'tls-session-ticket-key'
+TLS_TICKET_KEY_PREVIOUS = 'tls-session-ticket-key-previous'
+TLS_TICKET_KEY_TIMESTAMP = 'tls-session-ticket-key-timestamp'
+TLS_TICKET_KEY_BYTES = 48
+
+
+def tls_ticket_key_files():
+    """Return paths of the session ticket key files, current key first."""
+    return [os.path.join(TLS_TICKET_KEY_DIR, 'ticket.key'),
+            os.path.join(TLS_TICKET_KEY_DIR, 'ticket.key.previous')]
+
+
+def rotate_tls_ticket_keys(now=None):
+    """Generate a new TLS session ticket key if the current one has expired.
+
+    Only the leader rotates keys; the previous key is kept so that nginx can
+    still resume sessions issued before the rotation. All units pick the
+    keys up from leader settings, so a session resumed against any unit
+    behind the VIP does not need a full handshake.
+
+    :returns: True if a new key was generated.
+    """
+    if not config('ssl-session-tickets') or \
+            not is_elected_leader(CLUSTER_RES):
+        return False
+    now = now or time.time()
+    settings = leader_get()
+    lifetime = config('ssl-session-ticket-key-lifetime') * 3600
+    try:
+        issued = float(settings.get(TLS_TICKET_KEY_TIMESTAMP) or 0)
+    except ValueError:
+        issued = 0
+    if settings.get(TLS_TICKET_KEY) and now - issued < lifetime:
+        return False
+    log("Rotating TLS session ticket key", level=INFO)
+    leader_set({
+        TLS_TICKET_KEY: base64.b64encode(os.urandom(TLS_TICKET_KEY_BYTES)),
+        TLS_TICKET_KEY_PREVIOUS: settings.get(TLS_TICKET_KEY),
+        TLS_TICKET_KEY_TIMESTAMP: str(int(now))})
+    return True
+
+
+def write_tls_ticket_keys():
+    """Write the leader provided TLS session ticket keys to disk.
+
+    :returns: True if any key file was changed.
+    """
+    changed = False
+    settings = leader_get()
+    for path, attr in zip(tls_ticket_key_files(),
+                          (TLS_TICKET_KEY, TLS_TICKET_KEY_PREVIOUS)):
+        key = settings.get(attr)
+        if not key or not config('ssl-session-tickets'):
+            if os.path.exists(path):
+                os.unlink(path)
+                changed = True
+            continue
+        key = base64.b64decode(key)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                if f.read() == key:
+                    continue
+        write_file(path, key, perms=0o600)
+        changed = True
+    return changed
+
+
+def update_tls_ticket_keys():
+    """Rotate (on the leader) and install the shared session ticket keys.
+
+    :returns: True if the installed key files changed.
+    """
+    rotate_tls_ticket_keys()
+    if not os.path.isdir(TLS_TICKET_KEY_DIR):
+        return False
+    return write_tls_ticket_keys()
+
+
+def reload_tls_frontend():
+    """Make the HTTPS frontend pick up new session ticket keys."""
+    if is_unit_paused_set():
+        return
+    if snap_install_requested():
+        service_restart(TLS_FRONTEND_SERVICE)
+    else:
+        service_reload(TLS_FRONTEND_SERVICE)
 
 
 def is_db_ready(use_current_context=False, db_rel=None):
@@ -1777,6 +2196,60 @@ def determine_python_path():
         return None
 
 
+LDAP_CONNECTION_BUDGET = 100
+LDAP_MIN_POOL_SIZE = 2
+# (config option, keystone [ldap] option, minimum value, maximum default)
+LDAP_POOL_OPTIONS = (
+    ('ldap-pool-size', 'pool_size', 1, 10),
+    ('ldap-pool-retry-max', 'pool_retry_max', 0, None),
+    ('ldap-pool-connection-timeout', 'pool_connection_timeout', -1, None),
+    ('ldap-pool-connection-lifetime', 'pool_connection_lifetime', 1, None),
+)
+LDAP_AUTH_POOL_OPTIONS = (
+    ('ldap-auth-pool-size', 'auth_pool_size', 1, 100),
+    ('ldap-auth-pool-connection-lifetime', 'auth_pool_connection_lifetime',
+     1, None),
+)
+
+
+def _ldap_option(option, minimum, maximum, workers):
+    value = config(option)
+    if value is None and maximum:
+        # Share the connection budget out over the worker processes, each
+        # of which has its own pools.
+        return max(LDAP_MIN_POOL_SIZE,
+                   min(maximum, LDAP_CONNECTION_BUDGET // max(workers, 1)))
+    if not isinstance(value, int) or isinstance(value, bool) or \
+            value < minimum:
+        raise ValueError(
+            '{} must be an integer >= {}'.format(option, minimum))
+    return value
+
+
+def ldap_pool_settings():
+    """Return the keystone [ldap] connection pool and paging options.
+
+    Unset pool sizes are derived from the number of keystone workers.
+
+    :returns: OrderedDict of keystone option to value
+    :raises: ValueError if an option is invalid
+    """
+    workers = context.WorkerConfigContext()()['workers']
+    settings = OrderedDict()
+    settings['use_pool'] = bool(config('ldap-use-pool'))
+    settings['use_auth_pool'] = (settings['use_pool'] and
+                                 bool(config('ldap-use-auth-pool')))
+    options = []
+    if settings['use_pool']:
+        options.extend(LDAP_POOL_OPTIONS)
+    if settings['use_auth_pool']:
+        options.extend(LDAP_AUTH_POOL_OPTIONS)
+    options.append(('ldap-page-size', 'page_size', 0, None))
+    for option, name, minimum, maximum in options:
+        settings[name] = _ldap_option(option, minimum, maximum, workers)
+    return settings
+
+
 def get_optional_interfaces():
     """Return the optional interfaces that should be checked if the relavent
     relations have appeared.
@@ -1790,7 +2263,8 @@ def get_optional_interfaces():
 
 def check_optional_relations(configs):
     """Check that if we have a relation_id for high availability that we can
-    get the hacluster config.  If we can't then we are blocked.  This function
+    get the hacluster config, and that the LDAP pool options are valid if
+    LDAP is used.  If we can't then we are blocked.  This function
     is called from assess_status/set_os_workload_status as the charm_func and
     needs to return either "unknown", "" if there is no problem or the status,
     message if there is a problem.
@@ -1805,6 +2279,12 @@ def check_optional_relations(configs):
             return ('blocked',
                     'hacluster missing configuration: '
                     'vip, vip_iface, vip_cidr')
+    if (config('identity-backend') == 'ldap' or
+            relation_ids('domain-backend')):
+        try:
+            ldap_pool_settings()
+        except ValueError as e:
+            return 'blocked', str(e)
     # return 'unknown' as the lowest priority to not clobber an existing
     # status.
     return 'unknown', ''
@@ -1861,15 +2341,151 @@ def get_file_stored_domain_id(backing_file):
     return domain_id
 
 
+# Services in the order they need to be started. Services in the same tier
+# do not depend on each other and are started or stopped concurrently.
+SERVICE_TIERS = [
+    ['memcached'],
+    ['keystone', 'snap.keystone.uwsgi'],
+    ['apache2', 'snap.keystone.nginx'],
+    ['haproxy'],
+]
+
+HAPROXY_ADMIN_SOCKET = '/var/run/haproxy/admin.sock'
+DRAIN_TIMEOUT = 30
+PORTS_TIMEOUT = 60
+MAINTENANCE_STARTED_KEY = 'maintenance-window-started'
+
+
+def haproxy_admin(command):
+    """Run a command on the local haproxy admin socket.
+
+    @returns str output, or None if haproxy is not reachable
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(5)
+        sock.connect(HAPROXY_ADMIN_SOCKET)
+        sock.sendall('{}\n'.format(command))
+        output = []
+        while True:
+            data = sock.recv(4096)
+            if not data:
+                break
+            output.append(data)
+        return ''.join(output)
+    except socket.error as e:
+        log("haproxy admin socket unavailable: {}".format(e), level=DEBUG)
+        return None
+    finally:
+        sock.close()
+
+
+def local_haproxy_servers():
+    """Return {'backend/server': current sessions} for this unit's entries
+    in the local haproxy."""
+    output = haproxy_admin('show stat')
+    if not output:
+        return {}
+    unit = local_unit().replace('/', '-')
+    servers = {}
+    header = None
+    for line in output.splitlines():
+        if line.startswith('# '):
+            header = line[2:].split(',')
+            continue
+        if not header or not line:
+            continue
+        row = dict(zip(header, line.split(',')))
+        if row.get('svname') == unit:
+            servers['{}/{}'.format(row['pxname'], row['svname'])] = int(
+                row.get('scur') or 0)
+    return servers
+
+
+def set_local_haproxy_state(state):
+    """Set this unit's haproxy server entries to ready, drain or maint."""
+    for server in local_haproxy_servers():
+        haproxy_admin('set server {} state {}'.format(server, state))
+
+
+def wait_for_ports(ports, timeout=PORTS_TIMEOUT):
+    """Wait until ports are listened on.
+
+    @returns bool True if all ports are listening
+    """
+    deadline = time.time() + timeout
+    while True:
+        clear_status_probe_cache()
+        missing = set(int(p) for p in ports) - listening_ports()
+        if not missing or time.time() >= deadline:
+            return not missing
+        time.sleep(1)
+
+
+class MaintenanceWindow(object):
+    """Takes this unit out of rotation in the local haproxy and measures
+    how long it is out of that rotation.
+
+    drain() stops the haproxy on this unit sending new requests to this
+    unit's backends and waits for its in-flight ones to complete; restore()
+    waits for the API ports to listen again before putting them back in
+    rotation. haproxy on the peers, and so the VIP when a peer holds it,
+    keeps sending requests until its health checks fail, so the times
+    reported only cover requests entering through this unit.
+    The start of the window is kept in unitdata so that a window opened by
+    the pause action can be closed by the resume action.
+    """
+
+    def __init__(self, drain_timeout=DRAIN_TIMEOUT):
+        self.drain_timeout = drain_timeout
+        self.results = {}
+
+    def drain(self):
+        started = time.time()
+        kv = unitdata.kv()
+        kv.set(MAINTENANCE_STARTED_KEY, started)
+        kv.flush()
+        set_local_haproxy_state('drain')
+        deadline = started + self.drain_timeout
+        while any(local_haproxy_servers().values()):
+            if time.time() >= deadline:
+                log("Timed out waiting for requests to drain", level=INFO)
+                break
+            time.sleep(0.5)
+        set_local_haproxy_state('maint')
+        self.results['local-drain-seconds'] = round(time.time() - started, 2)
+
+    def restore(self, ports=None):
+        if not wait_for_ports(ports or determine_ports()):
+            log("API ports not listening after {}s".format(PORTS_TIMEOUT),
+                level=INFO)
+        set_local_haproxy_state('ready')
+        kv = unitdata.kv()
+        started = kv.get(MAINTENANCE_STARTED_KEY)
+        if started:
+            self.results['local-unavailable-seconds'] = round(
+                time.time() - started, 2)
+        kv.unset(MAINTENANCE_STARTED_KEY)
+        kv.flush()
+
+
 def pause_unit_helper(configs):
     """Helper function to pause a unit, and then call assess_status(...) in
     effect, so that the status is correctly updated.
     Uses charmhelpers.contrib.openstack.utils.pause_unit() to do the work.
 
+    The unit is drained from the local haproxy before its services are
+    stopped.
+
     @param configs: a templating.OSConfigRenderer() object
-    @returns None - this function is executed for its side-effect
+    @returns dict of timings for the action results
     """
+    window = MaintenanceWindow()
+    window.drain()
+    started = time.time()
     _pause_resume_helper(pause_unit, configs)
+    window.results['stop-seconds'] = round(time.time() - started, 2)
+    return window.results
 
 
 def resume_unit_helper(configs):
@@ -1878,9 +2494,14 @@ def resume_unit_helper(configs):
     Uses charmhelpers.contrib.openstack.utils.resume_unit() to do the work.
 
     @param configs: a templating.OSConfigRenderer() object
-    @returns None - this function is executed for its side-effect
+    @returns dict of timings for the action results
     """
+    window = MaintenanceWindow()
+    started = time.time()
     _pause_resume_helper(resume_unit, configs)
+    window.restore()
+    window.results['start-seconds'] = round(time.time() - started, 2)
+    return window.results
 
 
 def _pause_resume_helper(f, configs):
@@ -1893,7 +2514,8 @@ def _pause_resume_helper(f, configs):
     """
     f(assess_status_func(configs),
       services=services(),
-      ports=determine_ports())
+      ports=determine_ports(),
+      tiers=SERVICE_TIERS)
 
 
 def post_snap_install():
@@ -1915,3 +2537,21 @@ def restart_keystone():
             service_restart('snap.keystone.*')
         else:
             service_restart(keystone_service())
+
+
+def reload_keystone():
+    """Make keystone re-read its configuration, gracefully if possible.
+
+    keystone running under apache or the snap's uwsgi is reloaded, which
+    replaces the WSGI processes without dropping in-flight requests; nginx
+    in front of uwsgi does not read the keystone configuration and is left
+    running. The standalone eventlet service is restarted.
+    """
+    if is_unit_paused_set():
+        return
+    if snap_install_requested():
+        service_reload('snap.keystone.uwsgi', restart_on_failure=True)
+    elif run_in_apache():
+        service_reload(keystone_service())
+    else:
+        service_restart(keystone_service())
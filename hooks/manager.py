@@ -173,6 +173,16 @@ class KeystoneManager2(KeystoneManager):
     def add_user_role(self, user, role, tenant, domain):
         self.api.roles.add_user_role(user=user, role=role, tenant=tenant)
 
+    def role_assignments_for_user(self, user_id, tenant_id=None):
+        """Return the user's roles on tenant_id as a set of
+        (role_id, tenant_id, None) tuples.
+
+        The v2.0 API has no role assignment listing so only the given
+        tenant is asked about.
+        """
+        return set((r.id, tenant_id, None)
+                   for r in self.roles_for_user(user_id, tenant_id))
+
 
 class KeystoneManager3(KeystoneManager):
 
@@ -268,6 +278,25 @@ class KeystoneManager3(KeystoneManager):
         if tenant:
             self.api.roles.grant(role, user=user, project=tenant)
 
+    def role_assignments_for_user(self, user_id, tenant_id=None):
+        """Return all of the user's role assignments as a set of
+        (role_id, project_id, domain_id) tuples, with one of project_id and
+        domain_id None, using a single request.
+
+        Inherited assignments apply to the projects below their scope rather
+        than to the scope itself, so they are not included.
+        """
+        assignments = set()
+        for a in self.api.role_assignments.list(user=user_id):
+            scope = getattr(a, 'scope', {})
+            if 'OS-INHERIT:inherited_to' in scope:
+                continue
+            if 'project' in scope:
+                assignments.add((a.role['id'], scope['project']['id'], None))
+            elif 'domain' in scope:
+                assignments.add((a.role['id'], None, scope['domain']['id']))
+        return assignments
+
     def find_endpoint_v3(self, interface, service_id, region):
         found_eps = []
         for ep in self.api.endpoints.list():
@@ -12,7 +12,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import atexit
+import os
+import shutil
 import sys
+import tempfile
 
 sys.path.append('actions/')
 sys.path.append('hooks/')
+
+# Keep the unit state db opened through unitdata.kv() out of the tree.
+_unit_state_dir = tempfile.mkdtemp()
+atexit.register(shutil.rmtree, _unit_state_dir, True)
+os.environ['UNIT_STATE_DB'] = os.path.join(_unit_state_dir, '.unit-state.db')
@@ -15,7 +15,7 @@
 import mock
 from mock import patch
 
-from test_utils import CharmTestCase
+from test_utils import CharmTestCase, patch_open
 
 with patch('actions.hooks.charmhelpers.contrib.openstack.utils.'
            'snap_install_requested') as snap_install_requested, \
@@ -29,22 +29,66 @@ class PauseTestCase(CharmTestCase):
 
     def setUp(self):
         super(PauseTestCase, self).setUp(
-            actions.actions, ["pause_unit_helper"])
+            actions.actions, ["pause_unit_helper", "action_set"])
 
     def test_pauses_services(self):
+        self.pause_unit_helper.return_value = {'stop-seconds': 1.0}
         actions.actions.pause([])
         self.pause_unit_helper.assert_called_once_with('test-config')
+        self.action_set.assert_called_once_with({'stop-seconds': 1.0})
 
 
 class ResumeTestCase(CharmTestCase):
 
     def setUp(self):
         super(ResumeTestCase, self).setUp(
-            actions.actions, ["resume_unit_helper"])
+            actions.actions, ["resume_unit_helper", "action_set"])
 
-    def test_pauses_services(self):
+    def test_resumes_services(self):
+        self.resume_unit_helper.return_value = {
+            'start-seconds': 1.0, 'local-unavailable-seconds': 3.5}
         actions.actions.resume([])
         self.resume_unit_helper.assert_called_once_with('test-config')
+        self.action_set.assert_called_once_with(
+            {'start-seconds': 1.0, 'local-unavailable-seconds': 3.5})
+
+
+class BenchmarkTestCase(CharmTestCase):
+
+    def setUp(self):
+        super(BenchmarkTestCase, self).setUp(
+            actions.actions, ["action_get", "action_set",
+                              "benchmark_credentials", "benchmark_endpoints",
+                              "get_api_version", "keystone_benchmark"])
+        self.action_get.side_effect = {'count': 3, 'target': 'local'}.get
+        self.get_api_version.return_value = 3
+
+    def test_benchmark(self):
+        self.benchmark_credentials.return_value = {'username': 'admin'}
+        self.benchmark_endpoints.return_value = ['http://localhost:35347/v3/']
+        self.keystone_benchmark.benchmark.return_value = {
+            'requests': 6, 'errors': 0, 'rps': 12.34,
+            'token': {'p50': 10.0, 'p95': 20.0, 'p99': 30.0},
+            'catalog': {'p50': 1.0, 'p95': 2.0, 'p99': None}}
+        actions.actions.benchmark([])
+        self.benchmark_endpoints.assert_called_once_with('local')
+        self.keystone_benchmark.benchmark.assert_called_once_with(
+            'http://localhost:35347/v3/', {'username': 'admin'}, 3, 3)
+        self.action_set.assert_called_once_with({
+            'endpoint-0.endpoint': 'http://localhost:35347/v3/',
+            'endpoint-0.requests': 6,
+            'endpoint-0.errors': 0,
+            'endpoint-0.requests-per-second': '12.3',
+            'endpoint-0.token-p50-ms': '10.0',
+            'endpoint-0.token-p95-ms': '20.0',
+            'endpoint-0.token-p99-ms': '30.0',
+            'endpoint-0.catalog-p50-ms': '1.0',
+            'endpoint-0.catalog-p95-ms': '2.0'})
+
+    def test_benchmark_no_credentials(self):
+        self.benchmark_credentials.return_value = None
+        self.assertRaises(Exception, actions.actions.benchmark, [])
+        self.assertFalse(self.keystone_benchmark.benchmark.called)
 
 
 class MainTestCase(CharmTestCase):
@@ -79,3 +123,32 @@ class MainTestCase(CharmTestCase):
         with mock.patch.dict(actions.actions.ACTIONS, {"foo": dummy_action}):
             actions.actions.main(["foo"])
         self.assertEqual(dummy_calls, ["uh oh"])
+
+
+class ImportCatalogTestCase(CharmTestCase):
+
+    def setUp(self):
+        super(ImportCatalogTestCase, self).setUp(
+            actions.actions, ["action_get", "action_set",
+                              "is_elected_leader", "keystone_catalog"])
+        self.action_get.side_effect = {'path': '/tmp/snapshot.yaml',
+                                       'dry-run': True}.get
+
+    def test_import_catalog_not_leader(self):
+        self.is_elected_leader.return_value = False
+        self.assertRaises(Exception, actions.actions.import_catalog, [])
+        self.assertFalse(self.keystone_catalog.import_catalog.called)
+
+    def test_import_catalog(self):
+        self.is_elected_leader.return_value = True
+        self.keystone_catalog.import_catalog.return_value = [
+            'create-role Member']
+        with patch_open() as (_open, _file):
+            _file.read.return_value = 'version: 1'
+            actions.actions.import_catalog([])
+        self.keystone_catalog.load_snapshot.assert_called_once_with(
+            'version: 1')
+        self.keystone_catalog.import_catalog.assert_called_once_with(
+            self.keystone_catalog.load_snapshot.return_value, dry_run=True)
+        self.action_set.assert_called_once_with(
+            {'operations': 1, 'plan': 'create-role Member'})
@@ -28,7 +28,11 @@ from test_utils import (
 
 TO_PATCH = [
     'do_openstack_upgrade',
-    'os',
+    'subprocess',
+    'MaintenanceWindow',
+    'action_set',
+    'config',
+    'openstack_upgrade_available',
 ]
 
 
@@ -51,23 +55,55 @@ class TestKeystoneUpgradeActions(CharmTestCase):
                                     action_set, config, reg_configs):
         upgrade_avail.return_value = True
         config.return_value = True
+        self.openstack_upgrade_available.return_value = True
+        self.config.return_value = True
 
         openstack_upgrade.openstack_upgrade()
 
         self.assertTrue(self.do_openstack_upgrade.called)
-        self.os.execl.assert_called_with('./hooks/config-changed-postupgrade',
-                                         '')
+        self.subprocess.check_call.assert_called_with(
+            ['./hooks/config-changed-postupgrade'])
+        window = self.MaintenanceWindow.return_value
+        window.drain.assert_called_once_with()
+        window.restore.assert_called_once_with()
+        self.action_set.assert_called_once_with(window.results)
 
     @patch.object(openstack_upgrade, 'register_configs')
     @patch('charmhelpers.contrib.openstack.utils.config')
     @patch('charmhelpers.contrib.openstack.utils.action_set')
     @patch('charmhelpers.contrib.openstack.utils.openstack_upgrade_available')
-    def test_openstack_upgrade_false(self, upgrade_avail,
-                                     action_set, config, reg_configs):
+    def test_openstack_upgrade_not_configured(self, upgrade_avail,
+                                              action_set, config,
+                                              reg_configs):
         upgrade_avail.return_value = True
         config.return_value = False
+        self.openstack_upgrade_available.return_value = True
+        self.config.return_value = False
 
         openstack_upgrade.openstack_upgrade()
 
         self.assertFalse(self.do_openstack_upgrade.called)
-        self.assertFalse(self.os.execl.called)
+        self.assertFalse(self.subprocess.check_call.called)
+        self.assertFalse(self.MaintenanceWindow.called)
+        action_set.assert_called_once_with(
+            {'outcome': 'action-managed-upgrade config is False, '
+                        'skipped upgrade.'})
+
+    @patch.object(openstack_upgrade, 'register_configs')
+    @patch('charmhelpers.contrib.openstack.utils.config')
+    @patch('charmhelpers.contrib.openstack.utils.action_set')
+    @patch('charmhelpers.contrib.openstack.utils.openstack_upgrade_available')
+    def test_openstack_upgrade_not_available(self, upgrade_avail,
+                                             action_set, config,
+                                             reg_configs):
+        upgrade_avail.return_value = False
+        config.return_value = True
+        self.openstack_upgrade_available.return_value = False
+        self.config.return_value = True
+
+        openstack_upgrade.openstack_upgrade()
+
+        self.assertFalse(self.do_openstack_upgrade.called)
+        self.assertFalse(self.MaintenanceWindow.called)
+        action_set.assert_called_once_with(
+            {'outcome': 'no upgrade available.'})
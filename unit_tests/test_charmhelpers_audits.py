@@ -0,0 +1,201 @@
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import stat
+import tempfile
+import threading
+
+from mock import patch
+
+from test_utils import CharmTestCase
+
+from charmhelpers.contrib.hardening import audits
+from charmhelpers.contrib.hardening.audits import apache
+from charmhelpers.contrib.hardening.audits.file import BaseFileAudit
+
+TO_PATCH = [
+    'log',
+]
+
+APACHE_TO_PATCH = [
+    'log',
+    'request_restart',
+    'subprocess',
+]
+
+MODS_ENABLED = {
+    'alias.load': 'LoadModule alias_module '
+                  '/usr/lib/apache2/modules/mod_alias.so\n',
+    'php7.0.load': '# Conflicts: php5\n'
+                   'LoadModule php7_module '
+                   '/usr/lib/apache2/modules/libphp7.0.so\n',
+    'wsgi.load': '  LoadModule wsgi_module '
+                 '/usr/lib/apache2/modules/mod_wsgi.so\n',
+    'cgi.load': '# LoadModule cgi_module '
+                '/usr/lib/apache2/modules/mod_cgi.so\n',
+    'status.conf': 'LoadModule status_module mod_status.so\n',
+}
+
+
+class ModeAudit(BaseFileAudit):
+    """Sets a file's permission bits, recording the thread it ran in."""
+
+    def __init__(self, paths, mode, calls):
+        super(ModeAudit, self).__init__(paths)
+        self.mode = mode
+        self.calls = calls
+
+    def is_compliant(self, path):
+        self.calls.append((self, threading.current_thread().ident))
+        return stat.S_IMODE(self._get_stat(path).st_mode) == self.mode
+
+    def comply(self, path):
+        os.chmod(path, self.mode)
+
+
+class ChmodAudit(audits.BaseAudit):
+    """A serial audit which changes a file without forgetting its stat."""
+
+    def __init__(self, path, mode):
+        super(ChmodAudit, self).__init__()
+        self.path = path
+        self.mode = mode
+
+    def ensure_compliance(self):
+        audits.cached_stat(self.path)
+        os.chmod(self.path, self.mode)
+
+
+class TestRunAudits(CharmTestCase):
+
+    def setUp(self):
+        super(TestRunAudits, self).setUp(audits, TO_PATCH)
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, 'file')
+        with open(self.path, 'w'):
+            pass
+        os.chmod(self.path, 0o644)
+        self.calls = []
+
+    def test_stat_once_per_batch(self):
+        batch = [ModeAudit(self.path, 0o644, self.calls),
+                 ModeAudit(self.tmpdir, 0o700, self.calls)]
+        with patch.object(audits.os, 'stat', wraps=os.stat) as _stat:
+            self.assertEqual(audits.run_audits(batch + batch, 'Test'), 0)
+        self.assertEqual(sorted(c[0][0] for c in _stat.call_args_list),
+                         sorted([self.path, self.tmpdir]))
+
+    def test_same_path_audits_run_in_order(self):
+        batch = [ModeAudit(self.path, 0o600, self.calls),
+                 ModeAudit(self.tmpdir, 0o700, self.calls),
+                 ModeAudit(self.path, 0o600, self.calls)]
+        self.assertEqual(audits.run_audits(batch, 'Test'), 1)
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+        self.assertEqual(batch[0].non_compliant, [self.path])
+        # The second audit of the path saw the first one's fix.
+        self.assertEqual(batch[2].non_compliant, [])
+        path_calls = [c for c in self.calls if c[0] is not batch[1]]
+        self.assertEqual([c[0] for c in path_calls], [batch[0], batch[2]])
+        self.assertEqual(path_calls[0][1], path_calls[1][1])
+
+    def test_serial_audit_drops_cached_stats(self):
+        batch = [ChmodAudit(self.path, 0o600),
+                 ModeAudit(self.path, 0o600, self.calls)]
+        self.assertEqual(audits.run_audits(batch, 'Test'), 0)
+
+    @patch.object(audits, '_stat_cache', {})
+    def test_comply_failure_drops_cached_stat(self):
+        audit = ModeAudit(self.path, 0o600, self.calls)
+        with patch.object(audit, 'comply') as comply:
+            comply.side_effect = OSError
+            self.assertRaises(OSError, audit.ensure_compliance)
+        self.assertNotIn(self.path, audits._stat_cache)
+
+    @patch.object(audits, '_stat_cache', {})
+    def test_forget_stat_during_inserts(self):
+        errors = []
+
+        def stat_paths(n):
+            try:
+                for i in range(2000):
+                    audits.cached_stat(os.path.join(self.tmpdir, n, str(i)))
+            except Exception as e:
+                errors.append(e)
+
+        workers = [threading.Thread(target=stat_paths, args=(str(n),))
+                   for n in range(4)]
+        for worker in workers:
+            worker.start()
+        while any(worker.is_alive() for worker in workers):
+            audits.forget_stat(os.path.join(self.tmpdir, '0'))
+        for worker in workers:
+            worker.join()
+        self.assertEqual(errors, [])
+        audits.forget_stat(os.path.join(self.tmpdir, '0'))
+        self.assertEqual(
+            sorted(set(os.path.basename(os.path.dirname(p))
+                       for p in audits._stat_cache)), ['1', '2', '3'])
+
+    def test_path_groups(self):
+        paths = ['/etc/apache2', '/etc/ssh/sshd_config',
+                 '/etc/apache2/apache2.conf', '/etc/apache2-extra',
+                 ['/etc/ssh/', '/etc/mysql'], '/etc/mysql/my.cnf']
+        batch = [ModeAudit(p, 0o600, self.calls) for p in paths]
+        self.assertEqual(audits._path_groups(batch), [
+            [batch[0], batch[2]],
+            [batch[1], batch[4], batch[5]],
+            [batch[3]],
+        ])
+
+
+class TestApacheModules(CharmTestCase):
+
+    def setUp(self):
+        super(TestApacheModules, self).setUp(apache, APACHE_TO_PATCH)
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        os.mkdir(os.path.join(self.tmpdir, 'mods-enabled'))
+        for name, content in MODS_ENABLED.items():
+            with open(os.path.join(self.tmpdir, 'mods-enabled', name),
+                      'w') as f:
+                f.write(content)
+
+    def test_enabled_modules(self):
+        self.assertEqual(apache.enabled_modules(self.tmpdir), {
+            'alias': 'alias',
+            'php7': 'php7.0',
+            'wsgi': 'wsgi',
+        })
+
+    def test_enabled_modules_missing_dir(self):
+        self.assertEqual(
+            apache.enabled_modules(os.path.join(self.tmpdir, 'missing')), {})
+
+    @patch.object(apache, 'enabled_modules')
+    def test_disabled_module_audit(self, enabled_modules):
+        enabled_modules.return_value = {'alias': 'alias', 'php7': 'php7.0'}
+        apache.DisabledModuleAudit(['php7', 'cgi']).ensure_compliance()
+        self.subprocess.check_call.assert_called_once_with(
+            ['a2dismod', 'php7.0'])
+        self.request_restart.assert_called_once_with('apache2')
+
+    @patch.object(apache, 'enabled_modules')
+    def test_disabled_module_audit_compliant(self, enabled_modules):
+        enabled_modules.return_value = {'alias': 'alias'}
+        apache.DisabledModuleAudit('cgi').ensure_compliance()
+        self.assertFalse(self.subprocess.check_call.called)
+        self.assertFalse(self.request_restart.called)
@@ -0,0 +1,103 @@
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from subprocess import CalledProcessError
+
+from test_utils import CharmTestCase
+
+from charmhelpers.contrib.hahelpers import cluster
+
+TO_PATCH = [
+    'is_crm_leader',
+    'juju_is_leader',
+    'log',
+    'peer_units',
+    'relation_get',
+    'relation_ids',
+    'relation_list',
+]
+
+
+class TestLeadershipCache(CharmTestCase):
+
+    def setUp(self):
+        super(TestLeadershipCache, self).setUp(cluster, TO_PATCH)
+        cluster.clear_leadership_cache()
+        self.addCleanup(cluster.clear_leadership_cache)
+        self.relation_ids.return_value = ['ha:1']
+        self.relation_list.return_value = ['hacluster/0']
+
+    def test_is_elected_leader_cached(self):
+        self.juju_is_leader.return_value = True
+        self.assertTrue(cluster.is_elected_leader('res'))
+        self.juju_is_leader.return_value = False
+        self.assertTrue(cluster.is_elected_leader('res'))
+        self.juju_is_leader.assert_called_once_with()
+
+    def test_is_elected_leader_cached_per_resource(self):
+        self.juju_is_leader.side_effect = NotImplementedError
+        self.relation_get.return_value = 'yes'
+        self.is_crm_leader.side_effect = lambda r: r == 'res1'
+        self.assertTrue(cluster.is_elected_leader('res1'))
+        self.assertFalse(cluster.is_elected_leader('res2'))
+        self.assertTrue(cluster.is_elected_leader('res1'))
+        self.assertFalse(cluster.is_elected_leader('res2'))
+        self.assertEqual(self.is_crm_leader.call_count, 2)
+        # is_clustered() was shared by both resources.
+        self.relation_get.assert_called_once_with('clustered', rid='ha:1',
+                                                  unit='hacluster/0')
+
+    def test_clear_leadership_cache(self):
+        self.juju_is_leader.return_value = False
+        self.relation_get.return_value = None
+        self.assertFalse(cluster.is_elected_leader('res'))
+        self.assertFalse(cluster.is_clustered())
+        self.juju_is_leader.return_value = True
+        self.relation_get.return_value = 'yes'
+        cluster.clear_leadership_cache()
+        self.assertTrue(cluster.is_elected_leader('res'))
+        self.assertTrue(cluster.is_clustered())
+        self.assertEqual(self.juju_is_leader.call_count, 2)
+        self.assertEqual(self.relation_get.call_count, 2)
+
+
+class TestCrmTimings(CharmTestCase):
+
+    def setUp(self):
+        super(TestCrmTimings, self).setUp(
+            cluster, ['get_unit_hostname', 'log', 'subprocess', 'time'])
+        self.get_unit_hostname.return_value = 'juju-machine-1'
+        self.time.time.side_effect = [10.0, 10.5]
+
+    def test_is_crm_dc_timed(self):
+        self.subprocess.check_output.return_value = (
+            b'Current DC: juju-machine-1 (1) - partition with quorum\n')
+        self.assertTrue(cluster.is_crm_dc())
+        self.log.assert_called_once_with('crm status took 0.50s',
+                                         level=cluster.DEBUG)
+
+    def test_is_crm_leader_timed(self):
+        self.subprocess.check_output.return_value = (
+            b'resource res is running on: juju-machine-1\n')
+        self.assertTrue(cluster.is_crm_leader('res'))
+        self.log.assert_called_once_with('crm resource show res took 0.50s',
+                                         level=cluster.DEBUG)
+
+    def test_failed_crm_call_timed(self):
+        self.subprocess.CalledProcessError = CalledProcessError
+        self.subprocess.check_output.side_effect = CalledProcessError(
+            1, 'crm')
+        self.assertFalse(cluster.is_crm_leader('res'))
+        self.log.assert_called_once_with('crm resource show res took 0.50s',
+                                         level=cluster.DEBUG)
@@ -0,0 +1,102 @@
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+
+from mock import patch
+
+from test_utils import CharmTestCase
+
+from charmhelpers.fetch import ubuntu
+
+TO_PATCH = [
+    'log',
+    'subprocess',
+]
+
+DPKG_STATUS = """\
+Package: keystone
+Status: install ok installed
+Priority: optional
+Version: 2:13.0.0-0ubuntu1
+Description: OpenStack identity service
+ Status: not a field
+ Version: 1.0
+
+Package: apache2
+Status: deinstall ok config-files
+Version: 2.4.29-1ubuntu4
+
+Package: python-keystone
+Status: install ok installed
+Version: 13.0.0-0ubuntu1
+"""
+
+
+class TestDpkgStatusIndex(CharmTestCase):
+
+    def setUp(self):
+        super(TestDpkgStatusIndex, self).setUp(ubuntu, TO_PATCH)
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.status = os.path.join(self.tmpdir, 'status')
+        self._write_status(DPKG_STATUS, 1000)
+        _patch = patch.object(ubuntu, 'DPKG_STATUS', self.status)
+        _patch.start()
+        self.addCleanup(_patch.stop)
+        ubuntu._dpkg_index.clear()
+        self.addCleanup(ubuntu._dpkg_index.clear)
+
+    def _write_status(self, content, mtime):
+        with open(self.status, 'w') as f:
+            f.write(content)
+        os.utime(self.status, (mtime, mtime))
+
+    def test_installed_packages(self):
+        self.assertEqual(ubuntu.installed_packages(), {
+            'keystone': '2:13.0.0-0ubuntu1',
+            'python-keystone': '13.0.0-0ubuntu1',
+        })
+        self.assertEqual(ubuntu.get_upstream_version('keystone'), '13.0.0')
+        self.assertEqual(ubuntu.get_upstream_version('apache2'), None)
+
+    def test_installed_packages_reparsed_on_change(self):
+        self.assertEqual(ubuntu.installed_version('apache2'), None)
+        self._write_status(DPKG_STATUS.replace('deinstall ok config-files',
+                                               'install ok installed'), 2000)
+        self.assertEqual(ubuntu.installed_version('apache2'),
+                         '2.4.29-1ubuntu4')
+
+    def test_installed_packages_reused(self):
+        ubuntu.installed_packages()
+        with patch.object(ubuntu, 'open', create=True) as _open:
+            ubuntu.installed_packages()
+        self.assertFalse(_open.called)
+
+    def test_installed_packages_missing_status(self):
+        os.remove(self.status)
+        self.assertEqual(ubuntu.installed_packages(), {})
+
+    def test_filter_installed_packages(self):
+        self.assertEqual(
+            ubuntu.filter_installed_packages(
+                ['keystone', 'apache2', 'haproxy']),
+            ['apache2', 'haproxy'])
+
+    def test_apt_install_nothing(self):
+        ubuntu.apt_install(ubuntu.filter_installed_packages(['keystone']))
+        self.assertFalse(self.subprocess.call.called)
+        self.assertFalse(self.subprocess.check_call.called)
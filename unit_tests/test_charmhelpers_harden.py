@@ -0,0 +1,105 @@
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import sys
+import tempfile
+
+from mock import MagicMock, patch
+
+from test_utils import CharmTestCase
+
+# python-apt is not installed as part of test-requirements but is imported by
+# some charmhelpers modules so create a fake import.
+sys.modules['apt'] = MagicMock()
+
+from charmhelpers.contrib.hardening import harden  # noqa: E402
+from charmhelpers.core import unitdata  # noqa: E402
+
+TO_PATCH = [
+    'get_settings',
+    'log',
+    'time',
+    'unitdata',
+]
+
+
+class TestRunModule(CharmTestCase):
+
+    def setUp(self):
+        super(TestRunModule, self).setUp(harden, TO_PATCH)
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.kv = unitdata.Storage(os.path.join(self.tmpdir, 'state.db'))
+        self.addCleanup(self.kv.close)
+        self.unitdata.kv.return_value = self.kv
+        self.get_settings.return_value = {'sysctl': {'forwarding': False}}
+        self.time.time.return_value = 1000
+        self.conf = os.path.join(self.tmpdir, 'login.defs')
+        self._write(self.conf, 'UMASK 027\n')
+        self.sysctl = os.path.join(self.tmpdir, 'proc', 'net', 'ipv4',
+                                   'ip_forward')
+        os.makedirs(os.path.dirname(self.sysctl))
+        self._write(self.sysctl, '0\n')
+        for name, value in (
+                ('AUDITED_PATHS', {'os': [self.conf]}),
+                ('AUDITED_SYSCTLS', {'os': ['net.ipv4.ip_forward']}),
+                ('SYSCTL_ROOT', os.path.join(self.tmpdir, 'proc')),
+                ('__AUDITED__', set())):
+            _patch = patch.object(harden, name, value)
+            _patch.start()
+            self.addCleanup(_patch.stop)
+        self.hardener = MagicMock(__name__='run_os_checks')
+
+    def _write(self, path, content):
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def _rerun(self):
+        harden.__AUDITED__.clear()
+        self.hardener.reset_mock()
+        return harden.run_module('os', self.hardener)
+
+    def test_run_module_once_per_hook(self):
+        self.assertTrue(harden.run_module('os', self.hardener))
+        self.assertFalse(harden.run_module('os', self.hardener))
+        self.hardener.assert_called_once_with()
+
+    def test_run_module_skipped_when_unchanged(self):
+        self.assertTrue(harden.run_module('os', self.hardener))
+        self.assertFalse(self._rerun())
+        self.assertFalse(self.hardener.called)
+
+    def test_run_module_audited_path_changed(self):
+        harden.run_module('os', self.hardener)
+        self._write(self.conf, 'UMASK 022\n')
+        self.assertTrue(self._rerun())
+        self.hardener.assert_called_once_with()
+
+    def test_run_module_sysctl_changed(self):
+        harden.run_module('os', self.hardener)
+        self._write(self.sysctl, '1\n')
+        self.assertTrue(self._rerun())
+        self.hardener.assert_called_once_with()
+
+    def test_run_module_settings_changed(self):
+        harden.run_module('os', self.hardener)
+        self.get_settings.return_value = {'sysctl': {'forwarding': True}}
+        self.assertTrue(self._rerun())
+
+    def test_run_module_refresh_interval(self):
+        harden.run_module('os', self.hardener)
+        self.time.time.return_value = 1000 + harden.AUDIT_REFRESH_INTERVAL
+        self.assertTrue(self._rerun())
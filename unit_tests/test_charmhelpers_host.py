@@ -0,0 +1,166 @@
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+from collections import OrderedDict
+
+from mock import call, patch, MagicMock
+
+from test_utils import CharmTestCase, patch_open
+
+from charmhelpers.core import host
+
+TO_PATCH = [
+    'atexit',
+    'init_is_systemd',
+    'log',
+    'service_running',
+]
+
+PROC_NET_TCP = [
+    '  sl  local_address rem_address   st tx_queue rx_queue tr tm->when\n',
+    '   0: 00000000:1388 00000000:0000 0A 00000000:00000000 00:00000000\n',
+    '   1: 0100007F:8AE3 00000000:0000 0A 00000000:00000000 00:00000000\n',
+    '   2: 0A00000A:1388 0A00000B:D431 01 00000000:00000000 00:00000000\n',
+]
+
+
+class TestStatusProbes(CharmTestCase):
+
+    def setUp(self):
+        super(TestStatusProbes, self).setUp(host, TO_PATCH)
+        host.clear_status_probe_cache()
+        self.addCleanup(host.clear_status_probe_cache)
+        self.init_is_systemd.return_value = True
+
+    def test_services_running(self):
+        self.service_running.side_effect = lambda s: s != 'apache2'
+        self.assertEqual(
+            host.services_running(['keystone', 'apache2', 'keystone']),
+            OrderedDict([('keystone', True), ('apache2', False)]))
+        self.assertEqual(
+            sorted(self.service_running.call_args_list),
+            [call('apache2'), call('keystone')])
+
+    def test_services_running_cached(self):
+        self.service_running.return_value = True
+        host.services_running(['keystone'])
+        self.service_running.return_value = False
+        self.assertEqual(host.services_running(['keystone', 'apache2']),
+                         OrderedDict([('keystone', True),
+                                      ('apache2', False)]))
+        self.assertEqual(self.service_running.call_count, 2)
+
+    def test_services_running_timeout(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def _service_running(service_name):
+            if service_name == 'hung':
+                release.wait(5)
+            return True
+
+        self.service_running.side_effect = _service_running
+        self.assertEqual(host.services_running(['keystone', 'hung'],
+                                               timeout=0.2),
+                         OrderedDict([('keystone', True), ('hung', False)]))
+        self.assertTrue(self.log.called)
+
+    def test_listening_ports(self):
+        with patch_open() as (_open, _file):
+            _file.readlines.return_value = PROC_NET_TCP
+            self.assertEqual(host.listening_ports(), set([5000, 35555]))
+            self.assertEqual(host.listening_ports(), set([5000, 35555]))
+        self.assertEqual(_open.call_args_list,
+                         [call('/proc/net/tcp'), call('/proc/net/tcp6')])
+
+    def test_listening_ports_missing_proc(self):
+        with patch('__builtin__.open') as _open:
+            _open.side_effect = IOError
+            self.assertEqual(host.listening_ports(), set())
+
+    @patch.object(host.subprocess, 'call')
+    def test_service_action_clears_cache(self, _call):
+        _call.return_value = 0
+        self.service_running.return_value = False
+        host.services_running(['keystone'])
+        host.service('status', 'keystone')
+        host.services_running(['keystone'])
+        self.assertEqual(self.service_running.call_count, 1)
+        host.service('start', 'keystone')
+        self.service_running.return_value = True
+        self.assertEqual(host.services_running(['keystone']),
+                         OrderedDict([('keystone', True)]))
+        self.assertEqual(self.service_running.call_count, 2)
+
+
+class TestRequestRestart(CharmTestCase):
+
+    def setUp(self):
+        super(TestRequestRestart, self).setUp(host, TO_PATCH)
+        host._requested_restarts.clear()
+        self.addCleanup(host._requested_restarts.clear)
+        self.init_is_systemd.return_value = True
+        _patch = patch.object(host.subprocess, 'call')
+        self.call = _patch.start()
+        self.addCleanup(_patch.stop)
+        self.call.return_value = 0
+
+    def test_request_restart_once(self):
+        host.request_restart('apache2')
+        host.request_restart('haproxy')
+        host.request_restart('apache2')
+        self.atexit.assert_called_once_with(host.run_requested_restarts)
+        self.assertFalse(self.call.called)
+        host.run_requested_restarts()
+        self.assertEqual(self.call.call_args_list, [
+            call(['systemctl', 'restart', 'apache2']),
+            call(['systemctl', 'restart', 'haproxy']),
+        ])
+        host.run_requested_restarts()
+        self.assertEqual(self.call.call_count, 2)
+
+    def test_request_restart_function(self):
+        restart = MagicMock()
+        host.request_restart('apache2', restart)
+        host.request_restart('apache2')
+        host.run_requested_restarts()
+        restart.assert_called_once_with('apache2')
+        self.assertFalse(self.call.called)
+
+    def test_service_restart_cancels_request(self):
+        host.request_restart('apache2')
+        host.request_restart('haproxy')
+        host.service_restart('apache2')
+        host.service('reload', 'haproxy')
+        host.run_requested_restarts()
+        self.assertEqual(self.call.call_args_list, [
+            call(['systemctl', 'restart', 'apache2']),
+            call(['systemctl', 'reload', 'haproxy']),
+            call(['systemctl', 'restart', 'haproxy']),
+        ])
+
+    def test_cancel_restart(self):
+        host.request_restart('apache2')
+        host.cancel_restart('apache2')
+        host.cancel_restart('haproxy')
+        host.run_requested_restarts()
+        self.assertFalse(self.call.called)
+
+    def test_request_restart_scheduled_per_queue(self):
+        host.request_restart('apache2')
+        host.run_requested_restarts()
+        host.request_restart('apache2')
+        self.assertEqual(self.atexit.call_count, 2)
@@ -0,0 +1,64 @@
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from mock import MagicMock
+
+from test_utils import CharmTestCase
+
+from charmhelpers.contrib.network import ip
+
+TO_PATCH = [
+    'config',
+    'network_get_primary_address',
+    'unit_get',
+]
+
+
+class TestNetworkLookupCache(CharmTestCase):
+
+    def setUp(self):
+        super(TestNetworkLookupCache, self).setUp(ip, TO_PATCH)
+        ip.clear_network_cache()
+        self.addCleanup(ip.clear_network_cache)
+        self.config.return_value = None
+
+    def test_memoize_lookup(self):
+        lookup = MagicMock(return_value='10.0.0.1')
+        self.assertEqual(ip.memoize_lookup(lookup, 'admin'), '10.0.0.1')
+        self.assertEqual(ip.memoize_lookup(lookup, 'admin'), '10.0.0.1')
+        lookup.assert_called_once_with('admin')
+        ip.memoize_lookup(lookup, 'public')
+        self.assertEqual(lookup.call_count, 2)
+
+    def test_memoize_lookup_list_args(self):
+        lookup = MagicMock(return_value=['fd00::1'])
+        ip.memoize_lookup(lookup, ['10.0.0.1'])
+        ip.memoize_lookup(lookup, ['10.0.0.1'])
+        lookup.assert_called_once_with(['10.0.0.1'])
+
+    def test_memoize_lookup_exceptions(self):
+        lookup = MagicMock(side_effect=ip.NoNetworkBinding('admin'))
+        for _ in range(2):
+            self.assertRaises(ip.NoNetworkBinding, ip.memoize_lookup,
+                              lookup, 'admin')
+        lookup.assert_called_once_with('admin')
+
+    def test_clear_network_cache(self):
+        self.network_get_primary_address.return_value = '10.0.0.1'
+        self.assertEqual(ip.get_relation_ip('admin'), '10.0.0.1')
+        self.network_get_primary_address.return_value = '10.0.0.2'
+        self.assertEqual(ip.get_relation_ip('admin'), '10.0.0.1')
+        ip.clear_network_cache()
+        self.assertEqual(ip.get_relation_ip('admin'), '10.0.0.2')
+        self.assertEqual(self.network_get_primary_address.call_count, 2)
@@ -0,0 +1,130 @@
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+
+from mock import patch
+
+from test_utils import CharmTestCase
+
+from charmhelpers.contrib.charmsupport import nrpe
+from charmhelpers.core import unitdata
+
+TO_PATCH = [
+    'config',
+    'grp',
+    'hook_name',
+    'local_unit',
+    'log',
+    'pwd',
+    'relation_ids',
+    'relation_set',
+    'service',
+    'unitdata',
+]
+
+
+class TestNRPEWrite(CharmTestCase):
+
+    def setUp(self):
+        super(TestNRPEWrite, self).setUp(nrpe, TO_PATCH)
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        for attr in ('nrpe_confdir', 'nagios_exportdir', 'nagios_logdir'):
+            path = os.path.join(self.tmpdir, attr)
+            os.mkdir(path)
+            _patch = patch.object(nrpe.NRPE, attr, path)
+            _patch.start()
+            self.addCleanup(_patch.stop)
+        self.kv = unitdata.Storage(os.path.join(self.tmpdir, 'state.db'))
+        self.addCleanup(self.kv.close)
+        self.unitdata.kv.return_value = self.kv
+        self.config.return_value = {'nagios_context': 'juju'}
+        self.local_unit.return_value = 'keystone/0'
+        self.relation_ids.return_value = []
+        self.hook_name.return_value = 'config-changed'
+
+    def _nrpe(self, *shortnames):
+        compat = nrpe.NRPE(hostname='host')
+        for shortname in shortnames:
+            compat.add_check(shortname, 'check {}'.format(shortname),
+                             'check_http')
+        return compat
+
+    def _files(self):
+        return sorted(
+            os.listdir(nrpe.NRPE.nrpe_confdir) +
+            os.listdir(nrpe.NRPE.nagios_exportdir))
+
+    def test_write_reloads_only_on_change(self):
+        self._nrpe('keystone', 'apache2').write()
+        self.service.assert_called_once_with('reload', 'nagios-nrpe-server')
+        self.assertEqual(self._files(), [
+            'check_apache2.cfg',
+            'check_keystone.cfg',
+            'service__host_check_apache2.cfg',
+            'service__host_check_keystone.cfg',
+        ])
+        check = os.path.join(nrpe.NRPE.nrpe_confdir, 'check_keystone.cfg')
+        os.utime(check, (1000, 1000))
+        self.service.reset_mock()
+        self._nrpe('keystone', 'apache2').write()
+        self.assertFalse(self.service.called)
+        self.assertEqual(os.stat(check).st_mtime, 1000)
+
+    def test_write_removes_stale_checks(self):
+        self._nrpe('keystone', 'apache2').write()
+        self.service.reset_mock()
+        self._nrpe('keystone').write()
+        self.service.assert_called_once_with('reload', 'nagios-nrpe-server')
+        self.assertEqual(self._files(), [
+            'check_keystone.cfg',
+            'service__host_check_keystone.cfg',
+        ])
+        self.assertEqual(self.kv.get(nrpe.NRPE.checks_key), ['keystone'])
+
+    def test_write_no_reload_on_update_status(self):
+        self.hook_name.return_value = 'update-status'
+        self._nrpe('keystone').write()
+        self.assertFalse(self.service.called)
+        self.assertEqual(len(self._files()), 2)
+
+    def test_reload_deferred_from_update_status(self):
+        self.hook_name.return_value = 'update-status'
+        self._nrpe('keystone').write()
+        self.assertFalse(nrpe.reload_pending())
+        self.hook_name.return_value = 'config-changed'
+        # The next hook does not change any check.
+        self._nrpe('keystone').write()
+        self.service.assert_called_once_with('reload', 'nagios-nrpe-server')
+        self.assertIsNone(self.kv.get(nrpe.NRPE.reload_key))
+        self.assertFalse(nrpe.reload_pending())
+        self.assertEqual(self.service.call_count, 1)
+
+    def test_reload_pending_without_write(self):
+        self.hook_name.return_value = 'update-status'
+        self._nrpe('keystone').write()
+        self.hook_name.return_value = 'leader-settings-changed'
+        self.assertTrue(nrpe.reload_pending())
+        self.service.assert_called_once_with('reload', 'nagios-nrpe-server')
+
+    def test_write_if_changed(self):
+        path = os.path.join(self.tmpdir, 'file')
+        self.assertTrue(nrpe._write_if_changed(path, 'a'))
+        self.assertFalse(nrpe._write_if_changed(path, 'a'))
+        self.assertTrue(nrpe._write_if_changed(path, 'b'))
+        with open(path) as f:
+            self.assertEqual(f.read(), 'b')
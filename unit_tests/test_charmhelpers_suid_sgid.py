@@ -0,0 +1,155 @@
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from mock import MagicMock, patch
+
+from test_utils import CharmTestCase
+
+# python-apt is not installed as part of test-requirements but is imported by
+# some charmhelpers modules so create a fake import.
+sys.modules['apt'] = MagicMock()
+
+from charmhelpers.contrib.hardening.host.checks import (  # noqa: E402
+    suid_sgid,
+)
+
+TO_PATCH = [
+    'charm_dir',
+    'log',
+]
+
+TREE = {
+    'bin/su': 0o4755,
+    'bin/wall': 0o2755,
+    'bin/both': 0o6755,
+    'bin/plain': 0o755,
+    'lib/deep/er/helper': 0o2711,
+    'lib/deep/er/suid-helper': 0o4711,
+    'var/mail/spool': 0o644,
+}
+
+
+def find_suid_sgid(root_path):
+    """The scan find_paths_with_suid_sgid used to run."""
+    cmd = ['find', root_path, '-perm', '-4000', '-o', '-perm', '-2000',
+           '-type', 'f', '!', '-path', '/proc/*', '-print']
+    out = subprocess.check_output(cmd).decode('UTF-8')
+    return set(out.split('\n')) - set([''])
+
+
+class TestFindPathsWithSuidSgid(CharmTestCase):
+
+    def setUp(self):
+        super(TestFindPathsWithSuidSgid, self).setUp(suid_sgid, TO_PATCH)
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.charm_dir.return_value = os.path.join(self.tmpdir, 'charm')
+        os.mkdir(self.charm_dir.return_value)
+        self.root = os.path.join(self.tmpdir, 'root')
+        for path, mode in TREE.items():
+            self._create(path, mode)
+        # A sgid directory is not reported by find.
+        os.chmod(os.path.join(self.root, 'var/mail'), 0o2775)
+
+    def _create(self, path, mode):
+        path = os.path.join(self.root, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w'):
+            pass
+        os.chmod(path, mode)
+
+    def _path(self, path):
+        return os.path.join(self.root, path)
+
+    def _index(self):
+        with open(os.path.join(self.charm_dir.return_value,
+                               suid_sgid.SUID_SGID_INDEX)) as f:
+            return json.load(f)
+
+    def test_matches_find(self):
+        found = suid_sgid.find_paths_with_suid_sgid(self.root)
+        self.assertEqual(found, find_suid_sgid(self.root))
+        self.assertEqual(found, set([self._path('bin/wall'),
+                                     self._path('lib/deep/er/helper')]))
+
+    def test_incremental_matches_find(self):
+        suid_sgid.find_paths_with_suid_sgid(self.root)
+        self._create('lib/deep/new', 0o2755)
+        self._create('var/new-suid', 0o4755)
+        os.chmod(self._path('bin/wall'), 0o755)
+        with patch.object(suid_sgid, '_list_dir',
+                          wraps=suid_sgid._list_dir) as _list_dir:
+            found = suid_sgid.find_paths_with_suid_sgid(self.root)
+        self.assertEqual(found, find_suid_sgid(self.root))
+        self.assertIn(self._path('lib/deep/new'), found)
+        self.assertNotIn(self._path('bin/wall'), found)
+        # The root, and the two directories with new entries.
+        self.assertEqual(
+            sorted(c[0][0] for c in _list_dir.call_args_list),
+            [self.root, self._path('lib/deep'), self._path('var')])
+
+    def test_full_rescan(self):
+        suid_sgid.find_paths_with_suid_sgid(self.root)
+        # A chmod does not change the directory mtime.
+        os.chmod(self._path('bin/plain'), 0o2755)
+        self.assertNotIn(self._path('bin/plain'),
+                         suid_sgid.find_paths_with_suid_sgid(self.root))
+        with patch.object(suid_sgid.time, 'time') as _time:
+            _time.return_value = (self._index()['scanned-at'] +
+                                  suid_sgid.FULL_RESCAN_INTERVAL)
+            found = suid_sgid.find_paths_with_suid_sgid(self.root)
+        self.assertEqual(found, find_suid_sgid(self.root))
+
+    def test_index(self):
+        suid_sgid.find_paths_with_suid_sgid(self.root)
+        dirs = self._index()['dirs']
+        self.assertEqual(sorted(dirs), [
+            self._path('bin'), self._path('lib'), self._path('lib/deep'),
+            self._path('lib/deep/er'), self._path('var'),
+            self._path('var/mail')])
+        # Only inode, mtime and the matching files are kept.
+        self.assertEqual(len(dirs[self._path('var')]), 2)
+        self.assertEqual(dirs[self._path('bin')][2:], ['wall'])
+
+    def test_old_index_ignored(self):
+        st = os.lstat(self._path('bin'))
+        with open(os.path.join(self.charm_dir.return_value,
+                               suid_sgid.SUID_SGID_INDEX), 'w') as f:
+            json.dump({'root': self.root, 'scanned-at': time.time(),
+                       'dirs': {self._path('bin'): [
+                           st.st_ino, st.st_mtime, [], ['su']]}}, f)
+        self.assertEqual(suid_sgid.find_paths_with_suid_sgid(self.root),
+                         find_suid_sgid(self.root))
+
+    def test_pruned_mounts(self):
+        mounts = os.path.join(self.tmpdir, 'mounts')
+        with open(mounts, 'w') as f:
+            f.write('proc /proc proc rw 0 0\n'
+                    '/dev/sda1 / ext4 rw 0 0\n'
+                    'tmpfs /run tmpfs rw 0 0\n'
+                    'server:/export /srv/nfs nfs4 rw 0 0\n'
+                    '//server/share /srv/my\\040share cifs rw 0 0\n'
+                    'user@host:/ /mnt/ssh fuse.sshfs rw 0 0\n')
+        self.assertEqual(suid_sgid.pruned_mounts(mounts),
+                         set(['/proc', '/srv/nfs', '/srv/my share',
+                              '/mnt/ssh']))
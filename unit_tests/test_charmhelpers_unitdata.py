@@ -0,0 +1,82 @@
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from mock import patch
+
+from test_utils import CharmTestCase
+
+from charmhelpers.core import unitdata
+
+TO_PATCH = []
+
+
+class TestUnitdataCompaction(CharmTestCase):
+
+    def setUp(self):
+        super(TestUnitdataCompaction, self).setUp(unitdata, TO_PATCH)
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, 'state.db')
+        self.store = unitdata.Storage(self.path)
+        self.addCleanup(self.store.close)
+        for i in range(5):
+            with self.store.hook_scope('hook-{}'.format(i)):
+                self.store.set('key', i)
+
+    def _hooks(self):
+        self.store.cursor.execute('select hook from hooks order by version')
+        return [row[0] for row in self.store.cursor.fetchall()]
+
+    @patch('charmhelpers.core.hookenv.log')
+    def test_compact_history(self, log):
+        self.assertEqual(
+            unitdata.compact_history(keep_revisions=2, path=self.path), 3)
+        self.assertEqual(self._hooks(), ['hook-3', 'hook-4'])
+        self.assertEqual(len(self.store.gethistory('key')), 2)
+        self.assertEqual(self.store.get('key'), 4)
+        self.assertFalse(log.called)
+
+    @patch('charmhelpers.core.hookenv.log')
+    def test_compact_history_locked(self, log):
+        # A write pending on the store holds the db lock.
+        self.store.set('other', 'pending')
+        self.assertEqual(
+            unitdata.compact_history(keep_revisions=1, path=self.path), 0)
+        self.assertTrue(log.called)
+        self.store.flush()
+        self.assertEqual(len(self._hooks()), 5)
+        self.assertEqual(self.store.get('other'), 'pending')
+
+    @patch('charmhelpers.core.hookenv.log')
+    @patch.object(unitdata, '_compact')
+    def test_compact_history_failure_keeps_changes(self, _compact, log):
+        _compact.side_effect = sqlite3.OperationalError('disk I/O error')
+        with self.store.hook_scope('hook-5'):
+            self.store.set('key', 5)
+            self.store.flush()
+            self.assertEqual(unitdata.compact_history(path=self.path), 0)
+        self.assertTrue(log.called)
+        self.assertEqual(self.store.get('key'), 5)
+        self.assertEqual(len(self._hooks()), 6)
+
+    def test_no_covering_value_index(self):
+        self.store.cursor.execute(
+            "select name from sqlite_master where type='index' "
+            "and tbl_name='kv' and sql is not null")
+        self.assertEqual(self.store.cursor.fetchall(), [])
@@ -0,0 +1,69 @@
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from mock import patch
+
+from test_utils import CharmTestCase
+
+import keystone_benchmark as benchmark
+
+
+class TestKeystoneBenchmark(CharmTestCase):
+
+    def setUp(self):
+        super(TestKeystoneBenchmark, self).setUp(benchmark, [])
+
+    def test_percentile(self):
+        samples = range(1, 101)
+        self.assertEqual(benchmark.percentile(samples, 50), 50)
+        self.assertEqual(benchmark.percentile(samples, 95), 95)
+        self.assertEqual(benchmark.percentile(samples, 99), 99)
+        self.assertEqual(benchmark.percentile([7], 99), 7)
+        self.assertEqual(benchmark.percentile([], 50), None)
+
+    @patch.object(benchmark, 'read_catalog')
+    @patch.object(benchmark, 'issue_token')
+    def test_benchmark(self, issue_token, read_catalog):
+        issue_token.return_value = 'token'
+        result = benchmark.benchmark('http://ks/v3', {}, 3, 4)
+        self.assertEqual(issue_token.call_count, 4)
+        read_catalog.assert_called_with('http://ks/v3', 'token', 3)
+        self.assertEqual(result['requests'], 8)
+        self.assertEqual(result['errors'], 0)
+
+    @patch.object(benchmark, 'issue_token')
+    def test_benchmark_errors(self, issue_token):
+        issue_token.side_effect = IOError('refused')
+        result = benchmark.benchmark('http://ks/v3', {}, 3, 2)
+        self.assertEqual(result['errors'], 2)
+        self.assertEqual(result['token']['p95'], None)
+        status, message = benchmark.evaluate([result], 100, 200)
+        self.assertEqual(status, benchmark.NAGIOS_CRITICAL)
+        self.assertIn('refused', message)
+
+    def _result(self, p95):
+        return {'endpoint': 'http://ks/v3', 'errors': 0, 'rps': 10.0,
+                'last-error': None, 'token': {'p95': p95}}
+
+    def test_evaluate(self):
+        self.assertEqual(
+            benchmark.evaluate([self._result(50)], 100, 200)[0],
+            benchmark.NAGIOS_OK)
+        self.assertEqual(
+            benchmark.evaluate([self._result(150)], 100, 200)[0],
+            benchmark.NAGIOS_WARNING)
+        status, message = benchmark.evaluate([self._result(250)], 100, 200)
+        self.assertEqual(status, benchmark.NAGIOS_CRITICAL)
+        self.assertEqual(message, 'CRITICAL: http://ks/v3: token p95 250ms, '
+                                  '10.0 req/s | 0_token_p95=250ms;100;200')
@@ -0,0 +1,195 @@
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from mock import patch, MagicMock
+
+from test_utils import CharmTestCase
+
+with patch('charmhelpers.contrib.openstack.utils.'
+           'snap_install_requested') as snap_install_requested:
+    snap_install_requested.return_value = False
+    import keystone_catalog as catalog
+
+TO_PATCH = [
+    'config',
+    'leader_get',
+    'log',
+    'get_service_password',
+    'set_service_password',
+]
+
+
+def _resource(**kwargs):
+    resource = MagicMock()
+    resource.configure_mock(**kwargs)
+    return resource
+
+
+def _v3_manager():
+    manager = MagicMock()
+    manager.api_version = 3
+    api = manager.api
+    api.domains.list.return_value = [
+        _resource(id='d1', name='service_domain', description='Svc',
+                  enabled=True)]
+    api.projects.list.return_value = [
+        _resource(id='p1', name='services', domain_id='d1', description='',
+                  enabled=True)]
+    api.roles.list.return_value = [_resource(id='r1', name='Admin')]
+    api.services.list.return_value = [
+        _resource(id='s1', name='nova', type='compute', description='Nova')]
+    api.endpoints.list.return_value = [
+        _resource(id='e1', service_id='s1', region='RegionOne',
+                  interface='public', url='http://nova:8774')]
+    api.users.list.return_value = [
+        _resource(id='u1', name='nova', domain_id='d1'),
+        _resource(id='u2', name='somebody', domain_id='d1')]
+    api.role_assignments.list.return_value = [
+        _resource(user={'id': 'u1'}, role={'id': 'r1'},
+                  scope={'project': {'id': 'p1'}}),
+        _resource(user={'id': 'u2'}, role={'id': 'r1'},
+                  scope={'project': {'id': 'p1'}})]
+    return manager
+
+
+class TestKeystoneCatalog(CharmTestCase):
+
+    def setUp(self):
+        super(TestKeystoneCatalog, self).setUp(catalog, TO_PATCH)
+        self.config.return_value = 'admin'
+
+    def test_managed_users(self):
+        self.leader_get.return_value = {'nova_passwd': 'x', 'foo': 'bar'}
+        self.assertEqual(catalog.managed_users(), set(['nova', 'admin']))
+
+    def test_read_catalog(self):
+        snapshot, ids = catalog.read_catalog(_v3_manager(), users=['nova'])
+        self.assertEqual(snapshot['endpoints'], [
+            {'service': 'nova', 'type': 'compute', 'region': 'RegionOne',
+             'interface': 'public', 'url': 'http://nova:8774'}])
+        self.assertEqual(snapshot['users'], [
+            {'name': 'nova', 'domain': 'service_domain',
+             'roles': [{'role': 'Admin', 'project': 'services',
+                        'project_domain': 'service_domain'}]}])
+        self.assertEqual(ids['project'][('service_domain', 'services')],
+                         'p1')
+        self.assertEqual(ids['endpoint'][('nova', 'compute', 'RegionOne',
+                                          'public')],
+                         ('e1', 'http://nova:8774'))
+
+    def test_read_catalog_skips_inherited(self):
+        manager = _v3_manager()
+        manager.api.role_assignments.list.return_value.append(
+            _resource(user={'id': 'u1'}, role={'id': 'r1'},
+                      scope={'domain': {'id': 'd1'},
+                             'OS-INHERIT:inherited_to': 'projects'}))
+        snapshot, _ = catalog.read_catalog(manager, users=['nova'])
+        self.assertEqual(snapshot['users'][0]['roles'], [
+            {'role': 'Admin', 'project': 'services',
+             'project_domain': 'service_domain'}])
+
+    def test_snapshot_roundtrip(self):
+        snapshot, _ = catalog.read_catalog(_v3_manager(), users=['nova'])
+        for fmt in ('json', 'yaml'):
+            text = catalog.dump_snapshot(snapshot, fmt)
+            self.assertEqual(catalog.load_snapshot(text), snapshot)
+            self.assertEqual(catalog.dump_snapshot(snapshot, fmt), text)
+
+    def test_load_snapshot_bad_version(self):
+        self.assertRaises(ValueError, catalog.load_snapshot, 'version: 99')
+        self.assertRaises(ValueError, catalog.load_snapshot, '[]')
+
+    def test_plan_import_up_to_date(self):
+        current, ids = catalog.read_catalog(_v3_manager(), users=['nova'])
+        self.assertEqual(catalog.plan_import(current, current, ids), [])
+
+    def test_plan_import(self):
+        current, ids = catalog.read_catalog(_v3_manager(), users=['nova'])
+        desired = {
+            'roles': [{'name': 'Admin'}, {'name': 'Member'}],
+            'endpoints': [
+                {'service': 'nova', 'type': 'compute', 'region': 'RegionOne',
+                 'interface': 'public', 'url': 'https://nova:8774'},
+                {'service': 'nova', 'type': 'compute', 'region': 'RegionOne',
+                 'interface': 'admin', 'url': 'http://nova:8774'}],
+            'users': [
+                {'name': 'glance', 'domain': 'service_domain',
+                 'roles': [{'role': 'Admin', 'project': 'services',
+                            'project_domain': 'service_domain'}]}],
+        }
+        plan = catalog.plan_import(desired, current, ids)
+        self.assertEqual([op for op, _ in plan],
+                         ['create-role', 'update-endpoint', 'create-endpoint',
+                          'create-user', 'grant-role'])
+        self.assertEqual(
+            catalog.describe(*plan[-1]),
+            'grant-role Admin to service_domain/glance on '
+            'service_domain/services')
+
+    def test_plan_import_v2_snapshot(self):
+        manager = _v3_manager()
+        manager.api.domains.list.return_value.append(
+            _resource(id='d0', name='default', description='',
+                      enabled=True))
+        manager.api.projects.create.return_value = _resource(id='p2')
+        manager.api.users.create.return_value = _resource(id='u3')
+        self.get_service_password.return_value = 'secret'
+        current, ids = catalog.read_catalog(manager, users=['glance'])
+        desired = {
+            'api-version': 2,
+            'projects': [{'name': 'admin', 'domain': None}],
+            'users': [
+                {'name': 'glance', 'domain': None,
+                 'roles': [{'role': 'Admin', 'project': 'admin',
+                            'project_domain': None}]}],
+        }
+        plan = catalog.plan_import(desired, current, ids)
+        self.assertEqual(
+            [catalog.describe(*op) for op in plan],
+            ['create-project default/admin', 'create-user default/glance',
+             'grant-role Admin to default/glance on default/admin'])
+        catalog.apply_import(manager, plan, ids)
+        manager.api.projects.create.assert_called_once_with(
+            'admin', 'd0', description=None, enabled=True)
+        manager.api.users.create.assert_called_once_with(
+            'glance', domain='d0', password='secret', email='juju@localhost')
+        manager.api.roles.grant.assert_called_once_with('r1', user='u3',
+                                                        project='p2')
+
+    def test_apply_import(self):
+        manager = _v3_manager()
+        current, ids = catalog.read_catalog(manager, users=['nova'])
+        manager.api.roles.create.return_value = _resource(id='r2')
+        manager.api.users.create.return_value = _resource(id='u3')
+        self.get_service_password.return_value = 'secret'
+        plan = [
+            ('create-role', {'name': 'Member'}),
+            ('update-endpoint',
+             {'service': 'nova', 'type': 'compute', 'region': 'RegionOne',
+              'interface': 'public', 'url': 'https://nova:8774'}),
+            ('create-user', {'name': 'glance', 'domain': 'service_domain'}),
+            ('grant-role', {'role': 'Member', 'project': 'services',
+                            'project_domain': 'service_domain',
+                            'user': 'glance',
+                            'user_domain': 'service_domain'}),
+        ]
+        self.assertEqual(catalog.apply_import(manager, plan, ids), 4)
+        manager.api.endpoints.update.assert_called_once_with(
+            'e1', url='https://nova:8774')
+        manager.api.users.create.assert_called_once_with(
+            'glance', domain='d1', password='secret', email='juju@localhost')
+        self.set_service_password.assert_called_once_with('secret',
+                                                          user='glance')
+        manager.api.roles.grant.assert_called_once_with('r2', user='u3',
+                                                        project='p1')
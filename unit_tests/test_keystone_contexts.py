@@ -361,3 +361,21 @@ class TestKeystoneContexts(CharmTestCase):
 
         self.maxDiff = None
         self.assertItemsEqual(ctxt(), {})
+
+    @patch('keystone_utils.tls_ticket_key_files')
+    @patch('os.path.exists')
+    def test_tls_frontend_context(self, exists, tls_ticket_key_files):
+        tls_ticket_key_files.return_value = ['/ssl/ticket.key',
+                                             '/ssl/ticket.key.previous']
+        exists.side_effect = lambda path: path == '/ssl/ticket.key'
+        self.config.side_effect = self.test_config.get
+        self.assertEqual(context.TLSFrontendContext()(), {
+            'tls_session_cache_size': 10,
+            'tls_session_cache_bytes': 10485760,
+            'tls_session_timeout': 300,
+            'tls_session_tickets': True,
+            'tls_session_ticket_keys': ['/ssl/ticket.key'],
+            'tls_ocsp_stapling': False,
+            'http2': False,
+            'keepalive_timeout': 15,
+            'keepalive_requests': 1000})
@@ -15,7 +15,7 @@
 import os
 import sys
 
-from mock import call, patch, MagicMock
+from mock import ANY, call, patch, MagicMock
 from test_utils import CharmTestCase
 
 # python-apt is not installed as part of test-requirements but is imported by
@@ -75,6 +75,7 @@ TO_PATCH = [
     'is_elected_leader',
     'get_hacluster_config',
     'is_clustered',
+    'clear_leadership_cache',
     'enable_memcache',
     # keystone_utils
     'restart_map',
@@ -87,12 +88,18 @@ TO_PATCH = [
     'add_service_to_keystone',
     'update_nrpe_config',
     'is_db_ready',
+    'replay_identity_relation_settings',
+    'ldap_pool_settings',
+    'identity_inputs_fingerprint',
     'create_or_show_domain',
     'get_api_version',
+    'update_tls_ticket_keys',
+    'reload_tls_frontend',
     # other
     'check_call',
     'execd_preinstall',
     # ip
+    'clear_network_cache',
     'get_iface_for_address',
     'get_netmask_for_address',
     'is_service_present',
@@ -113,6 +120,8 @@ class KeystoneRelationTests(CharmTestCase):
         self.config.side_effect = self.test_config.get
         self.ssh_user = 'juju_keystone'
         self.snap_install_requested.return_value = False
+        self.update_tls_ticket_keys.return_value = False
+        self.ldap_pool_settings.return_value = {'use_pool': True}
 
     @patch.object(utils, 'os_release')
     @patch.object(hooks, 'service_stop', lambda *args: None)
@@ -247,8 +256,9 @@ class KeystoneRelationTests(CharmTestCase):
 
         hooks.config_changed()
 
+        self.clear_network_cache.assert_called_once_with()
         self.save_script_rc.assert_called_with()
-        configure_https.assert_called_with()
+        configure_https.assert_called_with(plan=ANY)
         self.assertTrue(configs.write_all.called)
         self.open_port.assert_called_with(5000)
 
@@ -287,7 +297,7 @@ class KeystoneRelationTests(CharmTestCase):
 
         self.assertFalse(mock_cluster_joined.called)
         self.save_script_rc.assert_called_with()
-        configure_https.assert_called_with()
+        configure_https.assert_called_with(plan=ANY)
         self.assertTrue(configs.write_all.called)
 
         self.assertFalse(self.migrate_database.called)
@@ -333,7 +343,7 @@ class KeystoneRelationTests(CharmTestCase):
         self.assertTrue(self.do_openstack_upgrade_reexec.called)
 
         self.save_script_rc.assert_called_with()
-        configure_https.assert_called_with()
+        configure_https.assert_called_with(plan=ANY)
         self.assertTrue(configs.write_all.called)
 
         self.assertTrue(update.called)
@@ -410,6 +420,7 @@ class KeystoneRelationTests(CharmTestCase):
             relation_id='identity-service:0',
             remote_unit='unit/0')
         self.assertFalse(self.add_service_to_keystone.called)
+        self.replay_identity_relation_settings.assert_called_once_with()
         self.log.assert_called_with(
             'Deferring identity_changed() to service leader.')
 
@@ -448,6 +459,7 @@ class KeystoneRelationTests(CharmTestCase):
     def test_leader_elected(self, mock_write, mock_update):
         hooks.leader_elected()
         mock_write.assert_has_calls([call(utils.TOKEN_FLUSH_CRON_FILE)])
+        self.clear_leadership_cache.assert_called_once_with()
 
     @patch.object(hooks, 'update_all_identity_relation_units')
     @patch.object(hooks.CONFIGS, 'write')
@@ -458,6 +470,20 @@ class KeystoneRelationTests(CharmTestCase):
         mock_write.assert_has_calls([call(utils.TOKEN_FLUSH_CRON_FILE)])
         self.assertTrue(update.called)
 
+    @patch.object(hooks, 'CONFIGS')
+    def test_configure_tls_session_tickets_unchanged(self, configs):
+        hooks.configure_tls_session_tickets()
+        self.assertFalse(configs.write.called)
+        self.assertFalse(self.reload_tls_frontend.called)
+
+    @patch.object(hooks, 'CONFIGS')
+    def test_configure_tls_session_tickets_changed(self, configs):
+        self.update_tls_ticket_keys.return_value = True
+        configs.templates = {utils.APACHE_24_CONF: None}
+        hooks.configure_tls_session_tickets()
+        configs.write.assert_called_once_with(utils.APACHE_24_CONF)
+        self.reload_tls_frontend.assert_called_once_with()
+
     def test_ha_joined(self):
         self.get_hacluster_config.return_value = {
             'vip': '10.10.10.10',
@@ -648,7 +674,40 @@ class KeystoneRelationTests(CharmTestCase):
 
         hooks.ha_changed()
         self.assertTrue(configs.write_all.called)
-        self.assertTrue(update.called)
+        update.assert_called_once_with(force=True)
+
+    @patch.object(hooks, 'send_notifications')
+    @patch.object(hooks, 'is_db_initialised')
+    @patch.object(hooks, 'CONFIGS')
+    def test_identity_updates_deferred_until_clustered(
+            self, configs, is_db_initialised, send_notifications):
+        is_db_initialised.return_value = True
+        self.is_db_ready.return_value = True
+        self.is_elected_leader.return_value = True
+        self.expect_ha.return_value = True
+        self.is_clustered.return_value = False
+        self.relation_ids.side_effect = \
+            lambda rel: ['identity-service:0'] if rel == 'identity-service' \
+            else []
+        self.related_units.return_value = ['nova/0']
+        self.relation_get.return_value = {}
+        # With dns-ha the addresses do not change once clustered.
+        self.identity_inputs_fingerprint.return_value = 'abc'
+        kv = self.unitdata.kv.return_value
+        kv.get.return_value = None
+
+        hooks.update_all_identity_relation_units()
+        self.assertFalse(self.add_service_to_keystone.called)
+        self.assertFalse(kv.set.called)
+
+        self.is_clustered.return_value = True
+        self.relation_get.side_effect = \
+            lambda attribute=None, **kwargs: 'yes' if attribute else {}
+        hooks.ha_changed()
+        self.add_service_to_keystone.assert_called_once_with(
+            'identity-service:0', 'nova/0')
+        kv.set.assert_called_once_with(
+            'identity-relation-inputs-fingerprint', 'abc')
 
     @patch('keystone_utils.log')
     @patch.object(hooks, 'CONFIGS')
@@ -708,7 +767,7 @@ class KeystoneRelationTests(CharmTestCase):
         hooks.leader_init_db_if_ready()
         self.is_db_ready.assert_called_with(use_current_context=False)
         self.migrate_database.assert_called_with()
-        update.assert_called_with(check_db_ready=False)
+        update.assert_called_with(check_db_ready=False, force=True)
 
     @patch.object(hooks, 'update_all_identity_relation_units')
     def test_leader_init_db_not_leader(self, update):
@@ -779,6 +838,44 @@ class KeystoneRelationTests(CharmTestCase):
         admin_relation_changed.assert_called_with('identity-relation:0')
         self.log.assert_has_calls(log_calls, any_order=True)
 
+    @patch.object(hooks, 'identity_changed')
+    @patch.object(hooks, 'is_db_initialised')
+    def test_update_all_identity_relation_units_unchanged(self,
+                                                          is_db_initialized,
+                                                          identity_changed):
+        is_db_initialized.return_value = True
+        self.is_elected_leader.return_value = True
+        self.identity_inputs_fingerprint.return_value = 'abc'
+        self.unitdata.kv.return_value.get.return_value = 'abc'
+        self.relation_ids.return_value = ['identity-relation:0']
+        self.related_units.return_value = ['unit/0']
+        hooks.update_all_identity_relation_units(check_db_ready=False)
+        self.assertFalse(self.ensure_initial_admin.called)
+        self.assertFalse(identity_changed.called)
+        self.assertFalse(self.unitdata.kv.return_value.set.called)
+
+    @patch.object(hooks, 'admin_relation_changed')
+    @patch.object(hooks, 'identity_credentials_changed')
+    @patch.object(hooks, 'identity_changed')
+    @patch.object(hooks, 'is_db_initialised')
+    def test_update_all_identity_relation_units_force(
+            self, is_db_initialized, identity_changed,
+            identity_credentials_changed, admin_relation_changed):
+        is_db_initialized.return_value = True
+        self.is_elected_leader.return_value = True
+        self.identity_inputs_fingerprint.return_value = 'abc'
+        self.unitdata.kv.return_value.get.return_value = 'abc'
+        self.relation_ids.return_value = ['identity-relation:0']
+        self.related_units.return_value = ['unit/0']
+        hooks.update_all_identity_relation_units(check_db_ready=False,
+                                                 force=True)
+        self.assertTrue(self.ensure_initial_admin.called)
+        identity_changed.assert_called_with(
+            relation_id='identity-relation:0',
+            remote_unit='unit/0')
+        self.unitdata.kv.return_value.set.assert_called_once_with(
+            'identity-relation-inputs-fingerprint', 'abc')
+
     @patch.object(hooks, 'configure_https')
     @patch.object(hooks, 'CONFIGS')
     def test_update_all_db_not_ready(self, configs, configure_https):
@@ -855,6 +952,72 @@ class KeystoneRelationTests(CharmTestCase):
         self.assertTrue(self.get_api_version.called)
         self.assertFalse(self.relation_get.called)
 
+    def test_domain_backend_changed_publishes_ldap_pool(self):
+        self.get_api_version.return_value = 3
+        self.relation_get.return_value = None
+        self.ldap_pool_settings.return_value = {'use_pool': True,
+                                                'pool_size': 5}
+        hooks.domain_backend_changed(relation_id='domain-backend:1')
+        self.relation_set.assert_called_once_with(
+            relation_id='domain-backend:1',
+            relation_settings={
+                'ldap-pool': '{"pool_size": 5, "use_pool": true}'})
+
+    def test_domain_backend_changed_invalid_ldap_pool(self):
+        self.get_api_version.return_value = 3
+        self.relation_get.return_value = None
+        self.ldap_pool_settings.side_effect = ValueError('bad')
+        hooks.domain_backend_changed()
+        self.assertFalse(self.relation_set.called)
+        self.assertTrue(self.log.called)
+
+    @patch.object(hooks, 'reload_keystone')
+    @patch.object(hooks, 'is_db_initialised')
+    def test_update_all_domain_backends_single_reload(self,
+                                                      is_db_initialised,
+                                                      reload_keystone):
+        self.get_api_version.return_value = 3
+        self.is_leader.return_value = False
+        self.relation_ids.return_value = ['domain-backend:1',
+                                          'domain-backend:2']
+        self.related_units.return_value = ['keystone-ldap/0']
+        settings = {
+            'domain-backend:1': {'domain-name': 'dom1',
+                                 'restart-nonce': 'nonce1'},
+            'domain-backend:2': {'domain-name': 'dom2',
+                                 'restart-nonce': 'nonce2'},
+        }
+        self.relation_get.side_effect = \
+            lambda attribute, unit, rid: settings[rid][attribute]
+        mock_kv = MagicMock()
+        mock_kv.get.return_value = None
+        self.unitdata.kv.return_value = mock_kv
+
+        hooks.update_all_domain_backends()
+
+        reload_keystone.assert_called_once_with()
+        mock_kv.set.assert_has_calls([
+            call('domain-restart-nonce-dom1', 'nonce1'),
+            call('domain-restart-nonce-dom2', 'nonce2'),
+        ], any_order=True)
+        mock_kv.flush.assert_called_once_with()
+
+    @patch.object(hooks, 'reload_keystone')
+    def test_update_all_domain_backends_unchanged(self, reload_keystone):
+        self.get_api_version.return_value = 3
+        self.is_leader.return_value = False
+        self.relation_ids.return_value = ['domain-backend:1']
+        self.related_units.return_value = ['keystone-ldap/0']
+        self.relation_get.side_effect = ['dom1', 'nonce1']
+        mock_kv = MagicMock()
+        mock_kv.get.return_value = 'nonce1'
+        self.unitdata.kv.return_value = mock_kv
+
+        hooks.update_all_domain_backends()
+
+        self.assertFalse(reload_keystone.called)
+        self.assertFalse(mock_kv.set.called)
+
     def test_domain_backend_changed_incomplete(self):
         self.get_api_version.return_value = 3
         self.relation_get.return_value = None
@@ -870,9 +1033,9 @@ class KeystoneRelationTests(CharmTestCase):
     @patch.object(hooks, 'is_unit_paused_set')
     @patch.object(hooks, 'is_db_initialised')
     @patch.object(utils, 'run_in_apache')
-    @patch.object(utils, 'service_restart')
+    @patch.object(utils, 'service_reload')
     def test_domain_backend_changed_complete(self,
-                                             service_restart,
+                                             service_reload,
                                              run_in_apache,
                                              is_db_initialised,
                                              is_unit_paused_set):
@@ -899,7 +1062,7 @@ class KeystoneRelationTests(CharmTestCase):
                  rid=None),
         ])
         self.create_or_show_domain.assert_called_with('mydomain')
-        service_restart.assert_called_with('apache2')
+        service_reload.assert_called_with('apache2')
         mock_kv.set.assert_called_with('domain-restart-nonce-mydomain',
                                        'nonce2')
         self.assertTrue(mock_kv.flush.called)
@@ -907,9 +1070,9 @@ class KeystoneRelationTests(CharmTestCase):
     @patch.object(hooks, 'is_unit_paused_set')
     @patch.object(hooks, 'is_db_initialised')
     @patch.object(utils, 'run_in_apache')
-    @patch.object(utils, 'service_restart')
+    @patch.object(utils, 'service_reload')
     def test_domain_backend_changed_complete_follower(self,
-                                                      service_restart,
+                                                      service_reload,
                                                       run_in_apache,
                                                       is_db_initialised,
                                                       is_unit_paused_set):
@@ -937,7 +1100,7 @@ class KeystoneRelationTests(CharmTestCase):
         ])
         # Only lead unit will create the domain
         self.assertFalse(self.create_or_show_domain.called)
-        service_restart.assert_called_with('apache2')
+        service_reload.assert_called_with('apache2')
         mock_kv.set.assert_called_with('domain-restart-nonce-mydomain',
                                        'nonce2')
         self.assertTrue(mock_kv.flush.called)
@@ -1018,3 +1181,57 @@ class KeystoneRelationTests(CharmTestCase):
             'fid-restart-nonce-{}'.format(rel),
             'nonce2')
         self.assertTrue(mock_kv.flush.called)
+
+    @patch.object(hooks, 'update_all_domain_backends')
+    @patch.object(hooks, 'update_all_identity_relation_units')
+    @patch.object(hooks, 'configure_https')
+    @patch.object(hooks, 'certificates_digest')
+    @patch.object(hooks, 'process_certificates')
+    def test_certs_changed_unchanged(self, process_certificates,
+                                     certificates_digest, configure_https,
+                                     update_identity, update_domains):
+        process_certificates.return_value = False
+        certificates_digest.return_value = 'abc'
+        self.unitdata.kv.return_value.get.return_value = 'abc'
+        hooks.certs_changed('certificates:1', 'vault/0')
+        process_certificates.assert_called_once_with(
+            'keystone', 'certificates:1', 'vault/0')
+        self.assertFalse(configure_https.called)
+        self.assertFalse(update_identity.called)
+        self.assertFalse(self.reload_tls_frontend.called)
+
+    @patch.object(hooks, 'path_hash')
+    @patch.object(hooks, 'update_all_domain_backends')
+    @patch.object(hooks, 'update_all_identity_relation_units')
+    @patch.object(hooks, 'configure_https')
+    @patch.object(hooks, 'certificates_digest')
+    @patch.object(hooks, 'process_certificates')
+    def test_certs_changed_new_certs(self, process_certificates,
+                                     certificates_digest, configure_https,
+                                     update_identity, update_domains,
+                                     path_hash):
+        process_certificates.return_value = True
+        certificates_digest.return_value = 'abc'
+        path_hash.return_value = 'samehash'
+        self.unitdata.kv.return_value.get.return_value = 'abc'
+        hooks.certs_changed('certificates:1', 'vault/0')
+        self.assertTrue(configure_https.called)
+        self.reload_tls_frontend.assert_called_once_with()
+        self.assertTrue(update_identity.called)
+        self.assertTrue(update_domains.called)
+        self.unitdata.kv.return_value.set.assert_called_once_with(
+            utils.CERTIFICATES_APPLIED_KEY, 'abc')
+
+    @patch.object(hooks.nrpe, 'reload_pending')
+    @patch.object(hooks, 'assess_status')
+    @patch.object(hooks.hooks, 'execute')
+    def test_main_hook_scope_and_compaction(self, execute, assess_status,
+                                            reload_pending):
+        with patch.object(hooks.sys, 'argv', ['hooks/config-changed']):
+            hooks.main()
+        reload_pending.assert_called_once_with()
+        self.unitdata.kv.return_value.hook_scope.assert_called_once_with(
+            'config-changed')
+        execute.assert_called_once_with(['hooks/config-changed'])
+        self.unitdata.compact_history.assert_called_once_with()
+        assess_status.assert_called_once_with(hooks.CONFIGS)
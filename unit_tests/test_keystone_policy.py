@@ -0,0 +1,120 @@
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+from mock import MagicMock
+
+from test_utils import CharmTestCase
+
+import keystone_policy as policy
+
+TO_PATCH = [
+    'installed_version',
+    'log',
+    'os_release',
+    'snap_install_requested',
+    'subprocess',
+    'unitdata',
+]
+
+RULES = {
+    'admin_required': 'role:Admin',
+    'service_role': 'role:service',
+    'alias': 'rule:admin_required',
+    'service_or_admin': 'rule:alias or rule:service_role',
+    'unused': 'role:nobody',
+    'default': 'rule:admin_required',
+    'identity:get_service': 'rule:admin_required',
+    'identity:list_services': 'rule:service_or_admin',
+    'identity:get_region': '',
+}
+
+
+class TestKeystonePolicy(CharmTestCase):
+
+    def setUp(self):
+        super(TestKeystonePolicy, self).setUp(policy, TO_PATCH)
+        self.kv = MagicMock()
+        self.store = {}
+        self.kv.get.side_effect = self.store.get
+        self.kv.set.side_effect = self.store.__setitem__
+        self.unitdata.kv.return_value = self.kv
+        self.snap_install_requested.return_value = False
+        self.subprocess.CalledProcessError = Exception
+
+    def test_collapse_rules(self):
+        self.assertEqual(policy.collapse_rules(RULES), {
+            'service_or_admin': 'role:Admin or role:service',
+            'default': 'role:Admin',
+            'identity:get_service': 'role:Admin',
+            'identity:list_services': 'rule:service_or_admin',
+            'identity:get_region': '',
+        })
+
+    def test_collapse_rules_keep(self):
+        rules = policy.collapse_rules(RULES, keep=['admin_required'])
+        self.assertEqual(rules['admin_required'], 'role:Admin')
+        self.assertEqual(rules['identity:get_service'], 'role:Admin')
+
+    def test_policy_defaults_old_release(self):
+        self.os_release.return_value = 'ocata'
+        self.assertEqual(policy.policy_defaults(), None)
+        self.assertFalse(self.subprocess.check_output.called)
+
+    def test_policy_defaults_cached(self):
+        self.os_release.return_value = 'queens'
+        self.installed_version.return_value = '2:13.0.0-0ubuntu1'
+        self.subprocess.check_output.return_value = '{"default": "x"}'
+        self.assertEqual(policy.policy_defaults(), {'default': 'x'})
+        self.assertEqual(policy.policy_defaults(), {'default': 'x'})
+        self.subprocess.check_output.assert_called_once_with(
+            policy.POLICY_GENERATOR)
+
+    def test_generate_policy(self):
+        self.os_release.return_value = 'queens'
+        self.installed_version.return_value = '2:13.0.0-0ubuntu1'
+        self.subprocess.check_output.return_value = json.dumps({
+            'admin_required': 'role:admin',
+            'identity:get_region': '',
+        })
+        rules = json.loads(policy.generate_policy(json.dumps(RULES)))
+        self.assertNotIn('identity:get_region', rules)
+        self.assertEqual(rules['admin_required'], 'role:Admin')
+        self.assertEqual(rules['identity:get_service'], 'role:Admin')
+
+    def test_generate_policy_no_policy_in_code(self):
+        self.os_release.return_value = 'mitaka'
+        rules = json.loads(policy.generate_policy(json.dumps(RULES)))
+        self.assertEqual(rules, policy.collapse_rules(RULES))
+        self.assertFalse(self.subprocess.check_output.called)
+
+    def test_generate_policy_defaults_unavailable(self):
+        self.os_release.return_value = 'queens'
+        self.installed_version.return_value = '2:13.0.0-0ubuntu1'
+        self.subprocess.check_output.side_effect = OSError
+        rendered = json.dumps(RULES)
+        self.assertEqual(policy.generate_policy(rendered), rendered)
+
+    def test_generate_policy_snap(self):
+        self.os_release.return_value = 'queens'
+        self.snap_install_requested.return_value = True
+        rendered = json.dumps(RULES)
+        self.assertEqual(policy.generate_policy(rendered), rendered)
+        self.assertFalse(self.subprocess.check_output.called)
+
+    def test_generate_policy_stable(self):
+        self.os_release.return_value = 'mitaka'
+        first = policy.generate_policy(json.dumps(RULES))
+        self.assertEqual(policy.generate_policy(json.dumps(RULES)), first)
@@ -15,7 +15,9 @@
 from mock import patch, call, MagicMock
 from test_utils import CharmTestCase
 import os
+import shutil
 import subprocess
+import tempfile
 
 os.environ['JUJU_UNIT_NAME'] = 'keystone'
 with patch('charmhelpers.core.hookenv.config') as config, \
@@ -44,6 +46,7 @@ TO_PATCH = [
     'peer_store_and_set',
     'service_stop',
     'service_start',
+    'cancel_restart',
     'snap_install_requested',
     'relation_get',
     'relation_set',
@@ -264,6 +267,7 @@ class TestKeystoneUtils(CharmTestCase):
         self.peer_store_and_set.assert_called_with(relation_id=relation_id,
                                                    **relation_data)
 
+    @patch.object(utils, 'grant_roles')
     @patch.object(utils, 'leader_get')
     @patch.object(utils, 'get_api_version')
     @patch.object(utils, 'create_user')
@@ -274,7 +278,7 @@ class TestKeystoneUtils(CharmTestCase):
     def test_add_service_to_keystone_no_clustered_no_https_complete_values(
             self, KeystoneManager, add_endpoint, ensure_valid_service,
             _resolve_address, create_user, get_api_version, leader_get,
-            test_api_version=2):
+            grant_roles, test_api_version=2):
         get_api_version.return_value = test_api_version
         leader_get.return_value = None
         relation_id = 'identity-service:0'
@@ -323,13 +327,11 @@ class TestKeystoneUtils(CharmTestCase):
         create_user.assert_called_with('keystone', 'password',
                                        domain=service_domain,
                                        tenant='tenant')
-        self.grant_role.assert_called_with('keystone', service_role,
-                                           project_domain=service_domain,
-                                           tenant='tenant',
-                                           user_domain=service_domain)
-        self.create_role.assert_called_with('role1', user='keystone',
-                                            tenant='tenant',
-                                            domain=service_domain)
+        grant_roles.assert_called_with('keystone', [service_role, 'role1'],
+                                       project_domain=service_domain,
+                                       tenant='tenant',
+                                       user_domain=service_domain)
+        self.create_role.assert_called_with('role1')
 
         relation_data = {'admin_domain_id': None,
                          'auth_host': '10.0.0.3',
@@ -368,6 +370,7 @@ class TestKeystoneUtils(CharmTestCase):
             test_add_service_to_keystone_no_clustered_no_https_complete_values(
                 test_api_version=3)
 
+    @patch.object(utils, 'grant_roles')
     @patch.object(utils, 'leader_get')
     @patch('charmhelpers.contrib.openstack.ip.config')
     @patch.object(utils, 'ensure_valid_service')
@@ -375,7 +378,7 @@ class TestKeystoneUtils(CharmTestCase):
     @patch.object(utils, 'get_manager')
     def test_add_service_to_keystone_nosubset(
             self, KeystoneManager, add_endpoint, ensure_valid_service,
-            ip_config, leader_get):
+            ip_config, leader_get, grant_roles):
         relation_id = 'identity-service:0'
         remote_unit = 'unit/0'
 
@@ -443,12 +446,12 @@ class TestKeystoneUtils(CharmTestCase):
     @patch.object(utils, 'set_service_password')
     @patch.object(utils, 'get_service_password')
     @patch.object(utils, 'user_exists')
-    @patch.object(utils, 'grant_role')
+    @patch.object(utils, 'grant_roles')
     @patch.object(utils, 'create_role')
     @patch.object(utils, 'create_user')
     def test_create_user_credentials_no_roles(self, mock_create_user,
                                               mock_create_role,
-                                              mock_grant_role,
+                                              mock_grant_roles,
                                               mock_user_exists,
                                               get_callback, set_callback):
         mock_user_exists.return_value = False
@@ -461,16 +464,16 @@ class TestKeystoneUtils(CharmTestCase):
                                                 domain=None,
                                                 tenant='tenantA')])
         mock_create_role.assert_has_calls([])
-        mock_grant_role.assert_has_calls([])
+        mock_grant_roles.assert_has_calls([])
 
     @patch.object(utils, 'set_service_password')
     @patch.object(utils, 'get_service_password')
     @patch.object(utils, 'user_exists')
-    @patch.object(utils, 'grant_role')
+    @patch.object(utils, 'grant_roles')
     @patch.object(utils, 'create_role')
     @patch.object(utils, 'create_user')
     def test_create_user_credentials(self, mock_create_user, mock_create_role,
-                                     mock_grant_role, mock_user_exists,
+                                     mock_grant_roles, mock_user_exists,
                                      get_callback, set_callback):
         mock_user_exists.return_value = False
         get_callback.return_value = 'passA'
@@ -482,25 +485,23 @@ class TestKeystoneUtils(CharmTestCase):
         mock_create_user.assert_has_calls([call('userA', 'passA',
                                                 tenant='tenantA',
                                                 domain=None)])
-        mock_create_role.assert_has_calls([call('roleB', user='userA',
-                                                tenant='tenantA',
-                                                domain=None)])
-        mock_grant_role.assert_has_calls([call('userA', 'roleA',
-                                               tenant='tenantA',
-                                               user_domain=None,
-                                               project_domain=None)])
+        mock_create_role.assert_has_calls([call('roleB')])
+        mock_grant_roles.assert_called_once_with('userA', ['roleA', 'roleB'],
+                                                 tenant='tenantA',
+                                                 user_domain=None,
+                                                 project_domain=None)
 
     @patch.object(utils, 'is_password_changed', lambda x, y: True)
     @patch.object(utils, 'set_service_password')
     @patch.object(utils, 'get_service_password')
     @patch.object(utils, 'update_user_password')
     @patch.object(utils, 'user_exists')
-    @patch.object(utils, 'grant_role')
+    @patch.object(utils, 'grant_roles')
     @patch.object(utils, 'create_role')
     @patch.object(utils, 'create_user')
     def test_create_user_credentials_user_exists(self, mock_create_user,
                                                  mock_create_role,
-                                                 mock_grant_role,
+                                                 mock_grant_roles,
                                                  mock_user_exists,
                                                  mock_update_user_password,
                                                  get_callback, set_callback,
@@ -517,19 +518,71 @@ class TestKeystoneUtils(CharmTestCase):
                                       grants=['roleA'], new_roles=['roleB'],
                                       domain=domain)
         mock_create_user.assert_has_calls([])
-        mock_create_role.assert_has_calls([call('roleB', user='userA',
-                                                tenant='tenantA',
-                                                domain=domain)])
-        mock_grant_role.assert_has_calls([call('userA', 'roleA',
-                                               tenant='tenantA',
-                                               user_domain=domain,
-                                               project_domain=domain)])
+        mock_create_role.assert_has_calls([call('roleB')])
+        mock_grant_roles.assert_called_once_with('userA', ['roleA', 'roleB'],
+                                                 tenant='tenantA',
+                                                 user_domain=domain,
+                                                 project_domain=domain)
         mock_update_user_password.assert_has_calls([call('userA', 'passA',
                                                          domain)])
 
     def test_create_user_credentials_user_exists_v3(self):
         self.test_create_user_credentials_user_exists(test_api_version=3)
 
+    def _grant_roles_manager(self, api_version, assignments):
+        manager = MagicMock()
+        manager.api_version = api_version
+        admin, member = MagicMock(id='r1'), MagicMock(id='r2')
+        admin.name, member.name = 'Admin', 'Member'
+        manager.api.roles.list.return_value = [admin, member]
+        manager.resolve_user_id.return_value = 'u1'
+        manager.resolve_tenant_id.return_value = 'p1'
+        manager.resolve_domain_id.return_value = 'd1'
+        manager.role_assignments_for_user.return_value = assignments
+        return manager
+
+    @patch.object(utils, 'get_manager')
+    def test_grant_roles_missing_only(self, get_manager):
+        manager = self._grant_roles_manager(3, set([('r1', 'p1', None)]))
+        get_manager.return_value = manager
+        utils.grant_roles('nova', ['Admin', 'member'], tenant='services',
+                          user_domain='service_domain',
+                          project_domain='service_domain')
+        manager.resolve_tenant_id.assert_called_once_with(
+            'services', domain='service_domain')
+        manager.role_assignments_for_user.assert_called_once_with(
+            'u1', tenant_id='p1')
+        manager.add_user_role.assert_called_once_with(
+            user='u1', role='r2', tenant='p1', domain=None)
+
+    @patch.object(utils, 'get_manager')
+    def test_grant_roles_domain(self, get_manager):
+        manager = self._grant_roles_manager(3, set([('r1', 'p1', None)]))
+        get_manager.return_value = manager
+        utils.grant_roles('admin', ['Admin'], domain='admin_domain',
+                          user_domain='admin_domain')
+        self.assertFalse(manager.resolve_tenant_id.called)
+        manager.add_user_role.assert_called_once_with(
+            user='u1', role='r1', tenant=None, domain='d1')
+
+    @patch.object(utils, 'get_manager')
+    def test_grant_roles_present(self, get_manager):
+        manager = self._grant_roles_manager(
+            2, set([('r1', 'p1', None), ('r2', 'p1', None)]))
+        get_manager.return_value = manager
+        utils.grant_roles('nova', ['Admin', 'Member'], tenant='services')
+        self.assertFalse(manager.add_user_role.called)
+
+    @patch.object(utils, 'error_out')
+    @patch.object(utils, 'get_manager')
+    def test_grant_roles_unknown_role(self, get_manager, error_out):
+        manager = self._grant_roles_manager(3, set())
+        get_manager.return_value = manager
+        error_out.side_effect = SystemExit
+        self.assertRaises(SystemExit, utils.grant_roles, 'nova', ['Nope'],
+                          tenant='services')
+        self.assertFalse(manager.add_user_role.called)
+
     @patch.object(utils, 'get_manager')
     def test_create_user_case_sensitivity(self, KeystoneManager):
         """ Test case sensitivity of check for existence in
@@ -607,37 +660,74 @@ class TestKeystoneUtils(CharmTestCase):
             publicurl=publicurl, adminurl=adminurl,
             internalurl=internalurl)
 
-    @patch.object(utils, 'uuid')
-    @patch.object(utils, 'relation_set')
-    @patch.object(utils, 'relation_get')
-    @patch.object(utils, 'relation_ids')
+    @patch.object(utils, 'atexit')
     @patch.object(utils, 'is_elected_leader')
-    def test_send_notifications(self, mock_is_elected_leader,
-                                mock_relation_ids, mock_relation_get,
-                                mock_relation_set, mock_uuid):
-        relation_id = 'testrel:0'
-        mock_uuid.uuid4.return_value = '1234'
-        mock_relation_ids.return_value = [relation_id]
-        mock_is_elected_leader.return_value = False
-        utils.send_notifications({'foo-endpoint-changed': 1})
-        self.assertFalse(mock_relation_set.called)
+    def test_send_notifications(self, mock_is_elected_leader, mock_atexit):
+        broadcaster = utils.NotificationBroadcaster()
+        with patch.object(utils, 'NOTIFICATIONS', broadcaster):
+            mock_is_elected_leader.return_value = False
+            utils.send_notifications({'foo-endpoint-changed': 1})
+            self.assertEqual(broadcaster.pending, {})
+
+            mock_is_elected_leader.return_value = True
+            utils.send_notifications({})
+            self.assertEqual(broadcaster.pending, {})
+
+            utils.send_notifications({'foo-endpoint-changed': 1})
+            utils.send_notifications({'bar-endpoint-changed': 2},
+                                     force=True)
+        self.assertEqual(broadcaster.pending, {'foo-endpoint-changed': 1,
+                                               'bar-endpoint-changed': 2})
+        self.assertTrue(broadcaster.force)
+        mock_atexit.assert_called_once_with(broadcaster.flush)
 
-        mock_is_elected_leader.return_value = True
-        utils.send_notifications({})
-        self.assertFalse(mock_relation_set.called)
-
-        settings = {'foo-endpoint-changed': 1}
-        utils.send_notifications(settings)
-        self.assertTrue(mock_relation_set.called)
-        mock_relation_set.assert_called_once_with(relation_id=relation_id,
-                                                  relation_settings=settings)
-        mock_relation_set.reset_mock()
-        settings = {'foo-endpoint-changed': 1}
-        utils.send_notifications(settings, force=True)
-        self.assertTrue(mock_relation_set.called)
-        settings['trigger'] = '1234'
-        mock_relation_set.assert_called_once_with(relation_id=relation_id,
-                                                  relation_settings=settings)
+    @patch.object(utils, 'uuid')
+    @patch.object(utils.unitdata, 'kv')
+    def test_notification_broadcaster_flush(self, mock_kv, mock_uuid):
+        mock_uuid.uuid4.return_value = '1234'
+        self.relation_ids.return_value = ['testrel:0', 'testrel:1']
+        kv = MagicMock()
+        kv.get.return_value = {
+            'testrel:0': {'foo-endpoint-changed': 1},
+            'testrel:9': {'foo-endpoint-changed': 1},
+        }
+        mock_kv.return_value = kv
+        broadcaster = utils.NotificationBroadcaster()
+        with patch.object(utils, 'atexit'):
+            broadcaster.queue({'foo-endpoint-changed': 1})
+            broadcaster.queue({'bar-endpoint-changed': 2})
+        broadcaster.flush()
+        self.relation_set.assert_has_calls([
+            call(relation_id='testrel:0',
+                 relation_settings={'bar-endpoint-changed': 2}),
+            call(relation_id='testrel:1',
+                 relation_settings={'foo-endpoint-changed': 1,
+                                    'bar-endpoint-changed': 2}),
+        ])
+        self.assertFalse(self.relation_get.called)
+        published = {'foo-endpoint-changed': 1, 'bar-endpoint-changed': 2}
+        kv.set.assert_called_once_with(
+            utils.NOTIFICATIONS_KEY,
+            {'testrel:0': published, 'testrel:1': published})
+        self.assertEqual(broadcaster.pending, {})
+
+        # Nothing changed, nothing sent unless forced.
+        self.relation_set.reset_mock()
+        kv.get.return_value = kv.set.call_args[0][1]
+        with patch.object(utils, 'atexit'):
+            broadcaster.queue({'foo-endpoint-changed': 1})
+        broadcaster.flush()
+        self.assertFalse(self.relation_set.called)
+
+        with patch.object(utils, 'atexit'):
+            broadcaster.queue({'foo-endpoint-changed': 1}, force=True)
+        broadcaster.flush()
+        self.relation_set.assert_has_calls([
+            call(relation_id='testrel:0',
+                 relation_settings={'trigger': '1234'}),
+            call(relation_id='testrel:1',
+                 relation_settings={'trigger': '1234'}),
+        ])
 
     @patch.object(utils, 'is_elected_leader')
     @patch.object(utils, 'peer_retrieve')
@@ -802,13 +892,17 @@ class TestKeystoneUtils(CharmTestCase):
             {'int': ['test 1'], 'opt': ['test 2']},
             charm_func=check_optional_relations, services='s1', ports='p1')
 
-    def test_pause_unit_helper(self):
+    @patch.object(utils, 'MaintenanceWindow')
+    def test_pause_unit_helper(self, window):
+        window.return_value.results = {}
         with patch.object(utils, '_pause_resume_helper') as prh:
             utils.pause_unit_helper('random-config')
             prh.assert_called_once_with(utils.pause_unit, 'random-config')
+            window.return_value.drain.assert_called_once_with()
         with patch.object(utils, '_pause_resume_helper') as prh:
             utils.resume_unit_helper('random-config')
             prh.assert_called_once_with(utils.resume_unit, 'random-config')
+            window.return_value.restore.assert_called_once_with()
 
     @patch.object(utils, 'services')
     @patch.object(utils, 'determine_ports')
@@ -820,7 +914,50 @@ class TestKeystoneUtils(CharmTestCase):
             asf.return_value = 'assessor'
             utils._pause_resume_helper(f, 'some-config')
             asf.assert_called_once_with('some-config')
-            f.assert_called_once_with('assessor', services='s1', ports='p1')
+            f.assert_called_once_with('assessor', services='s1', ports='p1',
+                                      tiers=utils.SERVICE_TIERS)
+
+    @patch.object(utils, 'local_unit')
+    @patch.object(utils, 'haproxy_admin')
+    def test_local_haproxy_servers(self, haproxy_admin, local_unit):
+        local_unit.return_value = 'keystone/0'
+        haproxy_admin.return_value = (
+            '# pxname,svname,qcur,qmax,scur,smax\n'
+            'keystone_public,FRONTEND,,,3,10\n'
+            'keystone_public,keystone-0,0,0,2,5\n'
+            'keystone_public,keystone-1,0,0,1,5\n'
+            'keystone_admin,keystone-0,0,0,0,5\n')
+        self.assertEqual(utils.local_haproxy_servers(),
+                         {'keystone_public/keystone-0': 2,
+                          'keystone_admin/keystone-0': 0})
+
+    @patch.object(utils, 'haproxy_admin')
+    def test_local_haproxy_servers_no_socket(self, haproxy_admin):
+        haproxy_admin.return_value = None
+        self.assertEqual(utils.local_haproxy_servers(), {})
+
+    @patch.object(utils, 'wait_for_ports')
+    @patch.object(utils, 'set_local_haproxy_state')
+    @patch.object(utils, 'local_haproxy_servers')
+    @patch.object(utils.unitdata, 'kv')
+    @patch.object(utils, 'time')
+    def test_maintenance_window(self, _time, kv, servers, set_state,
+                                wait_for_ports):
+        _time.time.side_effect = [100, 100, 101, 110]
+        servers.side_effect = [{'px/sv': 1}, {'px/sv': 0}]
+        store = {}
+        kv.return_value.set.side_effect = store.__setitem__
+        kv.return_value.get.side_effect = store.get
+        window = utils.MaintenanceWindow()
+        window.drain()
+        set_state.assert_has_calls([call('drain'), call('maint')])
+        window.restore(ports=[5000])
+        wait_for_ports.assert_called_once_with([5000])
+        set_state.assert_called_with('ready')
+        self.assertEqual(window.results, {'local-drain-seconds': 1,
+                                          'local-unavailable-seconds': 10})
+        kv.return_value.unset.assert_called_once_with(
+            utils.MAINTENANCE_STARTED_KEY)
 
     @patch.object(utils, 'run_in_apache')
     @patch.object(utils, 'restart_pid_check')
@@ -834,11 +971,66 @@ class TestKeystoneUtils(CharmTestCase):
         run_in_apache.return_value = False
         self.assertEqual(utils.restart_function_map(), {})
 
+    @patch.object(utils, 'get_api_version')
+    @patch.object(utils, 'benchmark_endpoints')
+    @patch.object(utils, 'benchmark_credentials')
+    @patch.object(utils, 'write_file')
+    @patch.object(utils, 'grp')
+    def test_write_latency_check_config(self, grp, write_file,
+                                        benchmark_credentials,
+                                        benchmark_endpoints,
+                                        get_api_version):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        plugins_dir = os.path.join(tmpdir, 'nagios', 'plugins')
+        plugin = os.path.join(plugins_dir, 'check_keystone_latency')
+        benchmark_credentials.return_value = {'username': 'admin'}
+        benchmark_endpoints.return_value = []
+        get_api_version.return_value = 3
+        with patch.object(utils, 'NAGIOS_PLUGINS', plugins_dir), \
+                patch.object(utils, 'LATENCY_CHECK_PLUGIN', plugin):
+            self.assertTrue(utils.write_latency_check_config())
+        self.assertTrue(os.access(plugin, os.X_OK))
+        with open(plugin) as f:
+            self.assertEqual(f.readline(), '#!/usr/bin/python\n')
+
+    @patch.object(utils, 'is_unit_paused_set')
+    @patch.object(utils, 'service_restart')
+    @patch.object(utils, 'service_reload')
+    @patch.object(utils, 'run_in_apache')
+    def test_reload_keystone(self, run_in_apache, service_reload,
+                             service_restart, is_unit_paused_set):
+        is_unit_paused_set.return_value = False
+        run_in_apache.return_value = True
+        utils.reload_keystone()
+        service_reload.assert_called_once_with('apache2')
+        self.assertFalse(service_restart.called)
+
+        service_reload.reset_mock()
+        run_in_apache.return_value = False
+        utils.reload_keystone()
+        service_restart.assert_called_once_with('keystone')
+        self.assertFalse(service_reload.called)
+
+        service_restart.reset_mock()
+        self.snap_install_requested.return_value = True
+        utils.reload_keystone()
+        service_reload.assert_called_once_with('snap.keystone.uwsgi',
+                                               restart_on_failure=True)
+        self.assertFalse(service_restart.called)
+
+        service_reload.reset_mock()
+        is_unit_paused_set.return_value = True
+        utils.reload_keystone()
+        self.assertFalse(service_restart.called)
+        self.assertFalse(service_reload.called)
+
     def test_restart_pid_check(self):
         self.subprocess.call.return_value = 1
         utils.restart_pid_check('apache2')
         self.service_stop.assert_called_once_with('apache2')
         self.service_start.assert_called_once_with('apache2')
+        self.cancel_restart.assert_called_once_with('apache2')
         self.subprocess.call.assert_called_once_with(['pgrep', 'apache2'])
 
     def test_restart_pid_check_ptable_string(self):
@@ -1124,3 +1316,238 @@ class TestKeystoneUtils(CharmTestCase):
         self.get_os_codename_install_source.return_value = 'queens'
         with self.assertRaises(ValueError):
             utils.get_api_version()
+
+    def test_group_peer_settings_by_relation(self):
+        peer_settings = {
+            'identity-service:1_service_password': 'pw1',
+            'identity-service:12_service_password': 'pw12',
+            'identity-service:12_auth_host': '10.0.0.1',
+            'admin_passwd': 'secret',
+        }
+        self.assertEqual(
+            utils.group_peer_settings_by_relation(
+                peer_settings, ['identity-service:1', 'identity-service:12',
+                                'identity-service:3']),
+            {'identity-service:1': {'service_password': 'pw1'},
+             'identity-service:12': {'service_password': 'pw12',
+                                     'auth_host': '10.0.0.1'},
+             'identity-service:3': {}})
+
+    @patch.object(utils, 'unitdata')
+    @patch.object(utils, 'peer_retrieve')
+    def test_replay_identity_relation_settings(self, peer_retrieve,
+                                               unitdata):
+        self.relation_ids.return_value = ['identity-service:1',
+                                          'identity-service:2']
+        peer_retrieve.return_value = {
+            'identity-service:1_service_password': 'pw1',
+            'identity-service:1_auth_host': '10.0.0.2',
+            'identity-service:1_ssl_cert': '__null__',
+            'identity-service:2_service_password': 'pw2',
+        }
+        published = {
+            'identity-service-published-identity-service:1': {
+                'service_password': 'pw1',
+                'auth_host': '10.0.0.1',
+                'ssl_cert': None,
+            },
+            'identity-service-published-identity-service:2': {
+                'service_password': 'pw2',
+            },
+        }
+        unitdata.kv.return_value.get.side_effect = published.get
+        utils.replay_identity_relation_settings()
+        peer_retrieve.assert_called_once_with('-')
+        self.relation_set.assert_called_once_with(
+            relation_id='identity-service:1', auth_host='10.0.0.2')
+        unitdata.kv.return_value.set.assert_called_once_with(
+            'identity-service-published-identity-service:1',
+            {'service_password': 'pw1', 'auth_host': '10.0.0.2',
+             'ssl_cert': None})
+
+    @patch.object(utils, 'peer_retrieve')
+    @patch.object(utils, 'leader_get')
+    @patch.object(utils, 'is_clustered')
+    @patch.object(utils, 'expect_ha')
+    @patch.object(utils, 'is_elected_leader')
+    @patch.object(utils, 'is_db_initialised')
+    @patch.object(utils, 'get_api_version')
+    @patch.object(utils, 'get_protocol')
+    @patch.object(utils, 'resolve_address')
+    def test_identity_inputs_fingerprint_peer_settings(self, *args):
+        peer_retrieve = args[-1]
+        self.relation_ids.return_value = []
+        self.config.return_value = {}
+        peer_retrieve.return_value = {
+            'identity-service:4_service_password': 'pass',
+            'keystone-keystone_passwd': 'secret'}
+        first = utils.identity_inputs_fingerprint()
+        peer_retrieve.return_value['keystone-keystone_passwd'] = 'other'
+        self.assertEqual(utils.identity_inputs_fingerprint(), first)
+        peer_retrieve.return_value[
+            'identity-service:4_service_password'] = 'new'
+        self.assertNotEqual(utils.identity_inputs_fingerprint(), first)
+        peer_retrieve.side_effect = ValueError
+        self.assertEqual(
+            utils.identity_relation_inputs()['peer_identity_settings'], {})
+
+    @patch.object(utils, 'unitdata')
+    @patch.object(utils, 'peer_retrieve')
+    def test_replay_identity_relation_settings_no_password(self,
+                                                           peer_retrieve,
+                                                           unitdata):
+        self.relation_ids.return_value = ['identity-service:1']
+        peer_retrieve.return_value = {
+            'identity-service:1_auth_host': '10.0.0.2',
+        }
+        unitdata.kv.return_value.get.return_value = None
+        utils.replay_identity_relation_settings()
+        self.assertFalse(self.relation_set.called)
+
+    @patch.object(utils.context, 'WorkerConfigContext')
+    def test_ldap_pool_settings_sized_by_workers(self, worker_context):
+        worker_context.return_value.return_value = {'workers': 8}
+        settings = utils.ldap_pool_settings()
+        self.assertEqual(settings, {
+            'use_pool': True,
+            'use_auth_pool': True,
+            'pool_size': 10,
+            'pool_retry_max': 3,
+            'pool_connection_timeout': 5,
+            'pool_connection_lifetime': 600,
+            'auth_pool_size': 12,
+            'auth_pool_connection_lifetime': 60,
+            'page_size': 500,
+        })
+        worker_context.return_value.return_value = {'workers': 64}
+        settings = utils.ldap_pool_settings()
+        self.assertEqual(settings['pool_size'], 2)
+        self.assertEqual(settings['auth_pool_size'], 2)
+
+    @patch.object(utils.context, 'WorkerConfigContext')
+    def test_ldap_pool_settings_explicit(self, worker_context):
+        worker_context.return_value.return_value = {'workers': 4}
+        self.test_config.set('ldap-pool-size', 30)
+        self.test_config.set('ldap-use-auth-pool', False)
+        self.test_config.set('ldap-page-size', 0)
+        settings = utils.ldap_pool_settings()
+        self.assertEqual(settings['pool_size'], 30)
+        self.assertFalse(settings['use_auth_pool'])
+        self.assertNotIn('auth_pool_size', settings)
+        self.assertEqual(settings['page_size'], 0)
+
+    @patch.object(utils.context, 'WorkerConfigContext')
+    def test_ldap_pool_settings_no_pool(self, worker_context):
+        worker_context.return_value.return_value = {'workers': 4}
+        self.test_config.set('ldap-use-pool', False)
+        self.assertEqual(utils.ldap_pool_settings(), {
+            'use_pool': False,
+            'use_auth_pool': False,
+            'page_size': 500,
+        })
+
+    @patch.object(utils.context, 'WorkerConfigContext')
+    def test_ldap_pool_settings_invalid(self, worker_context):
+        worker_context.return_value.return_value = {'workers': 4}
+        self.test_config.set('ldap-pool-retry-max', -1)
+        self.assertRaises(ValueError, utils.ldap_pool_settings)
+
+    @patch.object(utils, 'ldap_pool_settings')
+    def test_check_optional_relations_invalid_ldap_pool(self,
+                                                        ldap_pool_settings):
+        self.relation_ids.return_value = []
+        self.test_config.set('identity-backend', 'ldap')
+        ldap_pool_settings.side_effect = ValueError(
+            'ldap-pool-size must be an integer >= 1')
+        self.assertEqual(utils.check_optional_relations(None),
+                         ('blocked', 'ldap-pool-size must be an integer >= 1'))
+        self.test_config.set('identity-backend', 'sql')
+        self.assertEqual(utils.check_optional_relations(None),
+                         ('unknown', ''))
+
+    def test_render_plan_write_all_once(self):
+        configs = MagicMock()
+        configs.templates = {'/etc/a.conf': None, '/etc/b.conf': None}
+        plan = utils.RenderPlan(configs)
+        plan.add_all()
+        plan.flush()
+        plan.add_all()
+        plan.finish()
+        configs.write_all.assert_called_once_with()
+        self.assertFalse(configs.write.called)
+        self.assertEqual(plan.renders, 2)
+        self.assertEqual(plan.saved, 2)
+
+    def test_render_plan_barrier(self):
+        configs = MagicMock()
+        configs.templates = {'/etc/a.conf': None, '/etc/b.conf': None}
+        plan = utils.RenderPlan(configs)
+        plan.add('/etc/a.conf')
+        plan.flush()
+        plan.add_all()
+        plan.add_all()
+        plan.finish()
+        self.assertFalse(configs.write_all.called)
+        configs.write.assert_has_calls([call('/etc/a.conf'),
+                                        call('/etc/b.conf')])
+        self.assertEqual(configs.write.call_count, 2)
+        self.assertEqual(plan.saved, 3)
+
+    def test_render_plan_invalidate(self):
+        configs = MagicMock()
+        configs.templates = {'/etc/a.conf': None}
+        plan = utils.RenderPlan(configs)
+        plan.add('/etc/a.conf')
+        plan.flush()
+        plan.invalidate('/etc/a.conf')
+        plan.add('/etc/a.conf')
+        plan.flush()
+        self.assertEqual(configs.write.call_count, 2)
+
+    @patch.object(utils, 'leader_set')
+    @patch.object(utils, 'leader_get')
+    @patch.object(utils, 'is_elected_leader')
+    def test_rotate_tls_ticket_keys_expired(self, is_elected_leader,
+                                            leader_get, leader_set):
+        is_elected_leader.return_value = True
+        leader_get.return_value = {
+            utils.TLS_TICKET_KEY: 'oldkey',
+            utils.TLS_TICKET_KEY_TIMESTAMP: '1000'}
+        self.assertTrue(utils.rotate_tls_ticket_keys(now=1000 + 25 * 3600))
+        settings = leader_set.call_args[0][0]
+        self.assertEqual(settings[utils.TLS_TICKET_KEY_PREVIOUS], 'oldkey')
+        self.assertEqual(settings[utils.TLS_TICKET_KEY_TIMESTAMP], '91000')
+        self.assertEqual(
+            len(utils.base64.b64decode(settings[utils.TLS_TICKET_KEY])), 48)
+
+    @patch.object(utils, 'leader_set')
+    @patch.object(utils, 'leader_get')
+    @patch.object(utils, 'is_elected_leader')
+    def test_rotate_tls_ticket_keys_current(self, is_elected_leader,
+                                            leader_get, leader_set):
+        is_elected_leader.return_value = True
+        leader_get.return_value = {
+            utils.TLS_TICKET_KEY: 'key',
+            utils.TLS_TICKET_KEY_TIMESTAMP: '1000'}
+        self.assertFalse(utils.rotate_tls_ticket_keys(now=2000))
+        self.assertFalse(leader_set.called)
+
+    @patch.object(utils, 'leader_set')
+    @patch.object(utils, 'is_elected_leader')
+    def test_rotate_tls_ticket_keys_not_leader(self, is_elected_leader,
+                                               leader_set):
+        is_elected_leader.return_value = False
+        self.assertFalse(utils.rotate_tls_ticket_keys(now=2000))
+        self.assertFalse(leader_set.called)
+
+    @patch.object(utils, 'write_file')
+    @patch.object(utils, 'leader_get')
+    @patch('os.path.exists')
+    def test_write_tls_ticket_keys(self, exists, leader_get, write_file):
+        exists.return_value = False
+        leader_get.return_value = {
+            utils.TLS_TICKET_KEY: utils.base64.b64encode('k' * 48)}
+        self.assertTrue(utils.write_tls_ticket_keys())
+        write_file.assert_called_once_with(
+            os.path.join(utils.TLS_TICKET_KEY_DIR, 'ticket.key'),
+            'k' * 48, perms=0o600)
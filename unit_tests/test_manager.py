@@ -0,0 +1,71 @@
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+
+from mock import MagicMock, patch
+
+from test_utils import CharmTestCase
+
+# python-keystoneclient is not installed as part of test-requirements so
+# import manager against fake modules, which are dropped again afterwards.
+_keystoneclient = MagicMock()
+with patch.dict(sys.modules, {
+        'keystoneclient': _keystoneclient,
+        'keystoneclient.auth': _keystoneclient.auth,
+        'keystoneclient.v2_0': _keystoneclient.v2_0,
+        'keystoneclient.v3': _keystoneclient.v3}):
+    import manager
+
+TO_PATCH = []
+
+
+def _assignment(role_id, **scope):
+    return MagicMock(role={'id': role_id}, scope=scope)
+
+
+class TestRoleAssignmentsForUser(CharmTestCase):
+
+    def setUp(self):
+        super(TestRoleAssignmentsForUser, self).setUp(manager, TO_PATCH)
+
+    def test_role_assignments_for_user_v2(self):
+        m = manager.KeystoneManager2('http://localhost:35357/v2.0/', 'token')
+        m.api = MagicMock()
+        m.api.roles.roles_for_user.return_value = [
+            MagicMock(id='admin-id'), MagicMock(id='member-id')]
+        self.assertEqual(m.role_assignments_for_user('user-id', 'tenant-id'),
+                         set([('admin-id', 'tenant-id', None),
+                              ('member-id', 'tenant-id', None)]))
+        m.api.roles.roles_for_user.assert_called_once_with('user-id',
+                                                           'tenant-id')
+
+    def test_role_assignments_for_user_v3(self):
+        m = manager.KeystoneManager3('http://localhost:35357/v3/', 'token')
+        m.api = MagicMock()
+        m.api.role_assignments.list.return_value = [
+            _assignment('admin-id', project={'id': 'project-id'}),
+            _assignment('admin-id', domain={'id': 'domain-id'}),
+            _assignment('member-id', project={'id': 'other-id'}),
+            _assignment('reader-id', project={'id': 'project-id'},
+                        **{'OS-INHERIT:inherited_to': 'projects'}),
+            _assignment('reader-id', domain={'id': 'domain-id'},
+                        **{'OS-INHERIT:inherited_to': 'projects'}),
+            _assignment('system-id', system={'all': True}),
+        ]
+        self.assertEqual(m.role_assignments_for_user('user-id'),
+                         set([('admin-id', 'project-id', None),
+                              ('admin-id', None, 'domain-id'),
+                              ('member-id', 'other-id', None)]))
+        m.api.role_assignments.list.assert_called_once_with(user='user-id')